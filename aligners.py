@@ -0,0 +1,224 @@
+"""
+Word aligners for text_splice.
+
+Every aligner returns what the Gentle server returns, {"words": [...]}. Each word is a
+dict with "case", "word", "start" and "end" (seconds), which is the structure
+merge_short_words consumes. Aligners take a batch of (wav_path, transcript) pairs:
+
+    aligner = get_aligner("ctc")
+    results = aligner.align_batch([(wav_path, transcript), ...])
+
+- gentle: the Gentle HTTP server (localhost:8765), the requests of a batch are sent
+  concurrently so the server's own workers are used.
+- energy: no model at all. Voiced regions come from frame energy and the transcript
+  words are spread over the voiced time in proportion to their length. Crude, but it
+  needs nothing beyond numpy.
+- ctc: in-process forced alignment with torchaudio's MMS_FA wav2vec2 model on CPU,
+  a whole batch in one forward pass. If the batched pass fails, the clips are run one by
+  one. Clips the model can't run or align fall back to energy.
+"""
+
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from fast_audio import load as load_wav
+
+GENTLE_URL = "http://localhost:8765/transcriptions?async=false"
+SAMPLE_RATE = 16000
+
+
+def split_words(transcript):
+    """Transcript tokens without surrounding punctuation, like Gentle's "word"."""
+    words = []
+    for token in transcript.split():
+        word = re.sub(r"^[^\w']+|[^\w']+$", "", token)
+        if word:
+            words.append(word)
+    return words
+
+
+class GentleAligner:
+    def __init__(self, url=GENTLE_URL, concurrency=4):
+        self.url = url
+        self.concurrency = concurrency
+
+    def align(self, audio_path, transcript):
+        import requests
+
+        with open(audio_path, "rb") as audio_file:
+            files = {"audio": audio_file}
+            data = {"transcript": transcript}
+            response = requests.post(self.url, files=files, data=data)
+            return response.json()
+
+    def align_batch(self, items):
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            return list(pool.map(lambda item: self.align(*item), items))
+
+
+class EnergyAligner:
+    def __init__(
+        self, frame_ms=25, hop_ms=10, threshold_db=35, min_gap_ms=150, min_voiced_ms=50
+    ):
+        self.frame = int(SAMPLE_RATE * frame_ms / 1000)
+        self.hop = int(SAMPLE_RATE * hop_ms / 1000)
+        self.threshold_db = threshold_db
+        self.min_gap = min_gap_ms / hop_ms
+        self.min_voiced = min_voiced_ms / hop_ms
+
+    def voiced_regions(self, y):
+        """(start, end) frame ranges whose energy is within threshold_db of the peak."""
+        if len(y) < self.frame:
+            return []
+        n_frames = 1 + (len(y) - self.frame) // self.hop
+        idx = np.arange(self.frame)[None, :] + self.hop * np.arange(n_frames)[:, None]
+        rms = np.sqrt(np.mean(y[idx] ** 2, axis=1) + 1e-12)
+        db = 20 * np.log10(rms)
+        voiced = db > db.max() - self.threshold_db
+
+        regions = []
+        edges = np.flatnonzero(np.diff(np.concatenate([[0], voiced.astype(int), [0]])))
+        for start, end in zip(edges[::2], edges[1::2]):
+            if regions and start - regions[-1][1] < self.min_gap:
+                regions[-1] = (regions[-1][0], end)
+            else:
+                regions.append((start, end))
+        return [(s, e) for s, e in regions if e - s >= self.min_voiced]
+
+    def align_samples(self, y, transcript):
+        words = split_words(transcript)
+        regions = self.voiced_regions(y)
+        if not words or not regions:
+            return {"words": [{"case": "not-found-in-audio", "word": w} for w in words]}
+
+        # Voiced time as one timeline, mapped back to clip time
+        hop_s = self.hop / SAMPLE_RATE
+        starts = np.array([s for s, _ in regions]) * hop_s
+        lengths = np.array([e - s for s, e in regions]) * hop_s
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+
+        def to_clip_time(t):
+            i = min(np.searchsorted(offsets, t, side="right") - 1, len(regions) - 1)
+            return float(starts[i] + t - offsets[i])
+
+        weights = np.array([len(w) + 1 for w in words], dtype=float)
+        bounds = np.concatenate([[0], np.cumsum(weights)]) / weights.sum() * offsets[-1]
+        return {
+            "words": [
+                {
+                    "case": "success",
+                    "word": word,
+                    "start": to_clip_time(bounds[i]),
+                    "end": to_clip_time(bounds[i + 1] - 1e-6),
+                }
+                for i, word in enumerate(words)
+            ]
+        }
+
+    def align(self, audio_path, transcript):
+        y, _ = load_wav(audio_path, sr=SAMPLE_RATE)
+        return self.align_samples(y, transcript)
+
+    def align_batch(self, items):
+        return [self.align(path, transcript) for path, transcript in items]
+
+
+class CtcAligner:
+    def __init__(self, num_threads=None):
+        import torch
+        import torchaudio
+
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        self.torch = torch
+        bundle = torchaudio.pipelines.MMS_FA
+        self.model = bundle.get_model(with_star=False)
+        self.model.eval()
+        self.tokenizer = bundle.get_tokenizer()
+        self.aligner = bundle.get_aligner()
+        self.vocabulary = set(bundle.get_dict(star=None))
+        self.fallback = EnergyAligner()
+
+    def _normalize(self, word):
+        return "".join(c for c in word.lower() if c in self.vocabulary)
+
+    def _align_emission(self, emission, num_samples, transcript):
+        words = split_words(transcript)
+        normalized = [self._normalize(w) for w in words]
+        known = [i for i, n in enumerate(normalized) if n]
+        result = [{"case": "not-found-in-audio", "word": w} for w in words]
+        if not known:
+            return {"words": result}
+
+        spans = self.aligner(emission, self.tokenizer([normalized[i] for i in known]))
+        seconds_per_frame = num_samples / emission.size(0) / SAMPLE_RATE
+        for i, word_spans in zip(known, spans):
+            result[i] = {
+                "case": "success",
+                "word": words[i],
+                "start": word_spans[0].start * seconds_per_frame,
+                "end": word_spans[-1].end * seconds_per_frame,
+            }
+        return {"words": result}
+
+    def align(self, audio_path, transcript):
+        return self.align_batch([(audio_path, transcript)])[0]
+
+    def _emissions(self, waveforms):
+        """Per-clip emissions of one padded forward pass."""
+        torch = self.torch
+        lengths = torch.tensor([len(w) for w in waveforms])
+        batch = torch.nn.utils.rnn.pad_sequence(waveforms, batch_first=True)
+        with torch.inference_mode():
+            emissions, emission_lengths = self.model(batch, lengths)
+        return [emissions[i, : emission_lengths[i]] for i in range(len(waveforms))]
+
+    def align_batch(self, items):
+        waveforms = [
+            self.torch.from_numpy(load_wav(path, sr=SAMPLE_RATE)[0])
+            for path, _ in items
+        ]
+        try:
+            emissions = self._emissions(waveforms)
+        except (RuntimeError, ValueError) as e:
+            # e.g. out of memory for a batch of long clips, retry clip by clip so
+            # only a clip that fails on its own loses the model alignment
+            print(f"⚠️ CTC forward failed for the batch ({e}), retrying clip by clip")
+            emissions = []
+            for (path, _), waveform in zip(items, waveforms):
+                try:
+                    emissions.extend(self._emissions([waveform]))
+                except (RuntimeError, ValueError) as e:
+                    print(f"⚠️ CTC forward failed for {path} ({e}), using energy")
+                    emissions.append(None)
+
+        results = []
+        for i, (path, transcript) in enumerate(items):
+            emission = emissions[i]
+            if emission is None:
+                results.append(
+                    self.fallback.align_samples(waveforms[i].numpy(), transcript)
+                )
+                continue
+            try:
+                results.append(
+                    self._align_emission(emission, len(waveforms[i]), transcript)
+                )
+            except (RuntimeError, ValueError) as e:
+                # e.g. more tokens than frames, or characters the model doesn't know
+                print(f"⚠️ CTC alignment failed for {path} ({e}), using energy")
+                results.append(
+                    self.fallback.align_samples(waveforms[i].numpy(), transcript)
+                )
+        return results
+
+
+ALIGNERS = {"gentle": GentleAligner, "energy": EnergyAligner, "ctc": CtcAligner}
+
+
+def get_aligner(name="gentle", **kwargs):
+    if name not in ALIGNERS:
+        raise ValueError(f"Unknown aligner {name}, use one of {list(ALIGNERS)}")
+    return ALIGNERS[name](**kwargs)
@@ -1,11 +1,18 @@
+import functools
 import os
 import numpy as np
 import librosa
 import soundfile as sf
 from pathlib import Path
 
+from create_spectograms import compute_mel_db, render_spectrogram
+from fast_audio import load as load_wav
+from segment_store import SegmentStore, count_segments, list_accents
+from instrumentation import enable, stage, print_summary
+
 sampling_rate = 16000
 INPUT_DIR = "data/dataset/processed"
+SPECTROGRAM_DIR = "data/dataset/spectrograms"
 DESIRED_SET_COUNT = 1600  # total across train+test
 
 
@@ -31,6 +38,8 @@ def apply_augmentations(audio, sr):
 
 
 def get_audio_files(directory):
+    if not os.path.isdir(directory):
+        return []
     return [f for f in os.listdir(directory) if f.endswith(".wav")]
 
 
@@ -41,34 +50,131 @@ def augment_recursive(accent_dir, initial_count, desired_count):
     round_input = base_path
 
     while current_total < desired_count:
-        round_output = base_path / f"__augmented_{round_idx}"
-        round_output.mkdir(exist_ok=True)
-
         files = get_audio_files(round_input)
         if not files:
             print(f"No files to augment in {round_input}, stopping.")
             break
 
+        round_output = base_path / f"__augmented_{round_idx}"
+        round_output.mkdir(exist_ok=True)
+
         for file in files:
             if current_total >= desired_count:
                 break
 
             file_path = round_input / file
-            audio, sr = librosa.load(file_path, sr=sampling_rate)
-            augmented_versions = apply_augmentations(audio, sr)
+            with stage("load"):
+                audio, sr = load_wav(file_path, sr=sampling_rate)
+            with stage("augment", items=3):
+                augmented_versions = apply_augmentations(audio, sr)
 
             for aug_type, aug_audio in augmented_versions:
                 if current_total >= desired_count:
                     break
                 new_filename = f"{file[:-4]}_{aug_type}.wav"
-                sf.write(round_output / new_filename, aug_audio, sr)
+                with stage("write"):
+                    sf.write(round_output / new_filename, aug_audio, sr)
                 current_total += 1
 
         round_idx += 1
         round_input = round_output
 
 
-def get_accent_counts(input_root):
+def _load_file(path):
+    return load_wav(path, sr=sampling_rate)[0]
+
+
+def first_round_sources(accent_dir, store=None):
+    """
+    (name, load) pairs of the WAVs in accent_dir and, with `store` (a SegmentStore),
+    of its segments, named `{source}_{segment}.wav`.
+    """
+    sources = [
+        (file, functools.partial(_load_file, os.path.join(accent_dir, file)))
+        for file in get_audio_files(accent_dir)
+    ]
+    if store is not None:
+        sources += [
+            (
+                f"{entry['source']}_{entry['name']}.wav",
+                functools.partial(store.read, entry),
+            )
+            for entry in store.entries
+        ]
+    return sources
+
+
+def augment_fused(
+    accent_dir, accent, image_dir, initial_count, desired_count, store=None
+):
+    """
+    Same rounds as augment_recursive, but every augmented waveform goes straight to
+    the mel spectrogram and only the PNG is written, with the name create_spectograms
+    would give the WAV (`{accent}___augmented_{round}_{file}_{aug}.png`). No WAVs and no
+    __augmented_N folders; the waveforms of one round stay in memory as input of the
+    next one. With `store` the first round also augments the accent's text_splice
+    segments.
+    """
+    os.makedirs(image_dir, exist_ok=True)
+    current_total = initial_count
+    round_idx = 1
+    round_input = first_round_sources(accent_dir, store)  # (name, load) pairs
+
+    while current_total < desired_count:
+        if not round_input:
+            print(f"No files to augment in {accent_dir} (round {round_idx}), stopping.")
+            break
+
+        round_output = []
+        for file, audio in round_input:
+            if current_total >= desired_count:
+                break
+
+            if round_idx == 1:
+                with stage("load"):
+                    audio = audio()
+            sr = sampling_rate
+            with stage("augment", items=3):
+                augmented_versions = apply_augmentations(audio, sr)
+
+            for aug_type, aug_audio in augmented_versions:
+                if current_total >= desired_count:
+                    break
+                new_filename = f"{file[:-4]}_{aug_type}.wav"
+                round_output.append((new_filename, aug_audio.astype(np.float32)))
+                image_path = os.path.join(
+                    image_dir,
+                    f"{accent}___augmented_{round_idx}_{new_filename[:-4]}.png",
+                )
+                if os.path.exists(image_path):
+                    continue  # rendered by an earlier run, already counted
+                if len(aug_audio) < 512:
+                    print(f"⚠️ Skipping short audio: {image_path}")
+                    continue
+                with stage("melspectrogram"):
+                    mel_db = compute_mel_db(aug_audio, sr)
+                with stage("render"):
+                    render_spectrogram(mel_db, sr, image_path)
+                current_total += 1
+
+        round_idx += 1
+        round_input = round_output
+
+
+def count_fused_images(image_dir, accent):
+    if not os.path.exists(image_dir):
+        return 0
+    prefix = f"{accent}___augmented_"
+    return sum(
+        1 for f in os.listdir(image_dir) if f.startswith(prefix) and f.endswith(".png")
+    )
+
+
+def get_accent_counts(input_root, store_root=None):
+    """
+    Clips per accent across train and test. With `store_root` the segments in
+    store_root/<split>/<accent>.pcm stores are counted from their indexes as well.
+    """
     counts = dict()
     accents = set(os.listdir(os.path.join(input_root, "train"))) | set(
         os.listdir(os.path.join(input_root, "test"))
@@ -85,11 +191,46 @@ def get_accent_counts(input_root):
                 total_count += len([f for f in files if f.endswith(".wav")])
 
         counts[accent] = total_count
+
+    if store_root is not None:
+        for split in ["train", "test"]:
+            split_store = os.path.join(store_root, split)
+            for accent in list_accents(split_store):
+                counts[accent] = counts.get(accent, 0) + count_segments(
+                    split_store, accent
+                )
     return counts
 
 
 if __name__ == "__main__":
-    accent_counts = get_accent_counts(INPUT_DIR)
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--fused",
+        action="store_true",
+        help="Render augmented clips straight to spectrograms, no augmented WAVs",
+    )
+    parser.add_argument(
+        "--segment_store",
+        type=str,
+        default=None,
+        help="Also count and augment segments in text_splice stores "
+        "(<root>/<split>/<accent>.pcm), needs --fused",
+    )
+    args = parser.parse_args()
+    if args.segment_store and not args.fused:
+        # augment_recursive writes WAVs next to WAV inputs, it can't read a store
+        parser.error("--segment_store needs --fused")
+    enable()
+
+    accent_counts = get_accent_counts(INPUT_DIR, args.segment_store)
+    if args.fused:
+        for accent in accent_counts:
+            for subset in ["train", "test"]:
+                accent_counts[accent] += count_fused_images(
+                    os.path.join(SPECTROGRAM_DIR, subset), accent
+                )
 
     for accent, count in accent_counts.items():
         if count >= DESIRED_SET_COUNT:
@@ -103,10 +244,23 @@ if __name__ == "__main__":
 
         for subset, target in [("train", target_train), ("test", target_test)]:
             subset_path = os.path.join(INPUT_DIR, subset, accent)
-            if not os.path.exists(subset_path):
-                os.makedirs(subset_path)
             current = 0
             for _, _, files in os.walk(subset_path):
                 current += len([f for f in files if f.endswith(".wav")])
-            if current < target:
+            if args.fused:
+                store = None
+                if args.segment_store:
+                    split_store = os.path.join(args.segment_store, subset)
+                    if accent in list_accents(split_store):
+                        store = SegmentStore(split_store, accent)
+                        current += len(store)
+                image_dir = os.path.join(SPECTROGRAM_DIR, subset)
+                current += count_fused_images(image_dir, accent)
+                if current < target:
+                    augment_fused(
+                        subset_path, accent, image_dir, current, target, store
+                    )
+            elif current < target:
                 augment_recursive(subset_path, current, target)
+
+    print_summary()
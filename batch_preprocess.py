@@ -1,18 +1,124 @@
 from audio_utils import *
+from fast_audio import denoise_wav
+from instrumentation import enable, stage, print_summary
+from splits import assign_split, content_key, load_client_ids
+import csv
+import glob
 import os
 import random
 
+# Everything preprocess_audio does to a clip (audio_utils defaults), part of the store
+# key so changed parameters never reuse stale outputs. Bump version when the code
+# changes in a way these values don't capture.
+PREPROCESS_PARAMS = {
+    "version": 1,
+    "sr": 16000,
+    "channels": 1,
+    "sample_fmt": "s16",
+    "target_dBFS": -20.0,
+    "denoise_prop_decrease": 0.4,
+    "silence_thresh": -60,
+    "min_silence_len": 100,
+    "steps": ["convert_to_wav", "normalize_audio", "denoise_wav", "trim_silence"],
+}
+
 
 def preprocess_audio(path, output_path):
     from audio_utils import convert_to_wav, normalize_audio, add_padding
 
-    convert_to_wav(path, output_path)
-    normalize_audio(output_path)
-    denoise_wav(output_path)
-    trim_silence(output_path)
+    with stage("ffmpeg"):
+        convert_to_wav(path, output_path)
+    with stage("normalize"):
+        normalize_audio(output_path)
+    with stage("denoise"):
+        denoise_wav(output_path)
+    with stage("trim"):
+        trim_silence(output_path)
     return output_path
 
 
+def _accent_client_ids(accent_path, speakers):
+    client_ids = dict(speakers)
+    for tsv in glob.glob(os.path.join(accent_path, "*.tsv")):
+        client_ids.update(load_client_ids(tsv))
+    return client_ids
+
+
+def _accent_sources(accent_path):
+    """
+    Clips of an accent folder: the mp3s in it plus clips its TSVs reference by absolute
+    path (pick_audio --materialize virtual), as (filename, path) pairs.
+    """
+    sources = {
+        f: os.path.join(accent_path, f)
+        for f in os.listdir(accent_path)
+        if f.endswith(".mp3")
+    }
+    for tsv in glob.glob(os.path.join(accent_path, "*.tsv")):
+        with open(tsv, "r", encoding="utf-8") as f:
+            for line in f:
+                path = line.split("\t", 1)[0]
+                if os.path.isabs(path) and path.endswith(".mp3"):
+                    sources.setdefault(os.path.basename(path), path)
+    return sorted(sources.items())
+
+
+def batch_process_flat(INPUT_DIR, OUTPUT_DIR, speakers_tsv=None, test_ratio=0.2):
+    """
+    Processes every clip into one flat, content-addressed store
+    (OUTPUT_DIR/store/<sha1 of the source and PREPROCESS_PARAMS>.wav) and writes
+    OUTPUT_DIR/manifest.csv with the label, client_id and a speaker-disjoint split
+    for every clip.
+    Clips already in the store are not processed again, and changing the split
+    ratio only rewrites the manifest (see splits.resplit).
+    """
+    speakers = load_client_ids(speakers_tsv) if speakers_tsv else {}
+    store_dir = os.path.join(OUTPUT_DIR, "store")
+    os.makedirs(store_dir, exist_ok=True)
+
+    rows = []
+    for accent in sorted(os.listdir(INPUT_DIR)):
+        accent_path = os.path.join(INPUT_DIR, accent)
+        if not os.path.isdir(accent_path):
+            continue
+        client_ids = _accent_client_ids(accent_path, speakers)
+
+        for file, input_path in _accent_sources(accent_path):
+            client_id = client_ids.get(file)
+            if client_id is None:
+                print(f"⚠️ No client_id for {file}, splitting by filename")
+                client_id = f"file:{file}"
+
+            key = content_key(input_path, PREPROCESS_PARAMS)
+            output_path = os.path.join(store_dir, key + ".wav")
+            if not os.path.exists(output_path):
+                try:
+                    preprocess_audio(input_path, output_path)
+                except Exception as e:
+                    print(f"❌ Failed to process {input_path}: {e}")
+                    continue
+
+            rows.append(
+                {
+                    "audio_path": output_path,
+                    "label": accent,
+                    "client_id": client_id,
+                    "source": file,
+                    "split": assign_split(client_id, test_ratio),
+                }
+            )
+
+    manifest_path = os.path.join(OUTPUT_DIR, "manifest.csv")
+    with open(manifest_path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(
+            f, fieldnames=["audio_path", "label", "client_id", "source", "split"]
+        )
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"✅ Manifest with {len(rows)} clips saved to {manifest_path}")
+    return manifest_path
+
+
 def batch_process_audio(INPUT_DIR=None, OUTPUT_DIR=None):
     if INPUT_DIR is None:
         raise ValueError("INPUT_DIR must be specified")
@@ -24,7 +130,7 @@ def batch_process_audio(INPUT_DIR=None, OUTPUT_DIR=None):
         if not os.path.isdir(accent_path):
             continue
 
-        all_files = sorted([f for f in os.listdir(accent_path) if f.endswith(".mp3")])
+        all_files = _accent_sources(accent_path)
         random.shuffle(all_files)
 
         split_idx = int(0.8 * len(all_files))
@@ -32,8 +138,7 @@ def batch_process_audio(INPUT_DIR=None, OUTPUT_DIR=None):
         test_files = all_files[split_idx:]
 
         for subset, files in zip(["train", "test"], [train_files, test_files]):
-            for file in files:
-                input_path = os.path.join(accent_path, file)
+            for file, input_path in files:
                 out_dir = os.path.join(OUTPUT_DIR, subset, accent)
                 os.makedirs(out_dir, exist_ok=True)
                 base = os.path.splitext(file)[0]
@@ -61,5 +166,27 @@ if __name__ == "__main__":
         default="data/dataset/processed",
         help="Output folder where the processed audio files will be stored",
     )
+    parser.add_argument(
+        "--flat",
+        action="store_true",
+        help="Write a content-addressed store + manifest with speaker-disjoint splits",
+    )
+    parser.add_argument(
+        "--speakers_tsv",
+        type=str,
+        default=None,
+        help="validated.tsv to look up client_ids of clips (flat mode)",
+    )
+    parser.add_argument(
+        "--test_ratio",
+        type=float,
+        default=0.2,
+        help="Fraction of speakers in the test split (flat mode)",
+    )
     args = parser.parse_args()
-    batch_process_audio(args.in_dir, args.out_dir)
+    enable()
+    if args.flat:
+        batch_process_flat(args.in_dir, args.out_dir, args.speakers_tsv, args.test_ratio)
+    else:
+        batch_process_audio(args.in_dir, args.out_dir)
+    print_summary()
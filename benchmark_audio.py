@@ -0,0 +1,284 @@
+"""
+Benchmarks for the audio preprocessing and spectrogram hot paths.
+
+Runs on synthetic speech-like audio (harmonics with a moving pitch, syllable-rate
+envelope, background noise and silent padding, 44.1 kHz stereo like the Common Voice
+mp3s) so no dataset download is needed. Every function is benchmarked in its own fresh
+process, which makes the peak RSS numbers comparable between functions.
+
+    python benchmark_audio.py --duration 5 --repeats 20 --save_baseline bench_baseline.json
+    python benchmark_audio.py --duration 5 --repeats 20 --baseline bench_baseline.json
+
+With --baseline, any function whose median latency got slower than the tolerance is
+reported as a regression and the script exits with status 1.
+"""
+
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+SOURCE_SR = 44100
+
+
+def synth_speech(duration, sr=SOURCE_SR, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(duration * sr)) / sr
+    f0 = 120 + 30 * np.sin(2 * np.pi * 0.5 * t)
+    phase = 2 * np.pi * np.cumsum(f0) / sr
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 8))
+    envelope = np.clip(np.sin(2 * np.pi * 4 * t), 0, None)
+    audio = 0.3 * voiced * envelope + 0.01 * rng.standard_normal(len(t))
+    pad = np.zeros(int(0.3 * sr))
+    audio = np.concatenate([pad, audio, pad]).astype(np.float32)
+    return np.stack([audio, audio], axis=1)
+
+
+def _copy_clip(ctx):
+    shutil.copy(ctx["wav"], ctx["work"])
+
+
+def _load_model(ctx):
+    if "model" not in ctx:
+        from test_model import load_model, load_processor, predict, waveform_to_image
+
+        ctx["predict"] = predict
+        ctx["model"] = load_model(ctx["model_path"])
+        ctx["processor"] = load_processor(ctx["model_path"])
+        ctx["image"] = waveform_to_image(ctx["y"], ctx["sr"])
+
+
+def _case(name):
+    """Returns (setup, run) for a benchmark case, setup is not timed."""
+    from audio_augment import add_noise, change_pitch, change_speed
+    from audio_utils import (
+        add_padding,
+        convert_to_wav,
+        denoise_wav,
+        normalize_audio,
+        trim_silence,
+    )
+    from create_spectograms import compute_mel_db, render_spectrogram
+    import fast_audio
+    import librosa
+
+    def nothing(ctx):
+        pass
+
+    cases = {
+        "convert_to_wav": (nothing, lambda c: convert_to_wav(c["src"], c["work"])),
+        "normalize_audio": (_copy_clip, lambda c: normalize_audio(c["work"])),
+        "denoise_wav": (_copy_clip, lambda c: denoise_wav(c["work"])),
+        "denoise_wav_fast": (_copy_clip, lambda c: fast_audio.denoise_wav(c["work"])),
+        "load_librosa": (nothing, lambda c: librosa.load(c["wav"], sr=16000)),
+        "load_fast": (nothing, lambda c: fast_audio.load(c["wav"], sr=16000)),
+        "trim_silence": (_copy_clip, lambda c: trim_silence(c["work"])),
+        "add_padding": (_copy_clip, lambda c: add_padding(c["work"])),
+        "melspectrogram": (nothing, lambda c: compute_mel_db(c["y"], c["sr"])),
+        "render": (
+            nothing,
+            lambda c: render_spectrogram(c["mel_db"], c["sr"], c["png"]),
+        ),
+        "add_noise": (nothing, lambda c: add_noise(c["y"])),
+        "change_pitch": (nothing, lambda c: change_pitch(c["y"], c["sr"])),
+        "change_speed": (nothing, lambda c: change_speed(c["y"])),
+        "predict": (
+            _load_model,
+            lambda c: c["predict"](c["model"], c["processor"], c["image"]),
+        ),
+    }
+    return cases[name]
+
+
+CASES = [
+    "convert_to_wav",
+    "normalize_audio",
+    "denoise_wav",
+    "denoise_wav_fast",
+    "trim_silence",
+    "add_padding",
+    "load_librosa",
+    "load_fast",
+    "melspectrogram",
+    "render",
+    "add_noise",
+    "change_pitch",
+    "change_speed",
+    "predict",
+]
+
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _run_case(name, duration, repeats, warmup, model_path):
+    import librosa
+    import soundfile as sf
+
+    from audio_utils import convert_to_wav
+    from create_spectograms import compute_mel_db
+    from instrumentation import disable
+
+    # No stage records (JSONL writes) inside the timed region
+    disable()
+    workdir = tempfile.mkdtemp(prefix="bench_")
+    try:
+        ctx = {
+            "src": os.path.join(workdir, "source.wav"),
+            "wav": os.path.join(workdir, "clip.wav"),
+            "work": os.path.join(workdir, "work.wav"),
+            "png": os.path.join(workdir, "spectrogram.png"),
+            "model_path": model_path,
+        }
+        sf.write(ctx["src"], synth_speech(duration), SOURCE_SR)
+        convert_to_wav(ctx["src"], ctx["wav"])
+        ctx["y"], ctx["sr"] = librosa.load(ctx["wav"], sr=16000)
+        ctx["mel_db"] = compute_mel_db(ctx["y"], ctx["sr"])
+
+        setup, run = _case(name)
+        setup(ctx)
+        rss_before = _peak_rss_mb()
+
+        latencies = []
+        for i in range(warmup + repeats):
+            setup(ctx)
+            start = time.perf_counter()
+            run(ctx)
+            if i >= warmup:
+                latencies.append(time.perf_counter() - start)
+
+        latencies = np.array(latencies) * 1000
+        peak = _peak_rss_mb()
+        return {
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "p95_ms": float(np.percentile(latencies, 95)),
+            "mean_ms": float(latencies.mean()),
+            "std_ms": float(latencies.std()),
+            "clips_per_s": float(1000 / latencies.mean()),
+            "peak_rss_mb": peak,
+            "rss_growth_mb": peak - rss_before,
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def run_benchmarks(cases, duration=5.0, repeats=20, warmup=2, model_path=None):
+    ctx = multiprocessing.get_context("spawn")
+    results = {}
+    for name in cases:
+        if name == "predict" and model_path is None:
+            continue
+        with ctx.Pool(1) as pool:
+            results[name] = pool.apply(
+                _run_case, (name, duration, repeats, warmup, model_path)
+            )
+        r = results[name]
+        print(
+            f"{name:<16} p50 {r['p50_ms']:9.2f} ms  p95 {r['p95_ms']:9.2f} ms  "
+            f"{r['clips_per_s']:8.2f} clips/s  peak RSS {r['peak_rss_mb']:7.1f} MB"
+        )
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Returns the names of functions whose median latency regressed."""
+    regressions = []
+    print(f"\n📉 Comparison against baseline (tolerance {tolerance:.0%}):")
+    for name, r in results.items():
+        if name not in baseline:
+            print(f"  {name:<16} no baseline")
+            continue
+        ratio = r["p50_ms"] / baseline[name]["p50_ms"]
+        flag = ""
+        if ratio > 1 + tolerance:
+            flag = "⚠️ REGRESSION"
+            regressions.append(name)
+        elif ratio < 1 - tolerance:
+            flag = "✅ faster"
+        print(f"  {name:<16} {ratio:6.2f}x {flag}")
+    return regressions
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--duration",
+        type=float,
+        default=5.0,
+        help="Length of the synthetic clip in seconds",
+    )
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument(
+        "--only",
+        nargs="+",
+        choices=CASES,
+        default=CASES,
+        help="Benchmark only these functions",
+    )
+    parser.add_argument(
+        "--model",
+        type=str,
+        default=None,
+        help="Model for the predict benchmark (skipped when not given)",
+    )
+    parser.add_argument(
+        "--baseline",
+        type=str,
+        default=None,
+        help="Baseline JSON to compare against",
+    )
+    parser.add_argument(
+        "--save_baseline",
+        type=str,
+        default=None,
+        help="Save the results as a baseline JSON",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.15,
+        help="Allowed relative slowdown of the median before flagging a regression",
+    )
+    args = parser.parse_args()
+
+    results = run_benchmarks(
+        args.only, args.duration, args.repeats, args.warmup, args.model
+    )
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "params": {
+                        "duration": args.duration,
+                        "repeats": args.repeats,
+                        "machine": platform.node(),
+                        "cpu_count": os.cpu_count(),
+                    },
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+        print(f"✅ Baseline saved to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline["params"]["duration"] != args.duration:
+            print("⚠️ Baseline was recorded with a different clip duration")
+        if compare(results, baseline["results"], args.tolerance):
+            sys.exit(1)
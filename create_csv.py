@@ -1,12 +1,129 @@
 import os
 import pandas as pd
-from collections import defaultdict
-import random
+import numpy as np
+
+from instrumentation import enable, stage, print_summary
+from splits import assign_split
 
 spectrogram_dir = "data/dataset/spectrograms"
+MANIFEST_PATH = "spectrogram_manifest.parquet"
+CSV_PATH = "spectrogram_dataset.csv"
+
+
+def scan_images(root):
+    """
+    Lists the .png files of root/train and root/test. create_spectograms writes the
+    images flat into the split folders, so that is one os.scandir per split.
+    """
+    images = []
+    for split in ["train", "test"]:
+        split_dir = os.path.join(root, split)
+        if not os.path.isdir(split_dir):
+            continue
+        with os.scandir(split_dir) as it:
+            images.extend(
+                entry.path
+                for entry in it
+                if entry.name.endswith(".png") and entry.is_file()
+            )
+    return images
+
+
+def save_manifest(df, output=MANIFEST_PATH):
+    """Parquet needs pyarrow (see setup.sh), without it the manifest isn't cached."""
+    try:
+        df.to_parquet(output, index=False)
+    except ImportError as e:
+        print(f"⚠️ Not saving {output}: {e}")
+
+
+def build_manifest(root=spectrogram_dir, output=MANIFEST_PATH):
+    """
+    Builds the spectrogram manifest (image_path, label, split) and stores it as
+    Parquet with categorical label/split columns. Split comes from the folder below
+    root, the label from the filename prefix.
+    """
+    with stage("scan") as s:
+        paths = pd.Series(scan_images(root), dtype="string")
+        s.items = len(paths)
+
+    with stage("manifest", items=len(paths)):
+        rel = paths.str.slice(len(os.path.join(root, "")))
+        split = rel.str.split(os.sep, n=1).str[0].str.lower()
+        label = rel.str.rsplit(os.sep, n=1).str[-1].str.split("_", n=1).str[0].str.lower()
+        df = pd.DataFrame({"image_path": paths, "label": label, "split": split})
+        df = df[df["split"].isin(["train", "test"])].reset_index(drop=True)
+        df["label"] = df["label"].astype("category")
+        df["split"] = df["split"].astype("category")
+        if output is not None:
+            save_manifest(df, output)
+    return df
+
+
+def load_manifest(path=MANIFEST_PATH):
+    return pd.read_parquet(path)
+
+
+def class_counts(df):
+    return df.groupby(["split", "label"], observed=True).size()
+
+
+def balanced_view(df, tolerance=0.1, seed=None):
+    """
+    Balances every split to within ±tolerance of its smallest class: classes below
+    (1 - tolerance) * min are dropped, larger ones are randomly sampled down to
+    (1 + tolerance) * min. Vectorized, one shuffle and one group-by.
+    """
+    counts = class_counts(df)
+    min_count = counts.groupby(level="split", observed=True).transform("min")
+    min_allowed = (min_count * (1 - tolerance)).astype(int)
+    max_allowed = (min_count * (1 + tolerance)).astype(int)
+
+    for split, lo in min_allowed.groupby(level="split", observed=True).first().items():
+        hi = max_allowed.groupby(level="split", observed=True).first()[split]
+        print(f"\n📉 Balancing {split.upper()} to [{lo}, {hi}]")
+
+    for (split, label), count in counts[counts < min_allowed].items():
+        print(
+            f"⚠️ Skipping {split}/{label}: only {count} samples "
+            f"(< {min_allowed[(split, label)]})"
+        )
+
+    shuffled = df.sample(frac=1, random_state=seed)
+    keys = pd.MultiIndex.from_arrays([shuffled["split"], shuffled["label"]])
+    rank = shuffled.groupby(["split", "label"], observed=True).cumcount().to_numpy()
+    cap = np.where(
+        counts.reindex(keys).to_numpy() < min_allowed.reindex(keys).to_numpy(),
+        0,
+        max_allowed.reindex(keys).to_numpy(),
+    )
+    return shuffled[rank < cap].reset_index(drop=True)
+
+
+def manifest_with_splits(manifest_path, test_ratio=0.2):
+    """
+    Loads a spectrogram manifest written by create_spectrograms_from_manifest and
+    assigns speaker-disjoint splits from the client_id hash, so the split ratio can
+    change without touching any files.
+    """
+    df = pd.read_csv(manifest_path, dtype={"client_id": "string"})
+    speakers = df["client_id"].drop_duplicates()
+    speaker_split = pd.Series(
+        [assign_split(c, test_ratio) for c in speakers], index=speakers.to_numpy()
+    )
+    df["split"] = df["client_id"].map(speaker_split).astype("category")
+    df["label"] = df["label"].astype("category")
+    return df
+
+
+def _print_counts(counts):
+    for split in counts.index.get_level_values("split").unique():
+        print(f"\n🔹 {split.upper()}:")
+        for label, count in counts[split].items():
+            print(f"  - {label}: {count} samples")
 
 
-def create_csv():
+def create_csv(manifest=None, test_ratio=0.2):
     """
     Creates a balanced CSV file from spectrograms by:
     - Automatically detecting all accent classes from filenames
@@ -14,70 +131,54 @@ def create_csv():
     - Balancing all classes (per split) to within ±10% of the smallest class
     - Writing the result to a CSV with 'split' column
     - Printing original and final counts
-    """
-    data_by_split_and_label = defaultdict(lambda: defaultdict(list))
 
-    # Step 1: Walk through spectrogram_dir and group by split and label
-    for root, _, files in os.walk(spectrogram_dir):
-        for fname in files:
-            if not fname.endswith(".png"):
-                continue
-
-            # Determine split from folder name
-            rel_path = os.path.relpath(root, spectrogram_dir)
-            split = rel_path.split(os.sep)[0].lower()
-            if split not in {"train", "test"}:
-                continue
-
-            label = fname.split("_")[0].lower()
-            image_path = os.path.join(root, fname)
-            data_by_split_and_label[split][label].append((image_path, label, split))
+    The full, unbalanced manifest is also kept in spectrogram_manifest.parquet.
+    With `manifest` (flat store layout) the split comes from the speaker hash
+    instead of the folder, using `test_ratio`.
+    """
+    # Step 1: Scan spectrogram_dir into a manifest
+    if manifest is not None:
+        df = manifest_with_splits(manifest, test_ratio)
+        save_manifest(df, MANIFEST_PATH)
+    else:
+        df = build_manifest(spectrogram_dir, MANIFEST_PATH)
 
     # Step 2: Show original distribution
     print("📊 Original class counts by split:")
-    for split in data_by_split_and_label:
-        print(f"\n🔹 {split.upper()}:")
-        for label, samples in data_by_split_and_label[split].items():
-            print(f"  - {label}: {len(samples)} samples")
-
-    all_balanced_data = []
-
-    for split, label_dict in data_by_split_and_label.items():
-        # Step 3: Determine min class size for this split
-        class_counts = {label: len(samples) for label, samples in label_dict.items()}
-        min_count = min(class_counts.values())
-        min_allowed = int(min_count * 0.9)
-        max_allowed = int(min_count * 1.1)
-
-        print(f"\n📉 Balancing {split.upper()} to [{min_allowed}, {max_allowed}]")
-
-        for label, samples in label_dict.items():
-            count = len(samples)
-            if count < min_allowed:
-                print(
-                    f"⚠️ Skipping {split}/{label}: only {count} samples (< {min_allowed})"
-                )
-                continue
-            target_count = min(count, max_allowed)
-            selected = random.sample(samples, target_count)
-            all_balanced_data.extend(selected)
+    _print_counts(class_counts(df))
+
+    # Step 3: Balance every split
+    with stage("balance", items=len(df)):
+        balanced = balanced_view(df)
 
     # Step 4: Save combined CSV
-    random.shuffle(all_balanced_data)
-    df = pd.DataFrame(all_balanced_data, columns=["image_path", "label", "split"])
-    df.to_csv("spectrogram_dataset.csv", index=False)
+    with stage("write_csv", items=len(balanced)):
+        balanced[["image_path", "label", "split"]].to_csv(CSV_PATH, index=False)
 
-    print(f"\n✅ Saved spectrogram_dataset.csv with {len(df)} total entries.")
+    print(f"\n✅ Saved {CSV_PATH} with {len(balanced)} total entries.")
 
     # Step 5: Final class count summary
     print("\n📦 Final balanced class counts by split:")
-    for split in {"train", "test"}:
-        sub_df = df[df["split"] == split]
-        print(f"\n🔹 {split.upper()}:")
-        for label in sub_df["label"].unique():
-            count = (sub_df["label"] == label).sum()
-            print(f"  - {label}: {count} samples")
+    _print_counts(class_counts(balanced))
 
 
 if __name__ == "__main__":
-    create_csv()
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--manifest",
+        type=str,
+        default=None,
+        help="Spectrogram manifest of the flat store (splits by speaker hash)",
+    )
+    parser.add_argument(
+        "--test_ratio",
+        type=float,
+        default=0.2,
+        help="Fraction of speakers in the test split (with --manifest)",
+    )
+    args = parser.parse_args()
+    enable()
+    create_csv(manifest=args.manifest, test_ratio=args.test_ratio)
+    print_summary()
@@ -1,3 +1,4 @@
+import csv
 import os
 import librosa
 import librosa.display
@@ -5,6 +6,10 @@ import matplotlib.pyplot as plt
 import numpy as np
 from PIL import Image
 
+from fast_audio import load as load_wav
+from instrumentation import enable, stage, print_summary
+from segment_store import SAMPLE_RATE, SegmentStore, list_accents
+
 # Paths
 processed_audio_path = "data/dataset/processed"
 output_root = "data/dataset/spectrograms"
@@ -16,6 +21,26 @@ def check_if_spectrograms_exist(image_path: str) -> bool:
     return os.path.exists(image_path)
 
 
+def compute_mel_db(y, sr):
+    mel = librosa.feature.melspectrogram(
+        y=y, sr=sr, n_mels=128, n_fft=512, hop_length=128
+    )
+    return librosa.power_to_db(mel, ref=np.max)
+
+
+def render_spectrogram(mel_db, sr, image_path):
+    fig, ax = plt.subplots()
+    librosa.display.specshow(mel_db, sr=sr, ax=ax)
+    ax.axis("off")
+    plt.savefig(image_path, bbox_inches="tight", pad_inches=0)
+    plt.close(fig)
+
+    img = Image.open(image_path).convert("RGB").resize(img_size)
+    img = np.array(img).astype(np.float32) / 255.0
+    img = (img * 255).astype(np.uint8)
+    Image.fromarray(img).save(image_path)
+
+
 def create_spectrograms_recursive():
     for split in ["train", "test"]:
         split_audio_path = os.path.join(processed_audio_path, split)
@@ -42,32 +67,129 @@ def create_spectrograms_recursive():
                         continue
 
                     wav_path = os.path.join(root, fname)
-                    y, sr = librosa.load(wav_path, sr=16000)
+                    with stage("load"):
+                        y, sr = load_wav(wav_path, sr=16000)
 
                     if len(y) < 512:
                         print(f"⚠️ Skipping short audio: {image_fname}")
                         continue
 
-                    mel = librosa.feature.melspectrogram(
-                        y=y, sr=sr, n_mels=128, n_fft=512, hop_length=128
-                    )
-                    mel_db = librosa.power_to_db(mel, ref=np.max)
+                    with stage("melspectrogram"):
+                        mel_db = compute_mel_db(y, sr)
 
-                    fig, ax = plt.subplots()
-                    librosa.display.specshow(mel_db, sr=sr, ax=ax)
-                    ax.axis("off")
-                    plt.savefig(image_path, bbox_inches="tight", pad_inches=0)
-                    plt.close(fig)
-
-                    img = Image.open(image_path).convert("RGB").resize(img_size)
-                    img = np.array(img).astype(np.float32) / 255.0
-                    img = (img * 255).astype(np.uint8)
-                    Image.fromarray(img).save(image_path)
+                    with stage("render"):
+                        render_spectrogram(mel_db, sr, image_path)
 
                     data.append((image_path, accent))
 
 
+def create_spectrograms_from_store(store_root, output_dir=output_root):
+    """
+    Renders segment stores (text_splice with SEGMENT_STORE) laid out as
+    store_root/<split>/<accent>.pcm. Images get the names create_spectrograms_recursive
+    gives the equivalent WAV folders, `{accent}_{source}_{segment}.png`.
+    """
+    for split in ["train", "test"]:
+        split_store = os.path.join(store_root, split)
+        split_output_path = os.path.join(output_dir, split)
+        os.makedirs(split_output_path, exist_ok=True)
+
+        for accent in list_accents(split_store):
+            store = SegmentStore(split_store, accent)
+            for entry in store.entries:
+                image_fname = f"{accent}_{entry['source']}_{entry['name']}.png"
+                image_path = os.path.join(split_output_path, image_fname)
+                if check_if_spectrograms_exist(image_path):
+                    print(f"✅ {image_fname} exists, skipping.")
+                    continue
+
+                with stage("load"):
+                    y, sr = store.read(entry), SAMPLE_RATE
+                if len(y) < 512:
+                    print(f"⚠️ Skipping short audio: {image_fname}")
+                    continue
+                with stage("melspectrogram"):
+                    mel_db = compute_mel_db(y, sr)
+                with stage("render"):
+                    render_spectrogram(mel_db, sr, image_path)
+                data.append((image_path, accent))
+
+
+def create_spectrograms_from_manifest(manifest_path, output_dir=output_root):
+    """
+    Renders the clips of a flat store manifest (batch_preprocess --flat) into
+    output_dir/store/<key>.png and writes output_dir/manifest.csv, keeping the
+    client_id and split of every clip for create_csv.
+    """
+    store_dir = os.path.join(output_dir, "store")
+    os.makedirs(store_dir, exist_ok=True)
+
+    with open(manifest_path, "r", encoding="utf-8", newline="") as f:
+        rows = list(csv.DictReader(f))
+
+    images = []
+    for row in rows:
+        key = os.path.splitext(os.path.basename(row["audio_path"]))[0]
+        image_path = os.path.join(store_dir, key + ".png")
+        label = row["label"].split("_")[0].lower()
+
+        if not check_if_spectrograms_exist(image_path):
+            with stage("load"):
+                y, sr = load_wav(row["audio_path"], sr=16000)
+            if len(y) < 512:
+                print(f"⚠️ Skipping short audio: {row['audio_path']}")
+                continue
+            with stage("melspectrogram"):
+                mel_db = compute_mel_db(y, sr)
+            with stage("render"):
+                render_spectrogram(mel_db, sr, image_path)
+            data.append((image_path, label))
+
+        images.append(
+            {
+                "image_path": image_path,
+                "label": label,
+                "client_id": row["client_id"],
+                "split": row["split"],
+            }
+        )
+
+    spectrogram_manifest = os.path.join(output_dir, "manifest.csv")
+    with open(spectrogram_manifest, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(
+            f, fieldnames=["image_path", "label", "client_id", "split"]
+        )
+        writer.writeheader()
+        writer.writerows(images)
+    print(f"✅ Spectrogram manifest saved to {spectrogram_manifest}")
+    return spectrogram_manifest
+
+
 if __name__ == "__main__":
-    create_spectrograms_recursive()
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--manifest",
+        type=str,
+        default=None,
+        help="Manifest from batch_preprocess --flat, instead of the train/test folders",
+    )
+    parser.add_argument(
+        "--segment_store",
+        type=str,
+        default=None,
+        help="Root of text_splice segment stores (<root>/<split>/<accent>.pcm)",
+    )
+    args = parser.parse_args()
+    enable()
+
+    if args.manifest:
+        create_spectrograms_from_manifest(args.manifest)
+    elif args.segment_store:
+        create_spectrograms_from_store(args.segment_store)
+    else:
+        create_spectrograms_recursive()
     print("✅ Spectrograms created successfully.")
     print(f"Total spectrograms created: {len(data)}")
+    print_summary()
@@ -0,0 +1,156 @@
+"""
+Single-host multi-process (DDP) training for Machine on CPU.
+
+One PyTorch process stops scaling after a handful of threads, so on big hosts it is
+faster to run several processes with fewer threads each. `launch` starts N workers with
+the gloo backend. The Trainer gives every worker its own shard of the spectrogram dataset
+and keeps gradients in sync. Every epoch is evaluated on the validation set sharded over the
+workers, so early stopping and the best model work as in a single process; rank 0 alone
+writes checkpoints and, after training, runs the final evaluation and confusion matrix.
+
+    python ddp_train.py --nprocs 4 --model deit-small
+    python ddp_train.py --scaling 1 2 4 8 --model deit-small --steps 20
+
+--scaling measures training throughput on synthetic data for every process count and
+prints the scaling efficiency relative to one process.
+"""
+
+import os
+import socket
+
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _set_dist_env(rank, world_size, port):
+    os.environ.update(
+        MASTER_ADDR="127.0.0.1",
+        MASTER_PORT=str(port),
+        RANK=str(rank),
+        LOCAL_RANK=str(rank),
+        WORLD_SIZE=str(world_size),
+    )
+
+
+def _threads_per_process(world_size):
+    return max(1, (os.cpu_count() or 1) // world_size)
+
+
+def _train_worker(rank, world_size, port, machine_kwargs):
+    _set_dist_env(rank, world_size, port)
+    from machine import Machine
+
+    machine_kwargs.setdefault("num_threads", _threads_per_process(world_size))
+    machine = Machine(ddp_backend="gloo", **machine_kwargs)
+    machine.learn()
+    if machine.is_main_process:
+        results = machine.evaluate()
+        print("Evaluation results:", results)
+
+
+def launch(nprocs, **machine_kwargs):
+    """Trains Machine(**machine_kwargs) in `nprocs` DDP processes."""
+    mp.spawn(
+        _train_worker,
+        args=(nprocs, _free_port(), machine_kwargs),
+        nprocs=nprocs,
+        join=True,
+    )
+
+
+def _benchmark_worker(rank, world_size, port, model_name, batch_size, steps, results):
+    _set_dist_env(rank, world_size, port)
+    torch.set_num_threads(_threads_per_process(world_size))
+    dist.init_process_group("gloo", rank=rank, world_size=world_size)
+
+    from torch.nn.parallel import DistributedDataParallel
+    from transformers import AutoModelForImageClassification
+
+    from machine import resolve_model_name
+    from train_benchmark import benchmark_training, synthetic_dataloader
+
+    torch.manual_seed(0)
+    model = AutoModelForImageClassification.from_pretrained(
+        resolve_model_name(model_name), num_labels=9, ignore_mismatched_sizes=True
+    )
+    ddp_model = DistributedDataParallel(model)
+    report = benchmark_training(
+        ddp_model, synthetic_dataloader(batch_size, num_labels=9), steps=steps
+    )
+
+    # Global throughput is limited by the slowest rank
+    step_ms = torch.tensor([report["step_ms"]])
+    dist.all_reduce(step_ms, op=dist.ReduceOp.MAX)
+    if rank == 0:
+        results.put(world_size * batch_size / (step_ms.item() / 1000))
+    dist.destroy_process_group()
+
+
+def scaling_report(process_counts, model_name="vit-base", batch_size=16, steps=20):
+    """
+    Runs the synthetic training benchmark with every process count (per-process
+    batch size fixed) and returns (processes, samples/sec, efficiency) rows.
+    """
+    ctx = mp.get_context("spawn")
+    rows = []
+    base = None
+    for n in process_counts:
+        results = ctx.SimpleQueue()
+        mp.spawn(
+            _benchmark_worker,
+            args=(n, _free_port(), model_name, batch_size, steps, results),
+            nprocs=n,
+            join=True,
+        )
+        throughput = results.get()
+        if base is None:
+            base = throughput / n
+        rows.append((n, throughput, throughput / (n * base)))
+        print(
+            f"🧮 {n} processes: {throughput:.2f} samples/s, "
+            f"efficiency {throughput / (n * base):.0%}"
+        )
+    return rows
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nprocs", type=int, default=2, help="Worker processes")
+    parser.add_argument("--model", type=str, default="vit-base")
+    parser.add_argument("--csv", type=str, default="spectrogram_dataset.csv")
+    parser.add_argument(
+        "--batch_size",
+        type=int,
+        default=64,
+        help="Per-process batch size",
+    )
+    parser.add_argument("--out_dir", type=str, default="./results")
+    parser.add_argument(
+        "--scaling",
+        type=int,
+        nargs="+",
+        default=None,
+        help="Benchmark these process counts instead of training, e.g. 1 2 4 8",
+    )
+    parser.add_argument("--steps", type=int, default=20, help="Steps for --scaling")
+    args = parser.parse_args()
+
+    if args.scaling:
+        scaling_report(args.scaling, args.model, args.batch_size, args.steps)
+    else:
+        launch(
+            args.nprocs,
+            csv_path=args.csv,
+            model_name=args.model,
+            batch_size=args.batch_size,
+            output_dir=args.out_dir,
+        )
@@ -0,0 +1,288 @@
+"""
+Frozen-backbone embedding cache for fast head-only retraining.
+
+Runs the pretrained backbone once over every spectrogram in spectrogram_dataset.csv and
+stores the CLS embeddings in memory-mapped .npy files. A linear classifier (or a small
+MLP) is then trained on the cached embeddings, which takes seconds instead of the hours a
+full fine-tune of Machine takes, so new accents or a different class balance can be tried
+quickly. The cache is rebuilt only when the CSV or the backbone changes.
+
+    python embedding_cache.py --model vit-base --head mlp --compare ./results
+
+--compare reads the best accuracy of a full fine-tuning run from its trainer_state.json.
+A linear head can be saved with --save_dir as a normal checkpoint for test_model.
+"""
+
+import glob
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import torch
+from PIL import Image
+from sklearn.model_selection import train_test_split
+from transformers import AutoImageProcessor, AutoModel, AutoModelForImageClassification
+
+from machine import resolve_model_name
+
+CACHE_DIR = "embedding_cache"
+
+
+def _file_hash(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _embed(backbone, pixel_values):
+    outputs = backbone(pixel_values=pixel_values)
+    hidden = outputs.last_hidden_state
+    if hidden.dim() == 3:
+        # Transformers: normalized CLS token, what ViTForImageClassification classifies
+        return hidden[:, 0]
+    # Convolutional backbones (MobileViT): globally pooled features
+    return outputs.pooler_output
+
+
+def build_embeddings(
+    csv_path="spectrogram_dataset.csv",
+    model_name="vit-base",
+    cache_dir=CACHE_DIR,
+    batch_size=64,
+):
+    """
+    Writes {split}_embeddings.npy / {split}_labels.npy for the train and test splits
+    and returns the label names. Nothing is recomputed when the cache is up to date.
+    """
+    model_name = resolve_model_name(model_name)
+    df = pd.read_csv(csv_path)
+    label_names = sorted(df["label"].unique())
+    label2id = {name: i for i, name in enumerate(label_names)}
+
+    meta = {"csv": _file_hash(csv_path), "model": model_name, "labels": label_names}
+    meta_path = os.path.join(cache_dir, "meta.json")
+    if os.path.exists(meta_path):
+        with open(meta_path, "r", encoding="utf-8") as f:
+            if json.load(f) == meta:
+                print(f"✅ Embedding cache in {cache_dir} is up to date")
+                return label_names
+
+    for split in ["train", "test"]:
+        if not (df["split"] == split).any():
+            raise ValueError(f"{csv_path} has no {split} images to embed")
+
+    os.makedirs(cache_dir, exist_ok=True)
+    processor = AutoImageProcessor.from_pretrained(model_name)
+    backbone = AutoModel.from_pretrained(model_name)
+    backbone.eval()
+
+    for split in ["train", "test"]:
+        split_df = df[df["split"] == split]
+        paths = split_df["image_path"].tolist()
+        np.save(
+            os.path.join(cache_dir, f"{split}_labels.npy"),
+            split_df["label"].map(label2id).to_numpy(dtype=np.int64),
+        )
+
+        start = time.perf_counter()
+        embeddings = None
+        with torch.no_grad():
+            for i in range(0, len(paths), batch_size):
+                images = [Image.open(p).convert("RGB") for p in paths[i : i + batch_size]]
+                inputs = processor(images=images, return_tensors="pt")
+                batch = _embed(backbone, inputs["pixel_values"]).numpy()
+                if embeddings is None:
+                    embeddings = np.lib.format.open_memmap(
+                        os.path.join(cache_dir, f"{split}_embeddings.npy"),
+                        mode="w+",
+                        dtype=np.float32,
+                        shape=(len(paths), batch.shape[1]),
+                    )
+                embeddings[i : i + len(batch)] = batch
+        if embeddings is not None:
+            embeddings.flush()
+        print(
+            f"🧠 Embedded {len(paths)} {split} spectrograms in "
+            f"{time.perf_counter() - start:.1f} s"
+        )
+
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    return label_names
+
+
+def load_split(split, cache_dir=CACHE_DIR):
+    embeddings = np.load(
+        os.path.join(cache_dir, f"{split}_embeddings.npy"), mmap_mode="r"
+    )
+    labels = np.load(os.path.join(cache_dir, f"{split}_labels.npy"))
+    return embeddings, labels
+
+
+def make_head(dim, num_labels, kind="linear", hidden=256, dropout=0.2):
+    if kind == "linear":
+        return torch.nn.Linear(dim, num_labels)
+    if kind == "mlp":
+        return torch.nn.Sequential(
+            torch.nn.Linear(dim, hidden),
+            torch.nn.GELU(),
+            torch.nn.Dropout(dropout),
+            torch.nn.Linear(hidden, num_labels),
+        )
+    raise ValueError(f"Unknown head type: {kind}")
+
+
+def train_head(
+    num_labels,
+    kind="linear",
+    cache_dir=CACHE_DIR,
+    epochs=100,
+    batch_size=256,
+    learning_rate=1e-3,
+    weight_decay=0.05,
+    val_fraction=0.1,
+):
+    """
+    Trains a head on the cached embeddings, returns (head, test accuracy, seconds).
+    The best epoch is picked on a stratified `val_fraction` of the train split, the
+    test split is scored once at the end, so the accuracy is not tuned on it.
+    """
+    x_train, y_train = load_split("train", cache_dir)
+    x_test, y_test = load_split("test", cache_dir)
+    train_idx, val_idx = train_test_split(
+        np.arange(len(y_train)),
+        test_size=val_fraction,
+        stratify=y_train,
+        random_state=0,
+    )
+    x_val = torch.from_numpy(x_train[np.sort(val_idx)])
+    y_val = torch.from_numpy(y_train[np.sort(val_idx)])
+    x_train = torch.from_numpy(x_train[np.sort(train_idx)])
+    y_train = torch.from_numpy(y_train[np.sort(train_idx)])
+    x_test = torch.from_numpy(np.ascontiguousarray(x_test))
+    y_test = torch.from_numpy(y_test)
+
+    head = make_head(x_train.shape[1], num_labels, kind)
+    optimizer = torch.optim.AdamW(
+        head.parameters(), lr=learning_rate, weight_decay=weight_decay
+    )
+    scheduler = torch.optim.lr_scheduler.CosineAnnealingLR(optimizer, T_max=epochs)
+    loss_fn = torch.nn.CrossEntropyLoss()
+
+    start = time.perf_counter()
+    best_accuracy, best_state = -1.0, None
+    for _ in range(epochs):
+        head.train()
+        order = torch.randperm(len(x_train))
+        for i in range(0, len(order), batch_size):
+            idx = order[i : i + batch_size]
+            loss = loss_fn(head(x_train[idx]), y_train[idx])
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+        scheduler.step()
+
+        head.eval()
+        with torch.no_grad():
+            accuracy = (head(x_val).argmax(dim=-1) == y_val).float().mean().item()
+        if accuracy >= best_accuracy:
+            best_accuracy = accuracy
+            best_state = {k: v.clone() for k, v in head.state_dict().items()}
+
+    head.load_state_dict(best_state)
+    head.eval()
+    with torch.no_grad():
+        test_accuracy = (head(x_test).argmax(dim=-1) == y_test).float().mean().item()
+    return head, test_accuracy, time.perf_counter() - start
+
+
+def finetuned_accuracy(results_dir):
+    """Best eval accuracy of a Machine run, read from its trainer_state.json."""
+    states = glob.glob(os.path.join(results_dir, "**", "trainer_state.json"), recursive=True)
+    best = None
+    for path in states:
+        with open(path, "r", encoding="utf-8") as f:
+            metric = json.load(f).get("best_metric")
+        if metric is not None and (best is None or metric > best):
+            best = metric
+    return best
+
+
+def save_linear_checkpoint(head, model_name, label_names, save_dir):
+    """Puts a trained linear head on the backbone as a regular classification checkpoint."""
+    model_name = resolve_model_name(model_name)
+    label2id = {name: i for i, name in enumerate(label_names)}
+    model = AutoModelForImageClassification.from_pretrained(
+        model_name,
+        num_labels=len(label_names),
+        id2label={i: name for name, i in label2id.items()},
+        label2id=label2id,
+        ignore_mismatched_sizes=True,
+    )
+    model.classifier.load_state_dict(head.state_dict())
+    model.save_pretrained(save_dir)
+    AutoImageProcessor.from_pretrained(model_name).save_pretrained(save_dir)
+    print(f"✅ Checkpoint saved to {save_dir}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--csv", type=str, default="spectrogram_dataset.csv")
+    parser.add_argument("--model", type=str, default="vit-base")
+    parser.add_argument("--cache_dir", type=str, default=CACHE_DIR)
+    parser.add_argument("--head", choices=["linear", "mlp"], default="linear")
+    parser.add_argument("--epochs", type=int, default=100)
+    parser.add_argument(
+        "--val_fraction",
+        type=float,
+        default=0.1,
+        help="Share of the train split held out to pick the best epoch",
+    )
+    parser.add_argument(
+        "--compare",
+        type=str,
+        default=None,
+        help="Output folder of a full fine-tuning run to compare against",
+    )
+    parser.add_argument(
+        "--save_dir",
+        type=str,
+        default=None,
+        help="Save backbone + linear head as a checkpoint usable by test_model",
+    )
+    args = parser.parse_args()
+
+    label_names = build_embeddings(args.csv, args.model, args.cache_dir)
+    head, accuracy, seconds = train_head(
+        len(label_names),
+        args.head,
+        args.cache_dir,
+        args.epochs,
+        val_fraction=args.val_fraction,
+    )
+    print(
+        f"🎯 {args.head} head: test accuracy {accuracy:.4f}, trained in {seconds:.1f} s"
+    )
+
+    if args.compare:
+        full = finetuned_accuracy(args.compare)
+        if full is None:
+            print(f"⚠️ No trainer_state.json with best_metric in {args.compare}")
+        else:
+            print(
+                f"📊 Full fine-tuning: {full:.4f}, head-only: {accuracy:.4f} "
+                f"({accuracy - full:+.4f})"
+            )
+
+    if args.save_dir:
+        if args.head != "linear":
+            print("⚠️ Only a linear head can be saved as a checkpoint")
+        else:
+            save_linear_checkpoint(head, args.model, label_names, args.save_dir)
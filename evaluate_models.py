@@ -0,0 +1,214 @@
+"""
+Evaluation harness for test_model with a feature cache.
+
+The expensive part of evaluating a checkpoint is not the model but turning every clip
+into a spectrogram (ffmpeg, normalize, denoise, trim, matplotlib). This script stores the
+224x224 spectrogram of every evaluation clip as a .npy file keyed by the hash of the audio
+file and the preprocessing parameters, builds only the missing ones in a process pool,
+and then scores any number of checkpoints against the same cached features.
+
+For every checkpoint it reports per-accent accuracy, a confusion matrix and timing.
+"""
+
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from PIL import Image
+from sklearn.metrics import confusion_matrix
+
+from test_model import (
+    ACCENT_LABEL_MAP,
+    ACCENTS,
+    CLIPS_FOLDER,
+    TSV_FILE,
+    create_spectogram,
+    filter_and_sort_tsv,
+    load_model,
+    load_processor,
+    predict_logits,
+)
+
+CACHE_DIR = "feature_cache"
+
+# Bump "version" whenever create_spectogram changes in a way these don't capture
+FEATURE_PARAMS = {
+    "version": 1,
+    "sr": 16000,
+    "n_mels": 128,
+    "n_fft": 512,
+    "hop_length": 128,
+    "size": 224,
+    "preprocess": ["normalize_audio", "denoise_wav", "trim_silence"],
+}
+
+
+def feature_key(audio_path, params=FEATURE_PARAMS):
+    h = hashlib.sha1(json.dumps(params, sort_keys=True).encode("utf-8"))
+    with open(audio_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _cache_path(key, cache_dir):
+    return os.path.join(cache_dir, key[:2], f"{key}.npy")
+
+
+def _build_feature(job):
+    audio_path, cache_path = job
+    image = create_spectogram(audio_path)
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tmp_path = cache_path + f".{os.getpid()}.tmp.npy"
+    np.save(tmp_path, np.asarray(image, dtype=np.uint8))
+    os.replace(tmp_path, cache_path)
+    return audio_path
+
+
+def build_features(audio_paths, cache_dir=CACHE_DIR, workers=None):
+    """Returns {audio_path: cache_path}, rendering missing features in parallel."""
+    cache_paths = {p: _cache_path(feature_key(p), cache_dir) for p in audio_paths}
+    missing = [(p, c) for p, c in cache_paths.items() if not os.path.exists(c)]
+    print(f"🗂️ {len(cache_paths) - len(missing)} cached, {len(missing)} to build")
+
+    start = time.perf_counter()
+    failed = set()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(_build_feature, job): job[0] for job in missing}
+        for future, audio_path in futures.items():
+            try:
+                future.result()
+            except Exception as e:
+                print(f"❌ Failed to build features for {audio_path}: {e}")
+                failed.add(audio_path)
+    if missing:
+        print(f"🕒 Built {len(missing)} features in {time.perf_counter() - start:.2f} s")
+
+    return {p: c for p, c in cache_paths.items() if p not in failed}
+
+
+def collect_clips(limit=None, tsv_path=TSV_FILE, clips_path=CLIPS_FOLDER):
+    """Returns a list of (audio_path, label) for every accent in test_model.ACCENTS."""
+    clips = []
+    for accent in ACCENTS:
+        temp_tsv = filter_and_sort_tsv(accent, tsv_path, clips_path, limit=limit)
+        label = ACCENT_LABEL_MAP[accent]
+        with open(temp_tsv, "r", encoding="utf-8") as f:
+            for i, line in enumerate(f):
+                if limit is not None and i >= limit:
+                    break
+                parts = line.strip().split("\t")
+                if len(parts) < 2:
+                    continue
+                clips.append((os.path.join(clips_path, parts[0]), label))
+        os.remove(temp_tsv)
+    return clips
+
+
+def score_checkpoint(path, features, labels, batch_size=32):
+    start = time.perf_counter()
+    model = load_model(path)
+    processor = load_processor(path)
+    load_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    predictions = []
+    for i in range(0, len(features), batch_size):
+        images = [
+            Image.fromarray(np.load(p)) for p in features[i : i + batch_size]
+        ]
+        preds = predict_logits(model, processor, images).argmax(dim=-1).tolist()
+        predictions.extend(model.config.id2label[int(p)].strip().lower() for p in preds)
+    inference_time = time.perf_counter() - start
+
+    y_true = np.array(labels)
+    y_pred = np.array(predictions)
+    per_accent = {
+        label: float((y_pred[y_true == label] == label).mean())
+        for label in sorted(set(labels))
+    }
+    names = sorted(set(labels) | set(predictions))
+    cm = pd.DataFrame(
+        confusion_matrix(y_true, y_pred, labels=names), index=names, columns=names
+    )
+    return {
+        "checkpoint": path,
+        "accuracy": float((y_true == y_pred).mean()),
+        "per_accent": per_accent,
+        "confusion_matrix": cm,
+        "load_s": load_time,
+        "inference_s": inference_time,
+        "clips_per_s": len(labels) / inference_time if inference_time else None,
+    }
+
+
+def evaluate_models(
+    checkpoints, limit=None, cache_dir=CACHE_DIR, workers=None, out_dir="evaluation"
+):
+    clips = collect_clips(limit)
+    cache_paths = build_features([p for p, _ in clips], cache_dir, workers)
+    clips = [(p, label) for p, label in clips if p in cache_paths]
+    features = [cache_paths[p] for p, _ in clips]
+    labels = [label for _, label in clips]
+
+    os.makedirs(out_dir, exist_ok=True)
+    rows = []
+    for path in checkpoints:
+        print(f"\n📏 Scoring {path}")
+        result = score_checkpoint(path, features, labels)
+        for label, accuracy in result["per_accent"].items():
+            print(f"  - {label}: {accuracy:.3f}")
+        print(f"  Total accuracy: {result['accuracy']:.3f}")
+        print(result["confusion_matrix"].to_string())
+
+        name = path.strip("/").replace("/", "_").replace(".", "_")
+        result["confusion_matrix"].to_csv(os.path.join(out_dir, f"{name}_cm.csv"))
+        rows.append(
+            {
+                "checkpoint": path,
+                "accuracy": result["accuracy"],
+                **{f"acc_{k}": v for k, v in result["per_accent"].items()},
+                "load_s": result["load_s"],
+                "inference_s": result["inference_s"],
+                "clips_per_s": result["clips_per_s"],
+            }
+        )
+
+    summary = pd.DataFrame(rows)
+    summary.to_csv(os.path.join(out_dir, "summary.csv"), index=False)
+    print(f"\n✅ Summary saved to {os.path.join(out_dir, 'summary.csv')}")
+    return summary
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "checkpoints",
+        nargs="+",
+        help="Checkpoint directories, model_int8.pt or .onnx files to score",
+    )
+    parser.add_argument(
+        "--limit",
+        type=int,
+        default=None,
+        help="Evaluate at most this many clips per accent",
+    )
+    parser.add_argument("--cache_dir", type=str, default=CACHE_DIR)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Processes building features (defaults to the number of cores)",
+    )
+    parser.add_argument("--out_dir", type=str, default="evaluation")
+    args = parser.parse_args()
+
+    evaluate_models(
+        args.checkpoints, args.limit, args.cache_dir, args.workers, args.out_dir
+    )
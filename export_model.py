@@ -0,0 +1,234 @@
+"""
+Exports a trained checkpoint for CPU inference and checks that the exported models
+still agree with the original one.
+
+Produces in the output folder:
+- model_int8.pt      dynamic int8 quantized PyTorch model (Linear layers)
+- model.onnx         fp32 ONNX graph for onnxruntime
+- model_int8.onnx    dynamic int8 quantized ONNX graph
+- config.json and the image processor, so every artifact can be loaded on its own
+
+Any of those files can be passed to test_model.load_model.
+"""
+
+import json
+import os
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import torch
+from PIL import Image
+from transformers import AutoConfig, AutoImageProcessor, AutoModelForImageClassification
+
+
+class OnnxAccentModel:
+    """
+    Thin onnxruntime wrapper that looks like a transformers model to `predict`:
+    it is called with processor outputs and returns an object with `.logits`.
+    """
+
+    def __init__(self, path, num_threads=None):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(
+            path, options, providers=["CPUExecutionProvider"]
+        )
+        self.config = AutoConfig.from_pretrained(os.path.dirname(path) or ".")
+
+    def __call__(self, pixel_values, **kwargs):
+        (logits,) = self.session.run(
+            ["logits"], {"pixel_values": pixel_values.numpy().astype(np.float32)}
+        )
+        return SimpleNamespace(logits=torch.from_numpy(logits))
+
+    def eval(self):
+        return self
+
+
+class _LogitsOnly(torch.nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, pixel_values):
+        return self.model(pixel_values=pixel_values).logits
+
+
+def checkpoint_backbone(folder):
+    """
+    The model a checkpoint was fine-tuned from (`_name_or_path` in its config.json),
+    None if it isn't recorded or doesn't point anywhere else.
+    """
+    config_path = os.path.join(folder, "config.json")
+    if not os.path.exists(config_path):
+        return None
+    with open(config_path, "r", encoding="utf-8") as f:
+        name = json.load(f).get("_name_or_path")
+    if not name or os.path.abspath(name) == os.path.abspath(folder):
+        return None
+    return name
+
+
+def load_processor(path):
+    """
+    The image processor saved with a checkpoint (or next to an exported model file).
+    Checkpoints saved before the Trainer stored the processor get the one of the
+    backbone named in their config.json. It is never guessed, a backbone other than
+    the one the model was trained with would silently preprocess the images
+    differently.
+    """
+    folder = path if os.path.isdir(path) else os.path.dirname(path) or "."
+    if os.path.exists(os.path.join(folder, "preprocessor_config.json")):
+        return AutoImageProcessor.from_pretrained(folder)
+
+    backbone = checkpoint_backbone(folder)
+    if backbone is None:
+        raise FileNotFoundError(
+            f"{folder} has no preprocessor_config.json and its config.json names no "
+            "backbone. Save the processor of the model's backbone there "
+            "(AutoImageProcessor.save_pretrained)."
+        )
+    print(f"⚠️ {folder} has no preprocessor_config.json, using the one of {backbone}")
+    return AutoImageProcessor.from_pretrained(backbone)
+
+
+def quantize_dynamic(model):
+    return torch.ao.quantization.quantize_dynamic(
+        model, {torch.nn.Linear}, dtype=torch.qint8
+    )
+
+
+def export_onnx(model, output_path, opset=17):
+    dummy = torch.randn(1, 3, 224, 224)
+    torch.onnx.export(
+        _LogitsOnly(model),
+        (dummy,),
+        output_path,
+        input_names=["pixel_values"],
+        output_names=["logits"],
+        dynamic_axes={"pixel_values": {0: "batch"}, "logits": {0: "batch"}},
+        opset_version=opset,
+    )
+
+
+def export_model(checkpoint, output_dir):
+    os.makedirs(output_dir, exist_ok=True)
+    model = AutoModelForImageClassification.from_pretrained(checkpoint)
+    model.eval()
+
+    model.config.save_pretrained(output_dir)
+    load_processor(checkpoint).save_pretrained(output_dir)
+
+    int8_path = os.path.join(output_dir, "model_int8.pt")
+    torch.save(quantize_dynamic(model), int8_path)
+    print(f"✅ Saved int8 PyTorch model to {int8_path}")
+
+    onnx_path = os.path.join(output_dir, "model.onnx")
+    export_onnx(model, onnx_path)
+    print(f"✅ Saved ONNX model to {onnx_path}")
+
+    from onnxruntime.quantization import QuantType
+    from onnxruntime.quantization import quantize_dynamic as ort_quantize_dynamic
+
+    onnx_int8_path = os.path.join(output_dir, "model_int8.onnx")
+    ort_quantize_dynamic(onnx_path, onnx_int8_path, weight_type=QuantType.QInt8)
+    print(f"✅ Saved int8 ONNX model to {onnx_int8_path}")
+
+    return [int8_path, onnx_path, onnx_int8_path]
+
+
+def _run(model, processor, paths, batch_size):
+    logits = []
+    start = time.perf_counter()
+    with torch.no_grad():
+        for i in range(0, len(paths), batch_size):
+            images = [Image.open(p).convert("RGB") for p in paths[i : i + batch_size]]
+            inputs = processor(images=images, return_tensors="pt")
+            logits.append(model(**inputs).logits.numpy())
+    elapsed = time.perf_counter() - start
+    return np.concatenate(logits), elapsed
+
+
+def check_parity(
+    checkpoint, artifacts, csv_path="spectrogram_dataset.csv", batch_size=32
+):
+    """
+    Scores the fp32 checkpoint and every exported artifact on the test split
+    and reports accuracy, agreement with fp32 predictions and runtime.
+    """
+    from test_model import load_model
+
+    df = pd.read_csv(csv_path)
+    df = df[df["split"] == "test"]
+    paths = df["image_path"].tolist()
+
+    processor = load_processor(checkpoint)
+    reference = load_model(checkpoint)
+    label2id = {n.lower(): int(i) for n, i in reference.config.label2id.items()}
+    y_true = np.array([label2id.get(l.lower(), -1) for l in df["label"]])
+
+    ref_logits, ref_time = _run(reference, processor, paths, batch_size)
+    ref_pred = ref_logits.argmax(axis=-1)
+
+    rows = [
+        {
+            "model": checkpoint,
+            "accuracy": float((ref_pred == y_true).mean()),
+            "agreement": 1.0,
+            "max_logit_diff": 0.0,
+            "seconds": ref_time,
+        }
+    ]
+    for path in artifacts:
+        logits, elapsed = _run(load_model(path), processor, paths, batch_size)
+        pred = logits.argmax(axis=-1)
+        rows.append(
+            {
+                "model": path,
+                "accuracy": float((pred == y_true).mean()),
+                "agreement": float((pred == ref_pred).mean()),
+                "max_logit_diff": float(np.abs(logits - ref_logits).max()),
+                "seconds": elapsed,
+            }
+        )
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--checkpoint",
+        type=str,
+        default="./yapa_comparission/checkpoint-900",
+        help="Trained checkpoint directory to export",
+    )
+    parser.add_argument(
+        "--out_dir",
+        type=str,
+        default="exported_model",
+        help="Output folder for the exported models",
+    )
+    parser.add_argument(
+        "--csv",
+        type=str,
+        default="spectrogram_dataset.csv",
+        help="Dataset CSV, the test split is used for the parity check",
+    )
+    parser.add_argument(
+        "--skip_parity",
+        action="store_true",
+        help="Only export, don't compare against the fp32 model",
+    )
+    args = parser.parse_args()
+
+    artifacts = export_model(args.checkpoint, args.out_dir)
+    if not args.skip_parity:
+        report = check_parity(args.checkpoint, artifacts, args.csv)
+        print(report.to_string(index=False))
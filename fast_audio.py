@@ -0,0 +1,109 @@
+"""
+Fast loader for the WAVs produced by convert_to_wav.
+
+convert_to_wav already writes 16 kHz mono PCM16, so decoding those files through
+librosa's generic path (format probing, resampling checks, dtype conversions) is wasted
+work. `load` reads the RIFF header itself. If the file is mono PCM16 at the requested
+rate, it memory-maps the samples and scales them to float32 in one pass. The samples are
+identical to what librosa.load returns for that file (int16 / 32768). Any other file
+goes through librosa.load unchanged.
+
+    y, sr = load(wav_path)            # like librosa.load(wav_path, sr=16000)
+    y, sr = load(wav_path, sr=None)   # like librosa.load(wav_path, sr=None)
+"""
+
+import os
+import struct
+from collections import namedtuple
+
+import numpy as np
+
+WavInfo = namedtuple(
+    "WavInfo", ["format", "channels", "sample_rate", "bits", "data_offset", "data_size"]
+)
+
+PCM = 1
+EXTENSIBLE = 0xFFFE
+# First two bytes of the KSDATAFORMAT_SUBTYPE_PCM GUID
+PCM_SUBFORMAT = b"\x01\x00"
+
+
+def read_wav_header(path):
+    """Parses the fmt and data chunks of a RIFF/WAVE file, None if it isn't one."""
+    file_size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        riff = f.read(12)
+        if len(riff) < 12 or riff[:4] != b"RIFF" or riff[8:12] != b"WAVE":
+            return None
+
+        fmt = None
+        while True:
+            chunk = f.read(8)
+            if len(chunk) < 8:
+                return None
+            chunk_id, size = struct.unpack("<4sI", chunk)
+            if chunk_id == b"fmt ":
+                body = f.read(size)
+                if len(body) < 16:
+                    return None
+                audio_format, channels, sample_rate, _, _, bits = struct.unpack(
+                    "<HHIIHH", body[:16]
+                )
+                if audio_format == EXTENSIBLE and len(body) >= 26:
+                    if body[24:26] == PCM_SUBFORMAT:
+                        audio_format = PCM
+                fmt = (audio_format, channels, sample_rate, bits)
+                if size % 2:
+                    f.seek(1, os.SEEK_CUR)
+            elif chunk_id == b"data":
+                if fmt is None:
+                    return None
+                offset = f.tell()
+                # Streamed WAVs (ffmpeg to a pipe) can carry a bogus data size
+                data_size = min(size, file_size - offset)
+                return WavInfo(*fmt, offset, data_size)
+            else:
+                f.seek(size + size % 2, os.SEEK_CUR)
+
+
+def is_fast_path(info, sr=16000):
+    return (
+        info is not None
+        and info.format == PCM
+        and info.channels == 1
+        and info.bits == 16
+        and (sr is None or info.sample_rate == sr)
+    )
+
+
+def load(path, sr=16000):
+    """Drop-in for librosa.load(path, sr=sr) (mono), returns (float32 samples, sr)."""
+    path = os.fspath(path)
+    info = read_wav_header(path)
+    if not is_fast_path(info, sr):
+        import librosa
+
+        return librosa.load(path, sr=sr)
+
+    n_samples = info.data_size // 2
+    if n_samples == 0:
+        return np.zeros(0, dtype=np.float32), info.sample_rate
+    samples = np.memmap(
+        path, dtype="<i2", mode="r", offset=info.data_offset, shape=(n_samples,)
+    )
+    y = np.multiply(samples, 1 / 32768, dtype=np.float32)
+    del samples
+    return y, info.sample_rate
+
+
+def denoise_wav(path):
+    """
+    audio_utils.denoise_wav with the fast loader. audio_utils stays identical to the
+    YAPA main repository; for convert_to_wav output both read the same samples.
+    """
+    import noisereduce as nr
+    import soundfile as sf
+
+    audio, sr = load(path, sr=None)
+    reduced_audio = nr.reduce_noise(y=audio, sr=sr, stationary=True, prop_decrease=0.4)
+    sf.write(path, reduced_audio, sr)
@@ -0,0 +1,87 @@
+"""
+Memory-bounded sort for candidate clip lists.
+
+Rows are added with an integer sort key and kept in memory until `max_rows` of them have
+been collected. Then the run is sorted and spilled to a temporary TSV. Iterating the
+sorter merges the spill files and the last in-memory run lazily with heapq.merge, so
+at most one row per run is held while reading. Ties keep insertion order, because every
+row carries its insertion number as the last part of its key.
+
+A consumer can stop early, e.g. once enough unique speakers were found, and the rest of
+the merge is never read:
+
+    with ExternalSorter() as sorter:
+        for score, filename, transcript in rows:
+            sorter.add(score_key(score), filename, transcript)
+        for filename, transcript in sorter:
+            ...
+"""
+
+import heapq
+import os
+import tempfile
+
+
+def score_key(score):
+    """The usual candidate order, clips with score 0 first, then by descending score."""
+    return (int(score != 0), -score)
+
+
+class ExternalSorter:
+    def __init__(self, max_rows=200_000, tmp_dir=None):
+        self.max_rows = max_rows
+        self.tmp_dir = tmp_dir
+        self.rows = []
+        self.spills = []
+        self.seq = 0
+
+    def add(self, key, *fields):
+        """`key` is a tuple of ints, `fields` are strings without tabs or newlines."""
+        self.rows.append((tuple(key) + (self.seq,), fields))
+        self.seq += 1
+        if len(self.rows) >= self.max_rows:
+            self._spill()
+
+    def __len__(self):
+        return self.seq
+
+    def _spill(self):
+        if not self.rows:
+            return
+        self.rows.sort()
+        key_len = len(self.rows[0][0])
+        fd, path = tempfile.mkstemp(suffix=".tsv", dir=self.tmp_dir)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            for key, fields in self.rows:
+                f.write("\t".join(map(str, key + fields)) + "\n")
+        self.spills.append((path, key_len))
+        self.rows = []
+
+    @staticmethod
+    def _read_spill(path, key_len):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                parts = line.rstrip("\n").split("\t")
+                yield tuple(int(p) for p in parts[:key_len]), tuple(parts[key_len:])
+
+    def __iter__(self):
+        """Yields the field tuples in key order."""
+        self.rows.sort()
+        runs = [self._read_spill(path, n) for path, n in self.spills]
+        runs.append(iter(self.rows))
+        for _, fields in heapq.merge(*runs, key=lambda row: row[0]):
+            yield fields
+
+    def close(self):
+        for path, _ in self.spills:
+            if os.path.exists(path):
+                os.remove(path)
+        self.spills = []
+        self.rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
@@ -34,6 +34,20 @@ import re
 import tempfile
 import soundfile as sf
 import shutil
+import threading
+
+try:
+    from helper_scripts.materialize import MaterializeStats, materialize
+    from helper_scripts.tsv_scan import iter_chunks
+    from helper_scripts.external_sort import ExternalSorter, score_key
+except ImportError:  # run as a script from helper_scripts/
+    from materialize import MaterializeStats, materialize
+    from tsv_scan import iter_chunks
+    from external_sort import ExternalSorter, score_key
+
+# hardlink -> reflink -> copy, "virtual" makes no sense here since files get deleted
+MATERIALIZE_MODE = "auto"
+materialize_stats = MaterializeStats()
 
 count_files = lambda path: len(
     [f for f in os.listdir(path) if os.path.isfile(os.path.join(path, f))]
@@ -41,105 +55,142 @@ count_files = lambda path: len(
 
 
 def filter_and_sort_tsv(tsv_path=CSV_PATH, clips_path=AUDIO_DIR, min_frames=1024):
+    """
+    Writes the first valid clip of every matching speaker (in TSV order) to a temp
+    TSV, best score first. The TSV is streamed chunk by chunk and the kept clips are
+    sorted out of memory, so neither the rows nor the candidates pile up in memory.
+    """
     used_clients = set()
-    entries = []
 
-    with open(tsv_path, "r", encoding="utf-8") as f:
-        for line in f:
-            parts = line.strip().split("\t")
-            if len(parts) < 10 or parts[0] == "client_id":
-                continue
-
-            client_id, filename, transcript, accent = (
-                parts[0],
-                parts[1],
-                parts[3],
-                parts[9],
-            )
-            upvotes = int(parts[5]) if parts[5].isdigit() else 0
-            downvotes = int(parts[6]) if parts[6].isdigit() else 0
-            score = upvotes - downvotes
-
-            if (
-                ACCENT_LABEL == "Slavic"
-            ):  # Special Case for slavic langagues, may delete later
-                regex = re.compile(
-                    r"\b(Slavic|Polish|Czech|Russian|Ukrainian|Bulgarian| \
+    if ACCENT_LABEL == "Slavic":  # Special Case for slavic langagues, may delete later
+        regex = re.compile(
+            r"\b(Slavic|Polish|Czech|Russian|Ukrainian|Bulgarian| \
                                 Croatian|Slovak|Slovenian|Serbian|Latvian|Lithuanian| \
                                 Hungarian|Romanian|Kazakh|Azerbaijani|Georgian|Moldovan)\b",
-                    re.IGNORECASE,
-                )
-            else:
-                regex = re.compile(rf"^{re.escape(ACCENT_LABEL)}$", re.IGNORECASE)
-
-            if client_id in used_clients:
-                continue
-            if not regex.search(accent):
-                continue
-
-            audio_path = os.path.join(clips_path, filename)
-            if not os.path.exists(audio_path):
-                continue
-            if sf.info(audio_path).frames < min_frames:
-                continue
-
-            used_clients.add(client_id)
-            entries.append((score, filename, transcript))
-
-    entries.sort(key=lambda x: (x[0] != 0, -x[0]))
+            re.IGNORECASE,
+        )
+    else:
+        regex = re.compile(rf"^{re.escape(ACCENT_LABEL)}$", re.IGNORECASE)
 
     temp = tempfile.NamedTemporaryFile(
         delete=False, mode="w", encoding="utf-8", suffix=".tsv"
     )
-    for score, filename, transcript in entries:
-        temp.write(f"{filename}\t{transcript}\n")
+    with ExternalSorter() as sorter:
+        for chunk in iter_chunks(tsv_path, accent_patterns=[regex]):
+            for i, score in enumerate(chunk.score.tolist()):
+                client_id, filename = chunk.client_id[i], chunk.filename[i]
+                if client_id in used_clients:
+                    continue
+
+                audio_path = os.path.join(clips_path, filename)
+                if not os.path.exists(audio_path):
+                    continue
+                if sf.info(audio_path).frames < min_frames:
+                    continue
+
+                used_clients.add(client_id)
+                sorter.add(score_key(score), filename, chunk.transcript[i])
+
+        for filename, transcript in sorter:
+            temp.write(f"{filename}\t{transcript}\n")
     temp.close()
     print(f"Filtered TSV saved to: {temp.name}")
     return temp.name
 
 
-def get_next_batch(temp_tsv, index) -> bool:
-    EOF = False
-    new_batch = []
+def build_line_index(temp_tsv):
+    """Byte offset of every line in the filtered TSV, so any batch is one seek away."""
+    offsets = []
+    with open(temp_tsv, "rb") as f:
+        offset = 0
+        for line in f:
+            offsets.append(offset)
+            offset += len(line)
+    return offsets
+
+
+def read_batch(temp_tsv, offsets, index):
+    """Returns the (filename, line) pairs of the batch starting at line `index`."""
+    batch = []
+    if index >= len(offsets):
+        return batch
+    with open(temp_tsv, "rb") as f:
+        f.seek(offsets[index])
+        for _ in range(min(BATCH_SIZE, len(offsets) - index)):
+            line = f.readline().decode("utf-8")
+            batch.append((line.split("\t", 1)[0].strip(), line))
+    return batch
+
+
+def stage_batch(batch, target_dir):
+    os.makedirs(target_dir, exist_ok=True)
+    for filename, _ in batch:
+        src_file = os.path.join(AUDIO_DIR, filename)
+        if os.path.isfile(src_file):
+            materialize(
+                src_file,
+                os.path.join(target_dir, filename),
+                MATERIALIZE_MODE,
+                materialize_stats,
+            )
 
+
+class BatchPrefetcher(threading.Thread):
+    """Materializes the next batch into a staging folder during labeling."""
+
+    def __init__(self, temp_tsv, offsets, index, staging_dir):
+        super().__init__(daemon=True)
+        self.batch = read_batch(temp_tsv, offsets, index)
+        self.staging_dir = staging_dir
+
+    def run(self):
+        stage_batch(self.batch, self.staging_dir)
+
+    def publish(self, batch_dir):
+        """Waits for the prefetch, moves the staged files into the labeling folder."""
+        self.join()
+        for filename, _ in self.batch:
+            staged = os.path.join(self.staging_dir, filename)
+            if os.path.exists(staged):
+                os.replace(staged, os.path.join(batch_dir, filename))
+        return self.batch
+
+
+def get_next_batch(temp_tsv, offsets, index):
+    """
+    Puts the batch starting at line `index` into the labeling folder and returns
+    (batch, EOF).
+    """
     batch_dir = os.path.join(OUTPUT_FOLDER_NAME, "Data_to_label")
+    batch = read_batch(temp_tsv, offsets, index)
+    stage_batch(batch, batch_dir)
+    return batch, index + BATCH_SIZE >= len(offsets)
 
-    with open(temp_tsv, "r", encoding="utf-8") as f:
-        for _ in range(index):
-            next(f, None)
-        for _ in range(BATCH_SIZE):
-            line = f.readline()
-            if not line:
-                EOF = True
-                break
-            parts = line.strip().split("\t")
-            filename = parts[0]
-            new_batch.append(filename)
-            src_file = os.path.join(AUDIO_DIR, filename)
-            dst_file = os.path.join(batch_dir, filename)
-            if os.path.isfile(src_file):
-                shutil.copy2(src_file, dst_file)
-
-    print(f"Prepared {len(new_batch)} files in batch.")
-    if len(new_batch) == 0:
+
+def _report_batch(batch):
+    print(f"Prepared {len(batch)} files in batch.")
+    if len(batch) == 0:
         print(
             "No files that specify criteria were found, check if choosen accent is in the dataset"
         )
 
-    return EOF
-
 
 def main():
     batch_dir = os.path.join(OUTPUT_FOLDER_NAME, "Data_to_label")
+    staging_dir = os.path.join(OUTPUT_FOLDER_NAME, ".next_batch")
     dst_dir = os.path.join(OUTPUT_FOLDER_NAME, "Filtered")
     os.makedirs(batch_dir, exist_ok=True)
     os.makedirs(dst_dir)
 
     temp_tsv = filter_and_sort_tsv()
+    offsets = build_line_index(temp_tsv)
     index = 0
 
-    EOF = get_next_batch(temp_tsv, index)
+    batch, EOF = get_next_batch(temp_tsv, offsets, index)
+    _report_batch(batch)
     index += BATCH_SIZE
+    prefetch = BatchPrefetcher(temp_tsv, offsets, index, staging_dir)
+    prefetch.start()
 
     while True:
         user_input = input("Press 'enter' to save current batch, press 'q' to quit \n")
@@ -147,30 +198,36 @@ def main():
             break
 
         if user_input == "":
-            approved_files = [f for f in os.listdir(batch_dir) if f.endswith(".mp3")]
+            approved_files = {f for f in os.listdir(batch_dir) if f.endswith(".mp3")}
             for f in approved_files:
                 shutil.move(
                     os.path.join(batch_dir, f),
                     os.path.join(dst_dir, f),
                 )
 
-            with open(temp_tsv, "r", encoding="utf-8") as f_in, open(
+            with open(
                 os.path.join(OUTPUT_FOLDER_NAME, "labeled.tsv"), "a", encoding="utf-8"
             ) as f_out:
-                for line in f_in:
-                    if line.split("\t")[0] in approved_files:
+                for filename, line in batch:
+                    if filename in approved_files:
                         f_out.write(line)
 
             if count_files(dst_dir) >= SIZE:
                 break
+            if EOF:
+                break
 
-            EOF = get_next_batch(temp_tsv, index)
+            batch = prefetch.publish(batch_dir)
+            _report_batch(batch)
+            EOF = index + BATCH_SIZE >= len(offsets)
             index += BATCH_SIZE
+            prefetch = BatchPrefetcher(temp_tsv, offsets, index, staging_dir)
+            prefetch.start()
 
-        if EOF:
-            break
-
+    prefetch.join()
     shutil.rmtree(batch_dir)
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    materialize_stats.report()
 
 
 import argparse
@@ -0,0 +1,131 @@
+"""
+Zero-copy dataset materialization.
+
+Putting a Common Voice clip into a dataset folder doesn't need a copy of its bytes. In
+"auto" mode `materialize` tries, in order:
+
+1. a hardlink (same filesystem, no data written at all)
+2. a reflink via the FICLONE ioctl (btrfs, XFS, ... share extents copy-on-write)
+3. os.copy_file_range (copied inside the kernel, server side on NFS)
+4. a regular shutil.copy2
+
+"virtual" mode writes nothing: the caller records the original clip path in its TSV and
+downstream stages read the clip from the corpus directly.
+
+Hardlinked files share their data with the corpus, so edit them only by replacing them;
+deleting a link (as when labeling) never touches the original clip.
+"""
+
+import fcntl
+import os
+import shutil
+import threading
+import time
+from collections import Counter
+
+FICLONE = 0x40049409  # _IOW(0x94, 9, int) from linux/fs.h
+
+MODES = ["auto", "hardlink", "reflink", "copy", "virtual"]
+
+
+class MaterializeStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.methods = Counter()
+        self.files = 0
+        self.bytes_total = 0
+        self.bytes_written = 0
+        self.started = time.perf_counter()
+
+    def add(self, method, size):
+        with self.lock:
+            self.methods[method] += 1
+            self.files += 1
+            self.bytes_total += size
+            if method in ("copy_file_range", "copy"):
+                self.bytes_written += size
+
+    def report(self):
+        elapsed = time.perf_counter() - self.started
+        methods = ", ".join(f"{m}: {n}" for m, n in self.methods.most_common())
+        print(
+            f"📦 Materialized {self.files} files ({self.bytes_total / 1e6:.1f} MB) in "
+            f"{elapsed:.2f} s, {self.files / elapsed if elapsed else 0:.1f} files/s"
+        )
+        print(f"   Bytes written: {self.bytes_written / 1e6:.1f} MB ({methods})")
+
+
+def _hardlink(src, dst):
+    os.link(src, dst)
+
+
+def _reflink(src, dst):
+    with open(src, "rb") as s, open(dst, "wb") as d:
+        try:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        except OSError:
+            d.close()
+            os.remove(dst)
+            raise
+
+
+def _copy_file_range(src, dst):
+    with open(src, "rb") as s, open(dst, "wb") as d:
+        remaining = os.fstat(s.fileno()).st_size
+        try:
+            while remaining > 0:
+                copied = os.copy_file_range(s.fileno(), d.fileno(), remaining)
+                if copied == 0:
+                    break
+                remaining -= copied
+        except OSError:
+            d.close()
+            os.remove(dst)
+            raise
+
+
+def materialize(src, dst, mode="auto", stats=None):
+    """
+    Makes `src` available at `dst` and returns the method used. In virtual mode
+    nothing is written and the caller is expected to reference `src` directly.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown materialize mode {mode}, use one of {MODES}")
+    size = os.path.getsize(src)
+
+    if mode == "virtual":
+        if stats is not None:
+            stats.add("virtual", size)
+        return "virtual"
+
+    if os.path.lexists(dst):
+        os.remove(dst)
+
+    attempts = {
+        "auto": [
+            ("hardlink", _hardlink),
+            ("reflink", _reflink),
+            ("copy_file_range", _copy_file_range),
+        ],
+        "hardlink": [("hardlink", _hardlink)],
+        "reflink": [("reflink", _reflink)],
+        "copy": [],
+    }[mode]
+
+    for method, func in attempts:
+        if method == "copy_file_range" and not hasattr(os, "copy_file_range"):
+            continue
+        try:
+            func(src, dst)
+        except OSError:
+            continue
+        if stats is not None:
+            stats.add(method, size)
+        return method
+
+    if mode in ("hardlink", "reflink"):
+        print(f"⚠️ {mode} not possible for {src}, copying instead")
+    shutil.copy2(src, dst)
+    if stats is not None:
+        stats.add("copy", size)
+    return "copy"
@@ -1,7 +1,18 @@
 import argparse
 import os
 import re
-import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+import soundfile as sf
+
+try:
+    from helper_scripts.materialize import MODES, MaterializeStats, materialize
+    from helper_scripts.tsv_scan import iter_chunks
+    from helper_scripts.external_sort import ExternalSorter, score_key
+except ImportError:  # run as a script from helper_scripts/
+    from materialize import MODES, MaterializeStats, materialize
+    from tsv_scan import iter_chunks
+    from external_sort import ExternalSorter, score_key
 
 BIG_DATA_PATH = "data/cv-corpus-21.0-2025-03-14/en"
 SMALL_DATA_PATH = "data/cv-corpus-20.0-delta-2024-12-06/en"
@@ -10,89 +21,130 @@ TSV_FILE = "validated.tsv"
 CLIPS_DIR = "clips"
 
 
-def parse_line(line):
-    parts = line.strip().split("\t")
-    if len(parts) < 10 or parts[0] == "client_id":
-        return None
-    return {
-        "client_id": parts[0],
-        "filename": parts[1],
-        "transcript": parts[3],
-        "upvotes": int(parts[5]) if parts[5].isdigit() else 0,
-        "downvotes": int(parts[6]) if parts[6].isdigit() else 0,
-        "accent": parts[9],
-    }
-
+def sorted_candidates(tsv_path, regex, polish_regex=None, sorter=None):
+    """
+    Feeds the matching rows into an ExternalSorter as (client_id, filename,
+    transcript, score, accent) and returns (sorter, number of accent matches).
+    Injected Polish clips sort first (in TSV order), then clips with score 0, then by
+    descending score. The TSV is streamed chunk by chunk, so only one chunk and the
+    sorter's current run are held as Python objects.
+    """
+    patterns = [regex] if polish_regex is None else [polish_regex, regex]
+    if sorter is None:
+        sorter = ExternalSorter()
+    found = 0
+    for chunk in iter_chunks(tsv_path, accent_patterns=patterns):
+        polish = (
+            chunk.accent_mask(polish_regex)
+            if polish_regex is not None
+            else [False] * len(chunk)
+        )
+        for i, score in enumerate(chunk.score.tolist()):
+            if polish[i]:
+                key = (0, 0, 0)
+            else:
+                key = (1,) + score_key(score)
+                found += 1
+            sorter.add(
+                key,
+                chunk.client_id[i],
+                chunk.filename[i],
+                chunk.transcript[i],
+                str(score),
+                chunk.accent(i),
+            )
+    return sorter, found
 
-def create_set(data_path, accent_regex, name, size, output_dir, inject_polish=False):
-    tsv_path = os.path.join(data_path, TSV_FILE)
-    clips_path = os.path.join(data_path, CLIPS_DIR)
-    output_dir = os.path.join(output_dir, f"{name}_clips")
-    output_tsv = os.path.join(output_dir, f"{name}.tsv")
 
-    os.makedirs(output_dir, exist_ok=True)
+def select_clips(candidates, size, is_valid):
+    """
+    Picks the best valid clip of each speaker, best speakers first, until `size`
+    clips are selected. `candidates` come in sort order, so the first valid clip of a
+    speaker is their best one; the merge is only read as far as needed to fill `size`.
+    """
+    selected = []
+    speakers = set()
+    for clip in candidates:
+        if len(selected) >= size:
+            break
+        if clip[0] in speakers:
+            continue
+        if is_valid(clip):
+            speakers.add(clip[0])
+            selected.append(clip)
+    return selected
 
-    regex = re.compile(accent_regex, re.IGNORECASE)
-    polish_regex = re.compile(r"pol", re.IGNORECASE)
 
-    entries = []
-    polish_entries = []
+def materialize_clips(pairs, mode="auto", workers=16):
+    """
+    Materializes (src, dst) pairs with a thread pool (see materialize.py), I/O bound
+    so threads are enough. Returns the stats.
+    """
+    stats = MaterializeStats()
 
-    with open(tsv_path, "r", encoding="utf-8") as f:
-        for line in f:
-            entry = parse_line(line)
-            if not entry:
-                continue
+    def run(pair):
+        src, dst = pair
+        if os.path.exists(src):
+            materialize(src, dst, mode, stats)
+        else:
+            print(f"⚠️ File not found: {src}")
 
-            if inject_polish and polish_regex.search(entry["accent"]):
-                polish_entries.append(entry)
-            elif regex.search(entry["accent"]):
-                score = entry["upvotes"] - entry["downvotes"]
-                entries.append((score, entry))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(run, pairs))
+    stats.report()
+    return stats
 
-    print(f"Found {len(entries)} entries for {name} accent.")
 
-    entries.sort(key=lambda x: (x[0] != 0, -x[0]))
-    sorted_entries = [e for _, e in entries]
+def create_set(
+    data_path,
+    accent_regex,
+    name,
+    size,
+    output_dir,
+    inject_polish=False,
+    materialize_mode="auto",
+):
+    """
+    With materialize_mode="virtual" no clips are written, the TSV holds absolute
+    paths into the corpus clips folder instead of bare filenames.
+    """
+    tsv_path = os.path.join(data_path, TSV_FILE)
+    clips_path = os.path.join(data_path, CLIPS_DIR)
+    output_dir = os.path.join(output_dir, f"{name}_clips")
+    output_tsv = os.path.join(output_dir, f"{name}.tsv")
 
-    if inject_polish:
-        full_list = polish_entries + sorted_entries
-    else:
-        full_list = sorted_entries
+    os.makedirs(output_dir, exist_ok=True)
 
-    used_clients = set()
-    selected = []
+    regex = re.compile(accent_regex, re.IGNORECASE)
+    polish_regex = re.compile(r"pol", re.IGNORECASE) if inject_polish else None
 
-    for entry in full_list:
-        if entry["client_id"] in used_clients:
-            continue
-        # check if audio is of current length
-        if not os.path.exists(os.path.join(clips_path, entry["filename"])):
-            print(f"⚠️ File not found: {entry['filename']}")
-            continue
+    def is_valid(clip):
+        path = os.path.join(clips_path, clip[1])
+        if not os.path.exists(path):
+            print(f"⚠️ File not found: {clip[1]}")
+            return False
         # check if audio is of current length
-        import soundfile as sf
-
-        info = sf.info(os.path.join(clips_path, entry["filename"]))
         min_samples = 1024
-        if info.frames < min_samples:
-            continue
-        used_clients.add(entry["client_id"])
-        selected.append(entry)
-        if len(selected) >= size:
-            break
+        return sf.info(path).frames >= min_samples
+
+    with ExternalSorter() as sorter:
+        _, found = sorted_candidates(tsv_path, regex, polish_regex, sorter)
+        print(f"Found {found} entries for {name} accent.")
+        selected = select_clips(sorter, size, is_valid)
 
     with open(output_tsv, "w", encoding="utf-8") as out:
-        for entry in selected:
-            out.write(
-                f"{entry['filename']}\t{entry['transcript']}\t{entry["upvotes"] - entry["downvotes"]}\t{entry['accent']}\n"
-            )
-            src = os.path.join(clips_path, entry["filename"])
-            dst = os.path.join(output_dir, entry["filename"])
-            if os.path.exists(src):
-                shutil.copy(src, dst)
-            else:
-                print(f"⚠️ File not found: {src}")
+        for client_id, filename, transcript, score, accent in selected:
+            if materialize_mode == "virtual":
+                filename = os.path.abspath(os.path.join(clips_path, filename))
+            out.write(f"{filename}\t{transcript}\t{score}\t{accent}\t{client_id}\n")
+
+    materialize_clips(
+        [
+            (os.path.join(clips_path, clip[1]), os.path.join(output_dir, clip[1]))
+            for clip in selected
+        ],
+        materialize_mode,
+    )
 
 
 if __name__ == "__main__":
@@ -115,6 +167,13 @@ if __name__ == "__main__":
         default="big_data",
         help="Chooses from the smaller or bigger dataset",
     )
+    parser.add_argument(
+        "--materialize",
+        type=str,
+        choices=MODES,
+        default="auto",
+        help="How clips get into the dataset: auto tries hardlink, reflink, then copy",
+    )
 
     args = parser.parse_args()
 
@@ -131,9 +190,21 @@ if __name__ == "__main__":
     print(f"Output directory: {args.output}")
     print(f"Size of each group: {args.size}")
 
-    create_set(DATA_PATH, r"^England English$", "british", args.size, args.output)
     create_set(
-        DATA_PATH, r"^United States English$", "american", args.size, args.output
+        DATA_PATH,
+        r"^England English$",
+        "british",
+        args.size,
+        args.output,
+        materialize_mode=args.materialize,
+    )
+    create_set(
+        DATA_PATH,
+        r"^United States English$",
+        "american",
+        args.size,
+        args.output,
+        materialize_mode=args.materialize,
     )
     create_set(
         DATA_PATH,
@@ -142,10 +213,13 @@ if __name__ == "__main__":
         args.size,
         args.output,
         inject_polish=True,
+        materialize_mode=args.materialize,
     )
 
 
-def pick_audio(size=1000, output="data/new_dataset", input="big_data"):
+def pick_audio(
+    size=1000, output="data/new_dataset", input="big_data", materialize_mode="auto"
+):
     if input == "big_data":
         DATA_PATH = BIG_DATA_PATH
     elif input == "small_data":
@@ -158,8 +232,24 @@ def pick_audio(size=1000, output="data/new_dataset", input="big_data"):
     print(f"Output directory: {output}")
     print(f"Size of each group: {size}")
     print("Creating dataset...")
-    create_set(DATA_PATH, r"^England English$", "british", size, output)
-    create_set(DATA_PATH, r"^United States English$", "american", size, output)
+    create_set(
+        DATA_PATH,
+        r"^England English$",
+        "british",
+        size,
+        output,
+        False,
+        materialize_mode,
+    )
+    create_set(
+        DATA_PATH,
+        r"^United States English$",
+        "american",
+        size,
+        output,
+        False,
+        materialize_mode,
+    )
     # create_set(DATA_PATH, r"^Irish English$", "irish", size, output)
     # create_set(DATA_PATH, r"^Scottish English$", "scottish", size, output)
     # create_set(DATA_PATH, r"^Australian English$", "australian", size, output)
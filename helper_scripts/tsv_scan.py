@@ -0,0 +1,289 @@
+"""
+Parallel scanner for Common Voice TSVs (validated.tsv).
+
+The file is split into byte ranges that end on line boundaries and every range is parsed
+in its own worker process. A worker keeps only the rows whose accent matches one of the
+given patterns (each distinct accent string is matched once, not once per row) and
+returns compact columns: accents interned to int32 ids, votes as int16 and only the
+string columns that were asked for (or client_ids hashed to uint64). The chunks are
+merged in file order, so row order is the same as in the TSV.
+
+Column positions come from the header, cv-corpus-10 and cv-corpus-21 put the accents
+and votes in different columns. Files without a header use the cv-corpus-21 layout.
+
+    table = scan_tsv("validated.tsv", accent_patterns=[re.compile(r"^Filipino$")])
+    for i in range(len(table)):
+        table.client_id[i], table.filename[i], table.score[i], table.accent(i)
+
+iter_chunks yields the same rows one chunk at a time, so a consumer that only streams
+the rows (e.g. into an ExternalSorter) never holds more than a few chunks:
+
+    for chunk in iter_chunks("validated.tsv", accent_patterns=patterns):
+        for i, score in enumerate(chunk.score.tolist()):
+            sorter.add(score_key(score), chunk.filename[i])
+"""
+
+import hashlib
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Field name -> header names used by the Common Voice releases
+HEADER_NAMES = {
+    "client_id": ["client_id"],
+    "filename": ["path"],
+    "transcript": ["sentence"],
+    "upvotes": ["up_votes"],
+    "downvotes": ["down_votes"],
+    "accent": ["accents", "accent"],
+}
+# cv-corpus-21 layout, used when the file has no header
+DEFAULT_COLUMNS = {
+    "client_id": 0,
+    "filename": 1,
+    "transcript": 3,
+    "upvotes": 5,
+    "downvotes": 6,
+    "accent": 9,
+}
+STRING_FIELDS = ("client_id", "filename", "transcript")
+# 8 byte hash of the client_id instead of the string, for counting speakers
+HASH_FIELD = "client_hash"
+
+# Below this size the file is parsed in-process, spawning workers costs more
+MIN_PARALLEL_BYTES = 8 << 20
+CHUNK_BYTES = 32 << 20
+INT16_MAX = np.iinfo(np.int16).max
+
+
+def read_columns(tsv_path):
+    """Returns (field -> column index, offset of the first data row)."""
+    with open(tsv_path, "rb") as f:
+        first = f.readline()
+    header = first.decode("utf-8").rstrip("\r\n").split("\t")
+    if "client_id" not in header:
+        return dict(DEFAULT_COLUMNS), 0
+
+    columns = {}
+    for field, names in HEADER_NAMES.items():
+        for name in names:
+            if name in header:
+                columns[field] = header.index(name)
+                break
+        else:
+            raise ValueError(f"{tsv_path} has no {names[0]} column")
+    return columns, len(first)
+
+
+def chunk_ranges(tsv_path, start, chunk_bytes=CHUNK_BYTES):
+    """Splits [start, EOF) into (begin, end) byte ranges that end on line boundaries."""
+    size = os.path.getsize(tsv_path)
+    ranges = []
+    with open(tsv_path, "rb") as f:
+        begin = start
+        while begin < size:
+            f.seek(min(begin + chunk_bytes, size))
+            f.readline()
+            end = min(f.tell(), size)
+            ranges.append((begin, end))
+            begin = end
+    return ranges
+
+
+def client_hash(client_id):
+    return int.from_bytes(
+        hashlib.blake2b(client_id.encode("utf-8"), digest_size=8).digest(), "little"
+    )
+
+
+def parse_votes(value):
+    return min(int(value), INT16_MAX) if value.isdigit() else 0
+
+
+def read_rows(tsv_path, begin, end, columns):
+    """Split lines of the byte range [begin, end), too short lines are skipped."""
+    with open(tsv_path, "rb") as f:
+        f.seek(begin)
+        text = f.read(end - begin).decode("utf-8")
+    min_len = max(columns.values()) + 1
+    for line in text.split("\n"):
+        parts = line.rstrip("\r").split("\t")
+        if len(parts) >= min_len:
+            yield parts
+
+
+def _scan_chunk(tsv_path, begin, end, columns, fields, accent_patterns):
+    accent_col = columns["accent"]
+    up_col, down_col = columns["upvotes"], columns["downvotes"]
+    string_cols = [(field, columns[field]) for field in fields if field != HASH_FIELD]
+    hash_col = columns["client_id"] if HASH_FIELD in fields else None
+
+    accent_ids = {}
+    accent_names = []
+    matches = {}
+    strings = {field: [] for field in fields if field != HASH_FIELD}
+    accent, upvotes, downvotes, hashes = [], [], [], []
+
+    for parts in read_rows(tsv_path, begin, end, columns):
+        name = parts[accent_col]
+        keep = matches.get(name)
+        if keep is None:
+            keep = accent_patterns is None or any(
+                p.search(name) for p in accent_patterns
+            )
+            matches[name] = keep
+        if not keep:
+            continue
+
+        accent_id = accent_ids.get(name)
+        if accent_id is None:
+            accent_id = accent_ids[name] = len(accent_names)
+            accent_names.append(name)
+        accent.append(accent_id)
+        upvotes.append(parse_votes(parts[up_col]))
+        downvotes.append(parse_votes(parts[down_col]))
+        for field, col in string_cols:
+            strings[field].append(parts[col])
+        if hash_col is not None:
+            hashes.append(client_hash(parts[hash_col]))
+
+    return {
+        "accent_names": accent_names,
+        "accent": np.array(accent, dtype=np.int32),
+        "upvotes": np.array(upvotes, dtype=np.int16),
+        "downvotes": np.array(downvotes, dtype=np.int16),
+        "strings": strings,
+        "client_hash": np.array(hashes, dtype=np.uint64),
+    }
+
+
+class TsvTable:
+    """Merged scan result, one entry per kept row in TSV order."""
+
+    def __init__(self, chunks, fields):
+        ids = {}
+        accent_parts = []
+        for chunk in chunks:
+            remap = np.array(
+                [ids.setdefault(n, len(ids)) for n in chunk["accent_names"]],
+                dtype=np.int32,
+            )
+            accent_parts.append(
+                remap[chunk["accent"]] if len(remap) else chunk["accent"]
+            )
+        self.accents = list(ids)
+
+        self.accent_id = np.concatenate(accent_parts or [np.empty(0, np.int32)])
+        self.upvotes = np.concatenate(
+            [c["upvotes"] for c in chunks] or [np.empty(0, np.int16)]
+        )
+        self.downvotes = np.concatenate(
+            [c["downvotes"] for c in chunks] or [np.empty(0, np.int16)]
+        )
+        if HASH_FIELD in fields:
+            self.client_hash = np.concatenate(
+                [c["client_hash"] for c in chunks] or [np.empty(0, np.uint64)]
+            )
+        for field in fields:
+            if field == HASH_FIELD:
+                continue
+            column = []
+            for chunk in chunks:
+                column.extend(chunk["strings"][field])
+            setattr(self, field, column)
+
+    def __len__(self):
+        return len(self.accent_id)
+
+    @property
+    def score(self):
+        return self.upvotes.astype(np.int32) - self.downvotes
+
+    def accent(self, i):
+        return self.accents[self.accent_id[i]]
+
+    def accent_mask(self, regex):
+        """Rows whose accent matches `regex`, matched once per distinct accent."""
+        hits = np.array([bool(regex.search(a)) for a in self.accents], dtype=bool)
+        return hits[self.accent_id] if len(hits) else np.zeros(len(self), dtype=bool)
+
+
+def map_chunks(func, tsv_path, *args, workers=None):
+    """
+    Calls func(tsv_path, begin, end, columns, *args) for every byte range of the file
+    in worker processes and yields the results in file order. `func` must be a module
+    level function. At most two ranges per worker are in flight, so results don't pile
+    up when the consumer is slower than the workers.
+    """
+    columns, start = read_columns(tsv_path)
+    ranges = chunk_ranges(tsv_path, start)
+
+    if len(ranges) <= 1 or os.path.getsize(tsv_path) < MIN_PARALLEL_BYTES:
+        for begin, end in ranges:
+            yield func(tsv_path, begin, end, columns, *args)
+        return
+
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for begin, end in ranges:
+            pending.append(pool.submit(func, tsv_path, begin, end, columns, *args))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def _check_fields(fields):
+    fields = tuple(fields)
+    unknown = set(fields) - set(STRING_FIELDS) - {HASH_FIELD}
+    if unknown:
+        raise ValueError(
+            f"Unknown fields {sorted(unknown)}, use {STRING_FIELDS + (HASH_FIELD,)}"
+        )
+    return fields
+
+
+def iter_chunks(tsv_path, fields=STRING_FIELDS, accent_patterns=None, workers=None):
+    """
+    Like scan_tsv, but yields one TsvTable per chunk in file order instead of merging
+    them. Accent ids are local to each chunk, use chunk.accent(i) or accent_mask.
+    """
+    fields = _check_fields(fields)
+    for chunk in map_chunks(
+        _scan_chunk, tsv_path, fields, accent_patterns, workers=workers
+    ):
+        yield TsvTable([chunk], fields)
+
+
+def scan_tsv(tsv_path, fields=STRING_FIELDS, accent_patterns=None, workers=None):
+    """
+    Scans `tsv_path` and returns a TsvTable with the rows whose accent matches any of
+    `accent_patterns` (compiled regexes, None keeps every row). `fields` are the
+    string columns to keep, plus "client_hash" for hashed client_ids. Accents and
+    votes are always kept.
+    """
+    fields = _check_fields(fields)
+    chunks = list(
+        map_chunks(_scan_chunk, tsv_path, fields, accent_patterns, workers=workers)
+    )
+    return TsvTable(chunks, fields)
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("tsv", type=str, help="Path to a Common Voice TSV")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    table = scan_tsv(args.tsv, workers=args.workers)
+    print(
+        f"Scanned {len(table)} rows, {len(table.accents)} distinct accents in "
+        f"{time.perf_counter() - start:.2f} s"
+    )
@@ -0,0 +1,179 @@
+"""
+Per-stage timing and throughput instrumentation shared by the pipeline scripts.
+
+Wrap a piece of work in `stage("name")` (or decorate a function with `@timed("name")`)
+and every call records wall time, CPU time, bytes read/written by the process and the
+number of items processed. `print_summary()` prints a per-stage table at the end of a
+run:
+
+    enable()  # in the script's __main__
+
+    with stage("denoise", path=wav_path):
+        denoise_wav(wav_path)
+
+    print_summary()
+
+Recording is off until `enable()` is called or the PIPELINE_METRICS env variable is set,
+so library use (the server, benchmarks) pays nothing. Each record is appended as one
+JSON line to the metrics log only when a path is given, through PIPELINE_METRICS or
+`enable(log_path)`; otherwise only the per-stage totals are kept.
+
+Bytes come from /proc/self/io, so I/O done by child processes (ffmpeg) is not counted,
+and they are reported as 0 on systems without /proc.
+"""
+
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+METRICS_LOG = os.environ.get("PIPELINE_METRICS") or None
+RUN_ID = f"{os.path.basename(sys.argv[0]) or 'python'}-{os.getpid()}-{int(time.time())}"
+
+_lock = threading.Lock()
+_enabled = METRICS_LOG is not None
+_totals = defaultdict(
+    lambda: {"calls": 0, "wall_s": 0.0, "cpu_s": 0.0, "read": 0, "write": 0, "items": 0}
+)
+
+
+def enable(log_path=None):
+    """
+    Starts recording stages in this process. Per-call records go to `log_path`, or to
+    PIPELINE_METRICS when it is set; with neither only the totals are kept.
+    """
+    global _enabled, METRICS_LOG
+    with _lock:
+        _enabled = True
+        if log_path is not None:
+            METRICS_LOG = log_path
+
+
+def disable():
+    """Stops recording and drops the totals, e.g. for a long-running server."""
+    global _enabled, METRICS_LOG
+    with _lock:
+        _enabled = False
+        METRICS_LOG = None
+        _totals.clear()
+
+
+def _io_counters():
+    try:
+        with open("/proc/self/io", "r") as f:
+            fields = dict(line.split(": ") for line in f.read().splitlines())
+        return int(fields["rchar"]), int(fields["wchar"])
+    except (OSError, KeyError, ValueError):
+        return 0, 0
+
+
+def _record(name, wall, cpu, bytes_read, bytes_written, items, extra):
+    entry = {
+        "run": RUN_ID,
+        "stage": name,
+        "wall_s": round(wall, 6),
+        "cpu_s": round(cpu, 6),
+        "bytes_read": bytes_read,
+        "bytes_written": bytes_written,
+        "items": items,
+        "items_per_s": round(items / wall, 3) if wall > 0 else None,
+        **extra,
+    }
+    with _lock:
+        if not _enabled:
+            return
+        totals = _totals[name]
+        totals["calls"] += 1
+        totals["wall_s"] += wall
+        totals["cpu_s"] += cpu
+        totals["read"] += bytes_read
+        totals["write"] += bytes_written
+        totals["items"] += items
+        if METRICS_LOG:
+            with open(METRICS_LOG, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+
+
+class _Stage:
+    def __init__(self, items):
+        self.items = items
+
+    def add_items(self, n):
+        self.items += n
+
+
+@contextmanager
+def stage(name, items=1, **extra):
+    """
+    Times the enclosed block. `items` is how many things the block processes; it can be
+    changed from inside with `s.items = n` or `s.add_items(n)` on the yielded object.
+    CPU time is process-wide, so it is only meaningful for stages that don't overlap
+    with other threads.
+    """
+    s = _Stage(items)
+    if not _enabled:
+        yield s
+        return
+    read0, write0 = _io_counters()
+    cpu0 = time.process_time()
+    wall0 = time.perf_counter()
+    try:
+        yield s
+    finally:
+        wall = time.perf_counter() - wall0
+        cpu = time.process_time() - cpu0
+        read1, write1 = _io_counters()
+        _record(name, wall, cpu, read1 - read0, write1 - write0, s.items, extra)
+
+
+def timed(name=None):
+    """Decorator version of `stage`, one item per call."""
+
+    def decorator(func):
+        stage_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(stage_name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def _format_bytes(n):
+    for unit in ["B", "KB", "MB", "GB"]:
+        if abs(n) < 1024:
+            return f"{n:.0f}{unit}"
+        n /= 1024
+    return f"{n:.1f}TB"
+
+
+def summary():
+    with _lock:
+        return {name: dict(values) for name, values in _totals.items()}
+
+
+def print_summary():
+    totals = summary()
+    if not totals:
+        return
+    total_wall = sum(t["wall_s"] for t in totals.values()) or 1.0
+    header = f"{'stage':<24}{'calls':>8}{'wall s':>10}{'cpu s':>10}{'share':>8}{'read':>9}{'write':>9}{'items/s':>10}"
+    print(f"\n📊 Stage summary ({RUN_ID})")
+    print(header)
+    print("-" * len(header))
+    for name, t in sorted(totals.items(), key=lambda x: -x[1]["wall_s"]):
+        rate = t["items"] / t["wall_s"] if t["wall_s"] > 0 else 0.0
+        print(
+            f"{name:<24}{t['calls']:>8}{t['wall_s']:>10.2f}{t['cpu_s']:>10.2f}"
+            f"{t['wall_s'] / total_wall:>8.1%}{_format_bytes(t['read']):>9}"
+            f"{_format_bytes(t['write']):>9}{rate:>10.2f}"
+        )
+    if METRICS_LOG:
+        print(f"Per-call records appended to {METRICS_LOG}")
@@ -0,0 +1,83 @@
+"""
+Load generator for serve.py.
+
+Sends the given audio files to /predict from `concurrency` threads and prints the
+client side latency percentiles and throughput, followed by the server's /metrics.
+"""
+
+import json
+import os
+import threading
+import time
+import urllib.request
+
+import numpy as np
+
+
+def post_audio(url, data, ext):
+    request = urllib.request.Request(
+        f"{url}/predict?ext={ext}",
+        data=data,
+        headers={"Content-Type": "application/octet-stream"},
+        method="POST",
+    )
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+
+def load_test(url, audio_files, requests=200, concurrency=8):
+    payloads = []
+    for path in audio_files:
+        with open(path, "rb") as f:
+            payloads.append((f.read(), os.path.splitext(path)[1].lstrip(".")))
+
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    counter = iter(range(requests))
+
+    def worker():
+        nonlocal errors
+        for i in counter:
+            data, ext = payloads[i % len(payloads)]
+            start = time.perf_counter()
+            try:
+                post_audio(url, data, ext)
+            except Exception as e:
+                with lock:
+                    errors += 1
+                print(f"❌ Request failed: {e}")
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    latencies = np.array(latencies) * 1000
+    print(f"Requests: {len(latencies)} ok, {errors} failed in {elapsed:.2f} s")
+    if len(latencies):
+        print(f"Throughput: {len(latencies) / elapsed:.2f} req/s")
+        print(f"Latency p50: {np.percentile(latencies, 50):.1f} ms")
+        print(f"Latency p99: {np.percentile(latencies, 99):.1f} ms")
+
+    with urllib.request.urlopen(f"{url}/metrics") as response:
+        print("Server metrics:", json.loads(response.read()))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("audio_files", nargs="+", help="Audio files to send")
+    parser.add_argument("--url", type=str, default="http://127.0.0.1:8000")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    load_test(args.url, args.audio_files, args.requests, args.concurrency)
@@ -1,16 +1,206 @@
+import argparse
+import hashlib
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
 import pandas as pd
 import numpy as np
 from PIL import Image
 from datasets import Dataset as HFDataset, Features, ClassLabel, Value
 from sklearn.model_selection import train_test_split
 import evaluate
+import torch
+import torch.nn.functional as F
 from transformers import (
-    ViTForImageClassification,
-    ViTImageProcessor,
+    AutoConfig,
+    AutoImageProcessor,
+    AutoModelForImageClassification,
     TrainingArguments,  # type: ignore
     Trainer,  # type: ignore
 )
-from transformers.trainer_callback import EarlyStoppingCallback  # type: ignore
+from transformers.trainer_callback import (  # type: ignore
+    EarlyStoppingCallback,
+    TrainerCallback,
+)
+
+from export_model import load_processor
+
+# Short names for the backbones we train, smallest last. Any other Hugging Face
+# model id (or a local checkpoint directory) can still be passed as model_name.
+MODEL_PRESETS = {
+    "vit-base": "google/vit-base-patch16-224-in21k",  # ~86M params
+    "deit-small": "facebook/deit-small-patch16-224",  # ~22M params, ViT-S
+    "deit-tiny": "facebook/deit-tiny-patch16-224",  # ~5.7M params, ViT-Ti
+    "mobilevit-small": "apple/mobilevit-small",  # ~5.6M params
+    "mobilevit-x-small": "apple/mobilevit-x-small",  # ~2.3M params
+    "mobilevit-xx-small": "apple/mobilevit-xx-small",  # ~1.3M params
+}
+
+
+def resolve_model_name(model_name):
+    return MODEL_PRESETS.get(model_name, model_name)
+
+
+def parse_subsample(value):
+    """
+    --eval_subsample: an integer is a number of images (>= 1), anything else a
+    fraction of the validation set in (0, 1].
+    """
+    try:
+        count = int(value)
+    except ValueError:
+        count = None
+    if count is not None:
+        if count < 1:
+            raise argparse.ArgumentTypeError(f"{value} images, need at least 1")
+        return count
+    try:
+        fraction = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{value} is not a count or a fraction")
+    if not 0 < fraction <= 1:
+        raise argparse.ArgumentTypeError(f"fraction {value} is not in (0, 1]")
+    return fraction
+
+
+def subsample_size(eval_subsample, total):
+    """
+    Number of validation images `eval_subsample` (a count or a fraction) asks for,
+    None when it is None or covers the whole validation set.
+    """
+    if eval_subsample is None:
+        return None
+    if isinstance(eval_subsample, float):
+        if not 0 < eval_subsample <= 1:
+            raise ValueError(f"eval_subsample {eval_subsample} is not in (0, 1]")
+        size = max(1, int(round(eval_subsample * total)))
+    else:
+        if eval_subsample < 1:
+            raise ValueError(f"eval_subsample {eval_subsample} is below 1 image")
+        size = eval_subsample
+    return size if size < total else None
+
+
+def cpu_supports_bf16():
+    """True when the CPU has native bf16 instructions (AVX512-BF16 or AMX)."""
+    try:
+        with open("/proc/cpuinfo", "r") as f:
+            flags = f.read()
+    except OSError:
+        return False
+    return "avx512_bf16" in flags or "amx_bf16" in flags
+
+
+def configure_threads(num_threads=None, interop_threads=None):
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    if interop_threads:
+        try:
+            torch.set_num_interop_threads(interop_threads)
+        except RuntimeError:
+            # Can only be set once, before any inter-op parallel work has started
+            print("⚠️ Inter-op threads were already initialized, keeping the default")
+
+
+class DistillationTrainer(Trainer):
+    """
+    Trainer that mixes the usual cross-entropy loss with a KL term against
+    precomputed teacher logits (the "teacher_logits" column of the dataset).
+    """
+
+    def __init__(self, *args, temperature=2.0, alpha=0.5, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.temperature = temperature
+        self.alpha = alpha
+
+    def compute_loss(self, model, inputs, return_outputs=False, **kwargs):
+        teacher_logits = inputs.pop("teacher_logits", None)
+        outputs = model(**inputs)
+        loss = outputs.loss
+
+        if teacher_logits is not None:
+            t = self.temperature
+            distill_loss = F.kl_div(
+                F.log_softmax(outputs.logits / t, dim=-1),
+                F.softmax(teacher_logits / t, dim=-1),
+                reduction="batchmean",
+            ) * (t * t)
+            loss = self.alpha * distill_loss + (1 - self.alpha) * loss
+
+        return (loss, outputs) if return_outputs else loss
+
+
+class AsyncCheckpointCallback(TrainerCallback):
+    """
+    Replaces the Trainer's own checkpointing and early stopping. When an evaluation
+    improves on the best metric, the weights are snapshotted in memory and written to
+    disk by a background thread, so training continues while the checkpoint is saved.
+    Only the best checkpoint is kept (like save_total_limit=1) and the best weights are
+    restored at the end of training (like load_best_model_at_end).
+
+    Only model weights (and the image processor) are written, so these checkpoints
+    can't resume training.
+    """
+
+    def __init__(self, output_dir, metric="eval_accuracy", patience=4, processor=None):
+        self.output_dir = output_dir
+        self.processor = processor
+        self.metric = metric
+        self.patience = patience
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.pending = None
+        self.best = None
+        self.best_state = None
+        self.best_path = None
+        self.bad_evaluations = 0
+
+    def _write(self, model, state_dict, path, previous_path):
+        model.save_pretrained(path, state_dict=state_dict)
+        if self.processor is not None:
+            self.processor.save_pretrained(path)
+        if previous_path is not None and previous_path != path:
+            shutil.rmtree(previous_path, ignore_errors=True)
+
+    def on_evaluate(self, args, state, control, metrics=None, model=None, **kwargs):
+        value = (metrics or {}).get(self.metric)
+        if value is None:
+            return
+        if self.best is not None and value <= self.best:
+            self.bad_evaluations += 1
+            if self.bad_evaluations >= self.patience:
+                control.should_training_stop = True
+            return
+
+        self.best = value
+        self.bad_evaluations = 0
+        # A CPU copy taken before the write is submitted, training keeps updating the
+        # live weights while the thread saves, so they must never be written directly
+        self.best_state = {
+            k: v.detach().to("cpu", copy=True) for k, v in model.state_dict().items()
+        }
+        if not state.is_world_process_zero:
+            return
+        # At most one write in flight, a slow disk only blocks if it falls behind
+        if self.pending is not None:
+            self.pending.result()
+        path = os.path.join(self.output_dir, f"checkpoint-{state.global_step}")
+        self.pending = self.executor.submit(
+            self._write, model, self.best_state, path, self.best_path
+        )
+        self.best_path = path
+
+    def on_train_end(self, args, state, control, model=None, **kwargs):
+        # The last write finishes (and its errors surface) before learn() returns
+        try:
+            if self.pending is not None:
+                self.pending.result()
+        finally:
+            self.executor.shutdown(wait=True)
+            self.pending = None
+        if self.best_state is not None:
+            model.load_state_dict(self.best_state)
+            print(f"Loaded best model ({self.metric}={self.best:.4f}) from memory")
 
 
 class Machine:
@@ -19,19 +209,91 @@ class Machine:
         csv_path="spectrogram_dataset.csv",
         num_epochs=20,
         batch_size=64,
-        model_name="google/vit-base-patch16-224-in21k",
+        model_name="vit-base",
         learning_rate=2e-4,
         max_grad_norm=1.0,
         weight_decay=0.05,
+        output_dir="./results",
+        teacher_path=None,
+        distill_temperature=2.0,
+        distill_alpha=0.5,
+        dataloader_num_workers=0,
+        cpu_optimized=False,
+        bf16=None,
+        num_threads=None,
+        interop_threads=None,
+        gradient_accumulation_steps=1,
+        channels_last=False,
+        fused_optimizer=None,
+        ddp_backend=None,
+        eval_subsample=None,
+        async_checkpoints=False,
     ):
         # === CONFIG ===
         self.csv_path = csv_path
         self.num_epochs = num_epochs
         self.batch_size = batch_size
-        self.model_name = model_name
+        self.model_name = resolve_model_name(model_name)
         self.learning_rate = learning_rate
         self.max_grad_norm = max_grad_norm
         self.weight_decay = weight_decay
+        self.output_dir = output_dir
+        self.teacher_path = teacher_path
+
+        # === CPU TRAINING MODE ===
+        # batch_size stays the effective batch size, with gradient accumulation
+        # each forward/backward only sees batch_size / gradient_accumulation_steps
+        configure_threads(num_threads, interop_threads)
+        if bf16 is None:
+            bf16 = cpu_optimized and cpu_supports_bf16()
+        if fused_optimizer is None:
+            fused_optimizer = cpu_optimized
+        self.bf16 = bf16
+        self.gradient_accumulation_steps = gradient_accumulation_steps
+        if batch_size % gradient_accumulation_steps != 0:
+            raise ValueError(
+                "batch_size must be divisible by gradient_accumulation_steps"
+            )
+
+        # === DISTRIBUTED ===
+        # Set by ddp_train.launch (or torchrun) for every worker process. Per-epoch
+        # evaluation, early stopping and the best model work as in a single process,
+        # the Trainer shards the evaluation and gathers the predictions.
+        self.world_size = int(os.environ.get("WORLD_SIZE", 1))
+        self.distributed = self.world_size > 1
+        if self.distributed and ddp_backend is None:
+            ddp_backend = "gloo"
+
+        # === TRAINING ARGS ===
+        self.args = TrainingArguments(
+            output_dir=self.output_dir,
+            per_device_train_batch_size=self.batch_size
+            // self.gradient_accumulation_steps,
+            gradient_accumulation_steps=self.gradient_accumulation_steps,
+            num_train_epochs=self.num_epochs,
+            eval_strategy="epoch",
+            logging_strategy="steps",
+            logging_steps=10,
+            save_strategy="no" if async_checkpoints else "epoch",
+            load_best_model_at_end=not async_checkpoints,
+            save_total_limit=1,
+            metric_for_best_model="accuracy",
+            greater_is_better=True,
+            report_to="tensorboard",
+            learning_rate=self.learning_rate,
+            max_grad_norm=self.max_grad_norm,
+            weight_decay=self.weight_decay,
+            warmup_ratio=0.05,
+            logging_dir="./logs",
+            lr_scheduler_type="cosine",
+            # teacher_logits is not a model input, keep it for compute_loss
+            remove_unused_columns=self.teacher_path is None,
+            dataloader_num_workers=dataloader_num_workers,
+            use_cpu=cpu_optimized or self.distributed,
+            ddp_backend=ddp_backend,
+            bf16=self.bf16,
+            optim="adamw_torch_fused" if fused_optimizer else "adamw_torch",
+        )
 
         # === LOAD DATA ===
         df = pd.read_csv(self.csv_path)
@@ -62,7 +324,7 @@ class Machine:
         )
 
         # === LOAD IMAGE PROCESSOR ===
-        self.processor = ViTImageProcessor.from_pretrained(self.model_name)
+        self.processor = AutoImageProcessor.from_pretrained(self.model_name)
 
         # === PREPROCESS FUNCTION ===
         def preprocess(example):
@@ -73,16 +335,57 @@ class Machine:
                 "label": example["label_id"],
             }
 
-        self.train_dataset = self.train_dataset.map(preprocess)
-        self.val_dataset = self.val_dataset.map(preprocess)
+        self.train_dataset = self._map_once(self.train_dataset, preprocess, "train")
+        self.val_dataset = self._map_once(self.val_dataset, preprocess, "val")
+
+        # === TEACHER LOGITS (DISTILLATION) ===
+        # The teacher is run once over the train set here instead of on every
+        # training step, its logits are stored next to the pixel values.
+        if self.teacher_path is not None:
+            self.train_dataset = self._map_once(
+                self.train_dataset,
+                self._teacher_logits_fn(),
+                "teacher",
+                batched=True,
+                batch_size=self.batch_size,
+            )
+            self.train_dataset = self.train_dataset.remove_columns(
+                ["image_path", "label_id"]
+            )
+            self.val_dataset = self.val_dataset.remove_columns(
+                ["image_path", "label_id"]
+            )
+
+        # === EVAL SUBSAMPLE ===
+        # Per-epoch evaluation (early stopping, best model) runs on a fixed stratified
+        # subsample, evaluate() still scores the whole validation set at the end.
+        # A float is a fraction of the validation set, an int a number of images.
+        # A subsample that covers the whole set is just the whole set.
+        self.eval_dataset = self.val_dataset
+        eval_size = subsample_size(eval_subsample, len(val_df))
+        if eval_size is not None:
+            eval_idx, _ = train_test_split(
+                np.arange(len(val_df)),
+                train_size=eval_size,
+                stratify=val_df["label_id"],
+                random_state=0,
+            )
+            self.eval_dataset = self.val_dataset.select(sorted(eval_idx))
 
         # === LOAD MODEL ===
-        self.model = ViTForImageClassification.from_pretrained(
+        # Only a pretrained head of another size is replaced, any other size mismatch
+        # in the checkpoint is still an error
+        head_size = AutoConfig.from_pretrained(self.model_name).num_labels
+        self.model = AutoModelForImageClassification.from_pretrained(
             self.model_name,
             num_labels=len(self.label_names),
             id2label=self.id2label,
             label2id=self.label2id,
+            ignore_mismatched_sizes=head_size != len(self.label_names),
         )
+        if channels_last:
+            # Only changes the layout of conv weights (MobileViT), a no-op for ViT
+            self.model = self.model.to(memory_format=torch.channels_last)  # type: ignore
 
         # === METRIC ===
         self.metric = evaluate.load("accuracy")
@@ -92,49 +395,143 @@ class Machine:
             preds = np.argmax(logits, axis=-1)
             return self.metric.compute(predictions=preds, references=labels)
 
-        # === TRAINING ARGS ===
-        self.args = TrainingArguments(
-            output_dir="./results",
-            per_device_train_batch_size=self.batch_size,
-            num_train_epochs=self.num_epochs,
-            eval_strategy="epoch",
-            logging_strategy="steps",
-            logging_steps=10,
-            save_strategy="epoch",
-            load_best_model_at_end=True,
-            save_total_limit=1,
-            metric_for_best_model="accuracy",
-            greater_is_better=True,
-            report_to="tensorboard",
-            learning_rate=self.learning_rate,
-            max_grad_norm=self.max_grad_norm,
-            weight_decay=self.weight_decay,
-            warmup_ratio=0.05,
-            logging_dir="./logs",
-            lr_scheduler_type="cosine",
-        )
-
         # === TRAINER ===
-        self.trainer = Trainer(
+        trainer_kwargs = dict(
             model=self.model,
             args=self.args,
             train_dataset=self.train_dataset,
-            eval_dataset=self.val_dataset,
+            eval_dataset=self.eval_dataset,
+            processing_class=self.processor,
             compute_metrics=compute_metrics,  # type: ignore
-            callbacks=[EarlyStoppingCallback(early_stopping_patience=4)],
+            callbacks=self._callbacks(async_checkpoints),
         )
+        if self.teacher_path is not None:
+            self.trainer = DistillationTrainer(
+                temperature=distill_temperature,
+                alpha=distill_alpha,
+                **trainer_kwargs,
+            )
+        else:
+            self.trainer = Trainer(**trainer_kwargs)
+
+    def _callbacks(self, async_checkpoints):
+        if async_checkpoints:
+            return [
+                AsyncCheckpointCallback(
+                    self.output_dir, patience=4, processor=self.processor
+                )
+            ]
+        return [EarlyStoppingCallback(early_stopping_patience=4)]
+
+    def _map_once(self, dataset, function, name, **kwargs):
+        """
+        dataset.map, computed once under DDP. Datasets built from pandas are never
+        cached, so the main process writes the result to output_dir and the other
+        ranks load it from there once it is done. The file name covers the CSV, the
+        backbone and the teacher, so another configuration never reuses it.
+        """
+        if not self.distributed:
+            return dataset.map(function, **kwargs)
+        key = hashlib.sha1()
+        with open(self.csv_path, "rb") as f:
+            key.update(f.read())
+        key.update(f"{self.model_name}|{self.teacher_path}".encode("utf-8"))
+        cache_file = os.path.join(
+            self.output_dir, "preprocessed", f"{name}-{key.hexdigest()[:16]}.arrow"
+        )
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        with self.args.main_process_first(desc=f"preprocessing {name}"):
+            return dataset.map(function, cache_file_name=cache_file, **kwargs)
+
+    def _teacher_logits_fn(self):
+        teacher = AutoModelForImageClassification.from_pretrained(self.teacher_path)
+        teacher.eval()
+        teacher_processor = load_processor(self.teacher_path)
+
+        # Reorder teacher outputs to the student's label order
+        teacher_label2id = {
+            name.lower(): int(i) for name, i in teacher.config.label2id.items()
+        }
+        missing = [n for n in self.label_names if n.lower() not in teacher_label2id]
+        if missing:
+            raise ValueError(f"Teacher has no output for labels: {missing}")
+        order = [teacher_label2id[name.lower()] for name in self.label_names]
+
+        def add_teacher_logits(batch):
+            images = [Image.open(p).convert("RGB") for p in batch["image_path"]]
+            inputs = teacher_processor(images=images, return_tensors="pt")
+            with torch.no_grad():
+                logits = teacher(**inputs).logits
+            return {"teacher_logits": logits[:, order].numpy()}
+
+        return add_teacher_logits
+
+    @property
+    def is_main_process(self):
+        return self.trainer.is_world_process_zero()
 
     def learn(self):
-        self.trainer.train()
+        output = self.trainer.train()
+        # The final (best) weights together with the processor, so output_dir can be
+        # loaded on its own. Only the main process writes.
+        self.trainer.save_model(self.output_dir)
+        return output
+
+    def _predict_local(self, dataset):
+        """
+        Prediction loop that runs in this process only. Trainer.predict is a
+        collective operation under DDP, this is what rank 0 uses instead.
+        """
+        from torch.utils.data import DataLoader
+
+        dataset = dataset.with_format("torch", columns=["pixel_values", "label"])
+        model = self.trainer.model
+        model = getattr(model, "module", model)
+        model.eval()
+
+        logits, labels = [], []
+        with torch.no_grad():
+            for batch in DataLoader(dataset, batch_size=self.batch_size):
+                logits.append(model(pixel_values=batch["pixel_values"]).logits)
+                labels.append(batch["label"])
+        return torch.cat(logits).float().numpy(), torch.cat(labels).numpy()
 
-    def evaluate(self):
+    def benchmark(self, steps=30, warmup=3, profile_dir=None):
+        """
+        Runs `steps` optimizer steps on the real train dataloader and returns the
+        samples/sec and per-phase step time breakdown, see train_benchmark.py.
+        Note that this updates the model weights.
+        """
+        from train_benchmark import benchmark_training
+
+        return benchmark_training(
+            self.model,
+            self.trainer.get_train_dataloader(),
+            steps=steps,
+            warmup=warmup,
+            learning_rate=self.learning_rate,
+            autocast_dtype=torch.bfloat16 if self.bf16 else None,
+            profile_dir=profile_dir,
+        )
+
+    def evaluate(self, plot=True):
+        """
+        Scores the full validation set in a single prediction pass and returns the
+        metrics ("eval_accuracy", "eval_loss", ...), saving the confusion matrix.
+        """
         from sklearn.metrics import confusion_matrix, ConfusionMatrixDisplay
         import matplotlib.pyplot as plt
 
         # Predict
-        preds = self.trainer.predict(self.val_dataset)  # type: ignore
-        y_pred = np.argmax(preds.predictions, axis=1)
-        y_true = preds.label_ids
+        if self.distributed:
+            logits, y_true = self._predict_local(self.val_dataset)
+            y_pred = np.argmax(logits, axis=1)
+            metrics = {"eval_accuracy": float((y_pred == y_true).mean())}
+        else:
+            preds = self.trainer.predict(self.val_dataset, metric_key_prefix="eval")  # type: ignore
+            y_pred = np.argmax(preds.predictions, axis=1)
+            y_true = preds.label_ids
+            metrics = preds.metrics
 
         # Confusion matrix
         cm = confusion_matrix(y_true, y_pred)  # type: ignore
@@ -143,15 +540,116 @@ class Machine:
         )
         disp.plot(xticks_rotation=45, cmap="Blues")
         plt.title("Confusion Matrix")
-        plt.show()
+        if plot:
+            plt.show()
         save_path = "confusion_matrix.png"
         disp.figure_.savefig(save_path)
+        plt.close(disp.figure_)
         print(f"Confusion matrix saved to {save_path}")
-        return self.trainer.evaluate()
+        return metrics
+
+
+def compare_precision(**kwargs):
+    """
+    Trains the same configuration once in plain fp32 and once in the CPU optimized
+    mode and returns their accuracy and training time side by side.
+    """
+    output_dir = kwargs.pop("output_dir", "./results")
+    rows = []
+    for name, cpu_optimized in [("fp32", False), ("cpu_optimized", True)]:
+        machine = Machine(
+            output_dir=f"{output_dir}_{name}", cpu_optimized=cpu_optimized, **kwargs
+        )
+        train_output = machine.learn()
+        metrics = machine.evaluate(plot=False)
+        rows.append(
+            {
+                "mode": name,
+                "bf16": machine.bf16,
+                "accuracy": metrics["eval_accuracy"],
+                "train_runtime_s": train_output.metrics["train_runtime"],
+                "samples_per_s": train_output.metrics["train_samples_per_second"],
+            }
+        )
+    report = pd.DataFrame(rows)
+    report["accuracy_delta"] = report["accuracy"] - report["accuracy"].iloc[0]
+    return report
 
 
 if __name__ == "__main__":
-    machine = Machine()
-    machine.learn()
-    results = machine.evaluate()
-    print("Evaluation results:", results)
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--model",
+        type=str,
+        default="vit-base",
+        help=f"Backbone to fine-tune, one of {list(MODEL_PRESETS)} or a model id/path",
+    )
+    parser.add_argument(
+        "--teacher",
+        type=str,
+        default=None,
+        help="Checkpoint directory of a trained model to distill from",
+    )
+    parser.add_argument(
+        "--out_dir",
+        type=str,
+        default="./results",
+        help="Output folder for checkpoints",
+    )
+    parser.add_argument(
+        "--cpu",
+        action="store_true",
+        help="CPU optimized training: bf16 when supported and a fused optimizer",
+    )
+    parser.add_argument("--threads", type=int, default=None, help="Intra-op threads")
+    parser.add_argument(
+        "--interop_threads", type=int, default=None, help="Inter-op threads"
+    )
+    parser.add_argument(
+        "--grad_accum",
+        type=int,
+        default=1,
+        help="Gradient accumulation steps, the effective batch size stays the same",
+    )
+    parser.add_argument(
+        "--channels_last",
+        action="store_true",
+        help="Channels-last memory format (helps convolutional backbones)",
+    )
+    parser.add_argument(
+        "--parity",
+        action="store_true",
+        help="Train in fp32 and in CPU optimized mode and compare their accuracy",
+    )
+    parser.add_argument(
+        "--eval_subsample",
+        type=parse_subsample,
+        default=None,
+        help="Evaluate on this many validation images (an integer) or this fraction "
+        "of the validation set (e.g. 0.25) during training",
+    )
+    parser.add_argument(
+        "--async_checkpoints",
+        action="store_true",
+        help="Write best-model checkpoints in a background thread",
+    )
+    args = parser.parse_args()
+
+    machine_kwargs = dict(
+        model_name=args.model,
+        teacher_path=args.teacher,
+        output_dir=args.out_dir,
+        num_threads=args.threads,
+        interop_threads=args.interop_threads,
+        gradient_accumulation_steps=args.grad_accum,
+        channels_last=args.channels_last,
+        eval_subsample=args.eval_subsample,
+        async_checkpoints=args.async_checkpoints,
+    )
+    if args.parity:
+        print(compare_precision(**machine_kwargs).to_string(index=False))
+    else:
+        machine = Machine(cpu_optimized=args.cpu, **machine_kwargs)
+        machine.learn()
+        results = machine.evaluate()
+        print("Evaluation results:", results)
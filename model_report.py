@@ -0,0 +1,128 @@
+"""
+Latency / accuracy report for trained accent classifiers.
+
+Give it a list of checkpoint directories (e.g. ./results for vit-base, ./results_deit_tiny
+for a distilled DeiT-tiny) and it measures parameter count, CPU latency at batch size 1
+and accuracy on the test split of spectrogram_dataset.csv, so the smallest model that
+is still accurate enough can be picked.
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+import torch
+from PIL import Image
+from transformers import AutoModelForImageClassification
+
+from export_model import load_processor
+
+
+def load_checkpoint(path):
+    model = AutoModelForImageClassification.from_pretrained(path)
+    model.eval()
+    return model, load_processor(path)
+
+
+def measure_latency(model, processor, runs=50, warmup=5):
+    """Returns per-image latencies in milliseconds for batch size 1."""
+    image = Image.fromarray(
+        np.random.randint(0, 255, (224, 224, 3), dtype=np.uint8)
+    ).convert("RGB")
+    timings = []
+    with torch.no_grad():
+        for i in range(warmup + runs):
+            start = time.perf_counter()
+            inputs = processor(images=image, return_tensors="pt")
+            model(**inputs)
+            if i >= warmup:
+                timings.append((time.perf_counter() - start) * 1000)
+    return np.array(timings)
+
+
+def measure_accuracy(model, processor, csv_path, batch_size=32, limit=None):
+    df = pd.read_csv(csv_path)
+    df = df[df["split"] == "test"]
+    if limit is not None:
+        df = df.sample(n=min(limit, len(df)), random_state=0)
+
+    label2id = {name.lower(): int(i) for name, i in model.config.label2id.items()}
+    hits = 0
+    paths = df["image_path"].tolist()
+    labels = df["label"].str.lower().tolist()
+    with torch.no_grad():
+        for i in range(0, len(paths), batch_size):
+            images = [Image.open(p).convert("RGB") for p in paths[i : i + batch_size]]
+            inputs = processor(images=images, return_tensors="pt")
+            preds = model(**inputs).logits.argmax(dim=-1).tolist()
+            for pred, label in zip(preds, labels[i : i + batch_size]):
+                hits += int(pred == label2id.get(label, -1))
+    return hits / len(paths) if paths else float("nan")
+
+
+def model_report(checkpoints, csv_path="spectrogram_dataset.csv", runs=50, limit=None):
+    rows = []
+    for path in checkpoints:
+        print(f"📏 Measuring {path}")
+        model, processor = load_checkpoint(path)
+        latencies = measure_latency(model, processor, runs=runs)
+        rows.append(
+            {
+                "checkpoint": path,
+                "params_m": sum(p.numel() for p in model.parameters()) / 1e6,
+                "latency_p50_ms": float(np.percentile(latencies, 50)),
+                "latency_p95_ms": float(np.percentile(latencies, 95)),
+                "accuracy": measure_accuracy(model, processor, csv_path, limit=limit),
+            }
+        )
+    return pd.DataFrame(rows).sort_values("latency_p50_ms")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "checkpoints",
+        nargs="+",
+        help="Checkpoint directories to compare",
+    )
+    parser.add_argument(
+        "--csv",
+        type=str,
+        default="spectrogram_dataset.csv",
+        help="Dataset CSV, the test split is used for accuracy",
+    )
+    parser.add_argument(
+        "--runs",
+        type=int,
+        default=50,
+        help="Number of timed forward passes per model",
+    )
+    parser.add_argument(
+        "--limit",
+        type=int,
+        default=None,
+        help="Evaluate on a random subset of this many test images",
+    )
+    parser.add_argument(
+        "--out",
+        type=str,
+        default="model_report.csv",
+        help="Where to save the report",
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=None,
+        help="torch intra-op threads, match this to the inference servers",
+    )
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    report = model_report(args.checkpoints, args.csv, args.runs, args.limit)
+    print(report.to_string(index=False))
+    report.to_csv(args.out, index=False)
+    print(f"✅ Report saved to {args.out}")
@@ -0,0 +1,138 @@
+"""
+Segment store: all spliced segments of an accent in one file.
+
+text_splice cuts every clip into 1.5-3 s segments, which as separate WAVs means
+hundreds of thousands of tiny files. In the store the segments of an accent are appended
+as raw 16 kHz mono int16 samples to `<accent>.pcm`, and `<accent>.index.jsonl` holds one
+line per segment: name, offset and length (in samples), words, source clip and label.
+Readers memory-map the .pcm file, so a segment is a slice and listing a store is reading
+one small index. A segment is identified by (source, name): appending one that the store
+already holds is a no-op, so rerunning text_splice over the same clips adds nothing.
+
+    with SegmentWriter("data/dataset/segments/train", "british") as store:
+        store.append(samples, "000_hello_world", ["hello", "world"], source="clip")
+
+    store = SegmentStore("data/dataset/segments/train", "british")
+    for entry, y in store:
+        ...
+"""
+
+import json
+import os
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+PCM_SUFFIX = ".pcm"
+INDEX_SUFFIX = ".index.jsonl"
+
+
+def to_int16(samples):
+    """int16 samples as they are, float samples in [-1, 1] scaled like soundfile."""
+    samples = np.asarray(samples)
+    if samples.dtype == np.int16:
+        return samples
+    return (np.clip(samples, -1.0, 1.0) * 32767).astype(np.int16)
+
+
+class SegmentWriter:
+    def __init__(self, store_dir, accent):
+        os.makedirs(store_dir, exist_ok=True)
+        self.accent = accent
+        self.pcm_path = os.path.join(store_dir, accent + PCM_SUFFIX)
+        self.index_path = os.path.join(store_dir, accent + INDEX_SUFFIX)
+        self.existing = {}
+        if os.path.exists(self.index_path):
+            for entry in read_index(store_dir, accent):
+                self.existing[(entry["source"], entry["name"])] = entry
+        self.pcm = open(self.pcm_path, "ab")
+        self.index = open(self.index_path, "a", encoding="utf-8")
+        self.offset = self.pcm.tell() // 2
+
+    def contains(self, source, name):
+        return (source, name) in self.existing
+
+    def append(self, samples, name, words, source, label=None):
+        """Returns the index entry, the existing one if the segment is already stored."""
+        if (source, name) in self.existing:
+            return self.existing[(source, name)]
+        samples = to_int16(samples)
+        self.pcm.write(samples.astype("<i2").tobytes())
+        entry = {
+            "name": name,
+            "offset": self.offset,
+            "length": len(samples),
+            "words": list(words),
+            "source": source,
+            "label": label or self.accent,
+        }
+        # Samples first, so an index line never points past the end of the .pcm file
+        self.pcm.flush()
+        self.index.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self.offset += len(samples)
+        self.existing[(source, name)] = entry
+        return entry
+
+    def close(self):
+        self.pcm.close()
+        self.index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_index(store_dir, accent):
+    entries = []
+    index_path = os.path.join(store_dir, accent + INDEX_SUFFIX)
+    with open(index_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                entries.append(json.loads(line))
+    return entries
+
+
+def list_accents(store_dir):
+    if not os.path.isdir(store_dir):
+        return []
+    return sorted(
+        f[: -len(INDEX_SUFFIX)]
+        for f in os.listdir(store_dir)
+        if f.endswith(INDEX_SUFFIX)
+    )
+
+
+def count_segments(store_dir, accent):
+    with open(os.path.join(store_dir, accent + INDEX_SUFFIX), "rb") as f:
+        return sum(1 for line in f if line.strip())
+
+
+class SegmentStore:
+    """Read side, segments come back as float32 like librosa.load."""
+
+    def __init__(self, store_dir, accent):
+        self.accent = accent
+        self.entries = read_index(store_dir, accent)
+        pcm_path = os.path.join(store_dir, accent + PCM_SUFFIX)
+        size = os.path.getsize(pcm_path) // 2
+        self.samples = (
+            np.memmap(pcm_path, dtype="<i2", mode="r", shape=(size,)) if size else None
+        )
+
+    def __len__(self):
+        return len(self.entries)
+
+    def read(self, entry):
+        start = entry["offset"]
+        return np.multiply(
+            self.samples[start : start + entry["length"]], 1 / 32768, dtype=np.float32
+        )
+
+    def __getitem__(self, i):
+        return self.read(self.entries[i])
+
+    def __iter__(self):
+        for entry in self.entries:
+            yield entry, self.read(entry)
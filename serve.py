@@ -0,0 +1,260 @@
+"""
+Local HTTP service for accent classification.
+
+The model is loaded once. Spectrograms are rendered in a process pool (ffmpeg, denoise
+and matplotlib are CPU bound and matplotlib is not thread safe), and the model runs in a
+single thread that coalesces concurrent requests into micro-batches: it waits at most
+`max_wait_ms` after the first request of a batch before running it.
+
+Endpoints:
+- POST /predict   raw audio file as the request body, pass the extension with ?ext=mp3
+                  (one of AUDIO_EXTENSIONS)
+- GET  /metrics   request count, p50/p99 latency, throughput and average batch size
+- GET  /health
+
+Use load_test.py to benchmark it.
+"""
+
+import json
+import multiprocessing
+import os
+import queue
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+from instrumentation import disable
+from test_model import create_spectogram, load_model, load_processor, predict_batch
+
+# Extensions accepted for ?ext=, the upload's temp file gets it as suffix for ffmpeg
+AUDIO_EXTENSIONS = {"mp3", "wav", "flac", "ogg", "opus", "m4a", "webm"}
+
+
+class MicroBatcher:
+    def __init__(self, model, processor, max_batch_size=16, max_wait_ms=10):
+        self.model = model
+        self.processor = processor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.requests = queue.Queue()
+        self.batch_sizes = deque(maxlen=1000)
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+
+    def submit(self, image) -> Future:
+        future = Future()
+        self.requests.put((image, future))
+        return future
+
+    def _next_batch(self):
+        batch = [self.requests.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self.requests.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._next_batch()
+            images = [image for image, _ in batch]
+            try:
+                labels = predict_batch(self.model, self.processor, images)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.batch_sizes.append(len(batch))
+            for (_, future), label in zip(batch, labels):
+                future.set_result(label)
+
+
+class Metrics:
+    def __init__(self, window=10000):
+        self.lock = threading.Lock()
+        self.latencies = deque(maxlen=window)
+        self.finished = deque(maxlen=window)
+        self.total = 0
+        self.errors = 0
+        self.started = time.time()
+
+    def record(self, latency):
+        with self.lock:
+            self.latencies.append(latency)
+            self.finished.append(time.time())
+            self.total += 1
+
+    def record_error(self):
+        with self.lock:
+            self.errors += 1
+
+    def summary(self, batch_sizes):
+        with self.lock:
+            latencies = np.array(self.latencies) * 1000
+            finished = list(self.finished)
+            total, errors = self.total, self.errors
+        throughput = 0.0
+        if len(finished) > 1 and finished[-1] > finished[0]:
+            throughput = (len(finished) - 1) / (finished[-1] - finished[0])
+        return {
+            "requests": total,
+            "errors": errors,
+            "uptime_s": round(time.time() - self.started, 1),
+            "latency_p50_ms": float(np.percentile(latencies, 50)) if total else None,
+            "latency_p99_ms": float(np.percentile(latencies, 99)) if total else None,
+            "throughput_rps": round(throughput, 2),
+            "avg_batch_size": float(np.mean(batch_sizes)) if batch_sizes else None,
+        }
+
+
+def make_handler(batcher, features, metrics):
+    class Handler(BaseHTTPRequestHandler):
+        def _send_json(self, status, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            path = urlparse(self.path).path
+            if path == "/metrics":
+                self._send_json(200, metrics.summary(list(batcher.batch_sizes)))
+            elif path == "/health":
+                self._send_json(200, {"status": "ok"})
+            else:
+                self._send_json(404, {"error": "not found"})
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            if url.path != "/predict":
+                self._send_json(404, {"error": "not found"})
+                return
+
+            start = time.perf_counter()
+            ext = parse_qs(url.query).get("ext", ["mp3"])[0].lstrip(".").lower()
+            if ext not in AUDIO_EXTENSIONS:
+                self._send_json(
+                    400, {"error": f"ext must be one of {sorted(AUDIO_EXTENSIONS)}"}
+                )
+                return
+            length = int(self.headers.get("Content-Length", 0))
+            if length == 0:
+                self._send_json(400, {"error": "empty body"})
+                return
+
+            with tempfile.NamedTemporaryFile(delete=False, suffix=f".{ext}") as tmp:
+                tmp.write(self.rfile.read(length))
+            try:
+                image = features.submit(create_spectogram, tmp.name).result()
+                label = batcher.submit(image).result()
+            except Exception as e:
+                metrics.record_error()
+                self._send_json(500, {"error": str(e)})
+                return
+            finally:
+                os.remove(tmp.name)
+
+            latency = time.perf_counter() - start
+            metrics.record(latency)
+            self._send_json(
+                200, {"label": label, "latency_ms": round(latency * 1000, 2)}
+            )
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(
+    model_path,
+    host="127.0.0.1",
+    port=8000,
+    workers=None,
+    max_batch_size=16,
+    max_wait_ms=10,
+):
+    # Stage metrics would add file I/O to every request and grow for as long as the
+    # server runs, the latency numbers come from Metrics instead
+    disable()
+    model = load_model(model_path)
+    processor = load_processor(model_path)
+    batcher = MicroBatcher(model, processor, max_batch_size, max_wait_ms)
+    # Spawned, not forked: the server process runs the batcher and HTTP threads, and
+    # forking a threaded process can deadlock the children. The workers are started
+    # here, before the first request, so no request pays for their startup.
+    workers = workers or os.cpu_count() or 1
+    features = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=disable,
+    )
+    for future in [features.submit(os.getpid) for _ in range(workers)]:
+        future.result()
+    metrics = Metrics()
+
+    server = ThreadingHTTPServer((host, port), make_handler(batcher, features, metrics))
+    print(f"🚀 Serving {model_path} on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        features.shutdown()
+        print(json.dumps(metrics.summary(list(batcher.batch_sizes)), indent=2))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--model",
+        type=str,
+        default="./yapa_comparission/checkpoint-900",
+        help="Checkpoint directory, model_int8.pt or .onnx file from export_model",
+    )
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Processes rendering spectrograms (defaults to the number of cores)",
+    )
+    parser.add_argument(
+        "--max_batch_size",
+        type=int,
+        default=16,
+        help="Largest micro-batch sent to the model",
+    )
+    parser.add_argument(
+        "--max_wait_ms",
+        type=float,
+        default=10,
+        help="How long the first request of a batch waits for others to join",
+    )
+    args = parser.parse_args()
+
+    serve(
+        args.model,
+        args.host,
+        args.port,
+        args.workers,
+        args.max_batch_size,
+        args.max_wait_ms,
+    )
@@ -5,4 +5,7 @@ if [ "$(which pip)" = "/usr/bin/pip" ]; then
     exit 1
 fi
 
-pip install torch torchvision torchaudio --index-url https://download.pytorch.org/whl/cu124
\ No newline at end of file
+pip install torch torchvision torchaudio --index-url https://download.pytorch.org/whl/cu124
+
+# Parquet manifests of create_csv.py
+pip install pyarrow
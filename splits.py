@@ -0,0 +1,77 @@
+"""
+Deterministic, speaker-disjoint train/test splits.
+
+The split of a clip is a pure function of its speaker's client_id: the client_id is
+hashed to a number in [0, 1) and compared against the test ratio. All clips of a speaker
+always land in the same split, the same speaker lands in the same split on every machine
+and every run, and changing the ratio only moves the speakers near the boundary. Nothing
+has to be reprocessed or moved on disk, the split is just a column in the manifest.
+"""
+
+import csv
+import hashlib
+import json
+import os
+
+SPLIT_SALT = "yapa-split-v1"
+
+
+def speaker_fraction(client_id, salt=SPLIT_SALT):
+    digest = hashlib.blake2b(f"{salt}:{client_id}".encode("utf-8"), digest_size=8)
+    return int.from_bytes(digest.digest(), "big") / 2**64
+
+
+def assign_split(client_id, test_ratio=0.2, salt=SPLIT_SALT):
+    return "test" if speaker_fraction(client_id, salt) < test_ratio else "train"
+
+
+def content_key(path, params=None):
+    """
+    sha1 of a file's bytes, used as the name of processed artifacts. `params` (JSON
+    serializable) describe how the artifact is made and are hashed in too, so an
+    artifact made with other parameters is never reused.
+    """
+    h = hashlib.sha1()
+    if params is not None:
+        h.update(json.dumps(params, sort_keys=True).encode("utf-8"))
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def load_client_ids(tsv_path):
+    """
+    Maps clip filename -> client_id from a Common Voice TSV (validated.tsv) or from a
+    pick_audio output TSV, whose fifth column is the client_id. Keys are basenames, so
+    TSVs with absolute paths (pick_audio --materialize virtual) match too.
+    """
+    client_ids = {}
+    with open(tsv_path, "r", encoding="utf-8") as f:
+        first = f.readline().rstrip("\n").split("\t")
+        if "client_id" in first and "path" in first:
+            client_col, file_col = first.index("client_id"), first.index("path")
+        else:
+            client_col, file_col = 4, 0
+            if len(first) > client_col:
+                client_ids[os.path.basename(first[file_col])] = first[client_col]
+        for line in f:
+            parts = line.rstrip("\n").split("\t")
+            if len(parts) > max(client_col, file_col):
+                client_ids[os.path.basename(parts[file_col])] = parts[client_col]
+    return client_ids
+
+
+def resplit(manifest_path, test_ratio=0.2, output_path=None):
+    """Recomputes the split column of a manifest CSV, no audio is touched."""
+    with open(manifest_path, "r", encoding="utf-8", newline="") as f:
+        rows = list(csv.DictReader(f))
+    for row in rows:
+        row["split"] = assign_split(row["client_id"], test_ratio)
+    output_path = output_path or manifest_path
+    if rows:
+        with open(output_path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+    return rows
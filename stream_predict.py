@@ -0,0 +1,123 @@
+"""
+Streaming accent prediction for long recordings.
+
+Instead of squashing a whole recording into one 224x224 spectrogram (create_spectogram),
+the converted wav is read in fixed, overlapping windows (3 s windows with a 1.5 s hop by
+default, the same lengths text_splice cuts for training). Each window gets its own
+spectrogram, windows go through the model in batches and the per-window logits are
+averaged into a running prediction for the whole recording. Only one batch of windows is
+held in memory at a time, no matter how long the recording is.
+"""
+
+import tempfile
+
+import noisereduce as nr
+import numpy as np
+import soundfile as sf
+import torch
+
+from audio_utils import convert_to_wav
+from test_model import load_model, load_processor, predict_logits, waveform_to_image
+
+SAMPLE_RATE = 16000
+TARGET_DBFS = -20.0  # same target as audio_utils.normalize_audio
+SILENCE_DBFS = -60.0  # same threshold as audio_utils.trim_silence
+
+
+def _dbfs(window):
+    rms = np.sqrt(np.mean(window**2))
+    return 20 * np.log10(rms) if rms > 0 else -np.inf
+
+
+def iter_windows(wav_path, window_s=3.0, hop_s=1.5, min_s=1.5):
+    """
+    Yields (start_time, samples) for overlapping windows of a 16 kHz mono wav.
+    Windows are normalized and denoised on their own, silent windows are skipped.
+    """
+    blocksize = int(window_s * SAMPLE_RATE)
+    hop = int(hop_s * SAMPLE_RATE)
+    blocks = sf.blocks(
+        wav_path, blocksize=blocksize, overlap=blocksize - hop, dtype="float32"
+    )
+    for i, window in enumerate(blocks):
+        if len(window) < min_s * SAMPLE_RATE:
+            continue
+        level = _dbfs(window)
+        if level < SILENCE_DBFS:
+            continue
+        window = window * 10 ** ((TARGET_DBFS - level) / 20)
+        window = nr.reduce_noise(
+            y=window, sr=SAMPLE_RATE, stationary=True, prop_decrease=0.4
+        )
+        yield i * hop_s, window
+
+
+def stream_predict(
+    model, processor, audio_path, window_s=3.0, hop_s=1.5, batch_size=8
+):
+    """
+    Generator yielding the running recording-level prediction after every batch:
+    a dict with the number of windows seen so far, the current label and the
+    averaged class probabilities.
+    """
+    logit_sum = None
+    windows = 0
+
+    def flush(images):
+        nonlocal logit_sum, windows
+        logits = predict_logits(model, processor, images).sum(dim=0)
+        logit_sum = logits if logit_sum is None else logit_sum + logits
+        windows += len(images)
+        probs = torch.softmax(logit_sum / windows, dim=-1)
+        return {
+            "windows": windows,
+            "label": model.config.id2label[int(probs.argmax())],
+            "probs": {
+                model.config.id2label[i]: float(p) for i, p in enumerate(probs)
+            },
+        }
+
+    with tempfile.NamedTemporaryFile(delete=True, suffix=".wav") as wav_temp:
+        convert_to_wav(audio_path, wav_temp.name)
+
+        images = []
+        for _, window in iter_windows(wav_temp.name, window_s, hop_s):
+            images.append(waveform_to_image(window, SAMPLE_RATE))
+            if len(images) == batch_size:
+                yield flush(images)
+                images = []
+        if images:
+            yield flush(images)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("audio", type=str, help="Recording to classify")
+    parser.add_argument(
+        "--model",
+        type=str,
+        default="./yapa_comparission/checkpoint-900",
+        help="Checkpoint directory, model_int8.pt or .onnx file from export_model",
+    )
+    parser.add_argument("--window", type=float, default=3.0, help="Window in seconds")
+    parser.add_argument("--hop", type=float, default=1.5, help="Hop in seconds")
+    parser.add_argument("--batch_size", type=int, default=8)
+    args = parser.parse_args()
+
+    model = load_model(args.model)
+    processor = load_processor(args.model)
+
+    result = None
+    for result in stream_predict(
+        model, processor, args.audio, args.window, args.hop, args.batch_size
+    ):
+        print(f"🎧 {result['windows']} windows: {result['label']}")
+
+    if result is None:
+        print("⚠️ No speech found in the recording")
+    else:
+        print(f"✅ Prediction: {result['label']}")
+        for label, prob in sorted(result["probs"].items(), key=lambda x: -x[1]):
+            print(f"  - {label}: {prob:.3f}")
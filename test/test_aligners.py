@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from aligners import SAMPLE_RATE, EnergyAligner, get_aligner, split_words
+
+
+def tone(seconds, freq=220.0):
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    return (0.5 * np.sin(2 * np.pi * freq * t)).astype(np.float32)
+
+
+def silence(seconds):
+    return np.zeros(int(seconds * SAMPLE_RATE), dtype=np.float32)
+
+
+def test_split_words_strips_punctuation():
+    assert split_words('"Hello, world!" -- it\'s fine.') == [
+        "Hello",
+        "world",
+        "it's",
+        "fine",
+    ]
+
+
+def test_words_land_in_the_voiced_regions():
+    # voiced 0.5-1.5 s and 2.0-3.0 s
+    y = np.concatenate([silence(0.5), tone(1.0), silence(0.5), tone(1.0), silence(0.5)])
+    aligner = EnergyAligner()
+    regions = [
+        (s * aligner.hop / SAMPLE_RATE, e * aligner.hop / SAMPLE_RATE)
+        for s, e in aligner.voiced_regions(y)
+    ]
+    assert len(regions) == 2
+    for (start, end), (lo, hi) in zip(regions, [(0.5, 1.5), (2.0, 3.0)]):
+        assert abs(start - lo) < 0.05 and abs(end - hi) < 0.05
+
+    words = aligner.align_samples(y, "one two three four")["words"]
+    assert [w["word"] for w in words] == ["one", "two", "three", "four"]
+    assert all(w["case"] == "success" for w in words)
+    for prev, word in zip(words, words[1:]):
+        assert prev["end"] <= word["start"] + 1e-6
+    for word in words:
+        assert word["start"] < word["end"]
+        # a word may span the pause, but both ends are in voiced time
+        for t in (word["start"], word["end"]):
+            assert any(lo - 0.05 <= t <= hi + 0.05 for lo, hi in regions)
+
+
+def test_silence_is_not_found():
+    result = EnergyAligner().align_samples(silence(0.01), "hello world")
+    assert result == {
+        "words": [
+            {"case": "not-found-in-audio", "word": "hello"},
+            {"case": "not-found-in-audio", "word": "world"},
+        ]
+    }
+
+
+def test_align_reads_the_wav(tmp_path):
+    sf = pytest.importorskip("soundfile")
+    path = str(tmp_path / "clip.wav")
+    sf.write(path, np.concatenate([silence(0.3), tone(1.0)]), SAMPLE_RATE, "PCM_16")
+    (result,) = get_aligner("energy").align_batch([(path, "hi")])
+    assert result["words"][0]["case"] == "success"
+    assert abs(result["words"][0]["start"] - 0.3) < 0.05
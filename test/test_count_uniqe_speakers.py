@@ -0,0 +1,94 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from helper_scripts.count_uniqe_speakers import (
+    SCORE_LABELS,
+    HyperLogLog,
+    accent_stats,
+    write_accents_txt,
+)
+
+
+def random_hashes(n, seed):
+    return np.random.default_rng(seed).integers(0, 2**64, n, dtype=np.uint64)
+
+
+@pytest.mark.parametrize("n", [100, 5_000, 200_000])
+def test_hyperloglog_error(n):
+    hll = HyperLogLog(p=14)
+    hll.add(random_hashes(n, seed=n))
+    # standard error is 1.04 / sqrt(2**14) ~ 0.8%, allow 4 of them
+    assert abs(hll.count() - n) / n < 0.033
+
+
+def test_hyperloglog_ignores_duplicates_and_merges():
+    hashes = random_hashes(50_000, seed=1)
+    a, b, both = HyperLogLog(), HyperLogLog(), HyperLogLog()
+    a.add(hashes[:30_000])
+    a.add(hashes[:30_000])
+    b.add(hashes[20_000:])
+    both.add(hashes)
+    a.merge(b)
+    assert np.array_equal(a.registers, both.registers)
+    assert abs(a.count() - 50_000) / 50_000 < 0.033
+
+
+def test_hyperloglog_empty():
+    assert HyperLogLog().count() == 0
+
+
+def write_corpus(path, rows, durations):
+    header = "client_id\tpath\tsentence\tup_votes\tdown_votes\tage\tgender\taccents"
+    lines = [header] + [
+        f"{client}\t{clip}\tsome text\t{up}\t{down}\t\t\t{accent}"
+        for client, clip, up, down, accent in rows
+    ]
+    (path / "validated.tsv").write_text("\n".join(lines) + "\n", encoding="utf-8")
+    lines = ["clip\tduration[ms]"] + [f"{c}\t{ms}" for c, ms in durations.items()]
+    (path / "clip_durations.tsv").write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+
+ROWS = [
+    ("s1", "1.mp3", 2, 0, "Filipino"),
+    ("s1", "2.mp3", 0, 0, "Filipino"),
+    ("s2", "3.mp3", 0, 1, "Filipino"),
+    ("s3", "4.mp3", 7, 0, "Irish English"),
+    ("s4", "5.mp3", 1, 0, "Polish"),
+    ("s5", "6.mp3", 1, 0, ""),
+]
+DURATIONS = {"1.mp3": 3_600_000, "2.mp3": 1_800_000, "3.mp3": 1_800_000}
+
+
+@pytest.mark.parametrize("approximate", [False, True])
+def test_accent_stats(tmp_path, approximate):
+    write_corpus(tmp_path, ROWS, DURATIONS)
+    stats, accent_counts = accent_stats(
+        str(tmp_path), ["Filipino", "Irish English", "Slavic"], approximate
+    )
+
+    filipino = stats["Filipino"]
+    assert filipino["speakers"] == 2
+    assert filipino["clips"] == 3
+    assert filipino["hours"] == pytest.approx(2.0)
+    assert filipino["votes"] == dict(zip(SCORE_LABELS, [1, 1, 0, 1, 0, 0]))
+
+    assert stats["Irish English"]["hours"] == 0
+    assert stats["Irish English"]["votes"]["6+"] == 1
+    assert stats["Slavic"]["speakers"] == 1  # Polish matches the Slavic regex
+    assert accent_counts == {"Filipino": 3, "Irish English": 1, "Polish": 1, "": 1}
+
+    write_accents_txt(accent_counts, tmp_path / "accents.txt")
+    assert (tmp_path / "accents.txt").read_text(encoding="utf-8").splitlines() == [
+        "Filipino: 3",
+        "Irish English: 1",
+        "Polish: 1",
+    ]
+
+
+def test_accent_stats_without_durations(tmp_path):
+    write_corpus(tmp_path, ROWS, {})
+    (tmp_path / "clip_durations.tsv").unlink()
+    stats, _ = accent_stats(str(tmp_path), ["Filipino"])
+    assert stats["Filipino"]["hours"] is None
+    assert stats["Filipino"]["clips"] == 3
@@ -0,0 +1,68 @@
+import pytest
+
+pd = pytest.importorskip("pandas")
+
+from create_csv import balanced_view, build_manifest, class_counts
+
+
+def manifest(counts):
+    rows = [
+        {"image_path": f"{split}/{label}_{i}.png", "label": label, "split": split}
+        for (split, label), n in counts.items()
+        for i in range(n)
+    ]
+    df = pd.DataFrame(rows)
+    df["label"] = df["label"].astype("category")
+    df["split"] = df["split"].astype("category")
+    return df
+
+
+def test_balanced_view_caps_every_split_at_its_smallest_class():
+    df = manifest(
+        {
+            ("train", "british"): 100,
+            ("train", "indian"): 60,
+            ("train", "irish"): 50,
+            ("test", "british"): 20,
+            ("test", "indian"): 10,
+        }
+    )
+    balanced = balanced_view(df, tolerance=0.1, seed=0)
+    counts = class_counts(balanced).to_dict()
+    assert counts == {
+        ("test", "british"): 11,
+        ("test", "indian"): 10,
+        ("train", "british"): 55,
+        ("train", "indian"): 55,
+        ("train", "irish"): 50,
+    }
+    # a sample of the rows that were there, no duplicates
+    assert balanced["image_path"].is_unique
+    assert set(balanced["image_path"]) <= set(df["image_path"])
+
+
+def test_balanced_view_is_reproducible_with_a_seed():
+    df = manifest({("train", "british"): 40, ("train", "indian"): 20})
+    first = balanced_view(df, seed=3)["image_path"].tolist()
+    assert balanced_view(df, seed=3)["image_path"].tolist() == first
+
+
+def test_build_manifest_reads_split_and_label(tmp_path):
+    for path in [
+        "train/british_clip1.png",
+        "train/indian_clip2_noise.png",
+        "test/british_clip3.png",
+        "train/notes.txt",
+        "other/british_clip4.png",
+    ]:
+        (tmp_path / path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / path).write_bytes(b"")
+
+    df = build_manifest(str(tmp_path), output=None)
+    rel = df["image_path"].str.slice(len(str(tmp_path)) + 1)
+    rows = sorted(zip(rel, df["label"].astype(str), df["split"].astype(str)))
+    assert rows == [
+        ("test/british_clip3.png", "british", "test"),
+        ("train/british_clip1.png", "british", "train"),
+        ("train/indian_clip2_noise.png", "indian", "train"),
+    ]
@@ -0,0 +1,44 @@
+import os
+
+from helper_scripts.external_sort import ExternalSorter, score_key
+
+
+def test_sorts_across_spills():
+    scores = [3, 0, -1, 5, 0, 2, 1, 0, 7, -2, 4]
+    with ExternalSorter(max_rows=3) as sorter:
+        for i, score in enumerate(scores):
+            sorter.add(score_key(score), f"clip{i}", str(score))
+        assert len(sorter.spills) == len(scores) // 3
+        rows = list(sorter)
+
+    expected = sorted(range(len(scores)), key=lambda i: score_key(scores[i]))
+    assert [name for name, _ in rows] == [f"clip{i}" for i in expected]
+
+
+def test_ties_keep_insertion_order():
+    with ExternalSorter(max_rows=2) as sorter:
+        for i in range(7):
+            sorter.add((i % 2,), f"row{i}")
+        rows = [name for (name,) in sorter]
+    assert rows == ["row0", "row2", "row4", "row6", "row1", "row3", "row5"]
+
+
+def test_spill_key_width_and_cleanup():
+    sorter = ExternalSorter(max_rows=2)
+    for i in range(5):
+        sorter.add((1, -i), f"a{i}", f"b{i}")
+    paths = [path for path, _ in sorter.spills]
+    # the sort key is the 2 given ints plus the insertion number
+    assert [width for _, width in sorter.spills] == [3, 3]
+    assert list(sorter) == [(f"a{i}", f"b{i}") for i in reversed(range(5))]
+
+    sorter.close()
+    assert not any(os.path.exists(p) for p in paths)
+
+
+def test_empty_sorter():
+    with ExternalSorter(max_rows=2) as sorter:
+        sorter._spill()
+        assert sorter.spills == []
+        assert list(sorter) == []
+
@@ -0,0 +1,64 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+sf = pytest.importorskip("soundfile")
+
+from fast_audio import PCM, is_fast_path, load, read_wav_header
+
+
+@pytest.fixture
+def samples():
+    rng = np.random.default_rng(0)
+    return (rng.standard_normal(16000) * 0.3).clip(-1, 1)
+
+
+@pytest.mark.parametrize("container", ["WAV", "WAVEX"])
+def test_load_matches_soundfile(tmp_path, samples, container):
+    path = str(tmp_path / "clip.wav")
+    sf.write(path, samples, 16000, subtype="PCM_16", format=container)
+
+    info = read_wav_header(path)
+    assert (info.format, info.channels, info.sample_rate, info.bits) == (
+        PCM,
+        1,
+        16000,
+        16,
+    )
+    assert is_fast_path(info)
+
+    y, sr = load(path)
+    reference, ref_sr = sf.read(path, dtype="float32")
+    assert sr == ref_sr == 16000
+    assert y.dtype == np.float32
+    np.testing.assert_array_equal(y, reference)
+
+
+def test_load_with_native_rate(tmp_path, samples):
+    path = str(tmp_path / "clip.wav")
+    sf.write(path, samples, 22050, subtype="PCM_16")
+    assert not is_fast_path(read_wav_header(path))
+    assert is_fast_path(read_wav_header(path), sr=None)
+    y, sr = load(path, sr=None)
+    assert sr == 22050
+    np.testing.assert_array_equal(y, sf.read(path, dtype="float32")[0])
+
+
+def test_other_formats_are_not_fast_path(tmp_path, samples):
+    float_wav = str(tmp_path / "float.wav")
+    sf.write(float_wav, samples, 16000, subtype="FLOAT")
+    assert not is_fast_path(read_wav_header(float_wav))
+
+    stereo = str(tmp_path / "stereo.wav")
+    sf.write(stereo, np.stack([samples, samples], axis=1), 16000, subtype="PCM_16")
+    assert not is_fast_path(read_wav_header(stereo))
+
+    not_wav = tmp_path / "clip.mp3"
+    not_wav.write_bytes(b"ID3" + bytes(64))
+    assert read_wav_header(str(not_wav)) is None
+
+
+def test_empty_wav(tmp_path):
+    path = str(tmp_path / "empty.wav")
+    sf.write(path, np.zeros(0), 16000, subtype="PCM_16")
+    y, sr = load(path)
+    assert sr == 16000 and len(y) == 0
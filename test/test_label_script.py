@@ -0,0 +1,57 @@
+import os
+
+import pytest
+
+np = pytest.importorskip("numpy")
+sf = pytest.importorskip("soundfile")
+
+from helper_scripts import label_script
+
+HEADER = (
+    "client_id path sentence_id sentence sentence_domain up_votes down_votes age "
+    "gender accents variant locale segment"
+).split()
+
+
+def write_corpus(tmp_path, clips):
+    """clips: (client_id, filename, score, samples), all England English."""
+    clips_dir = tmp_path / "clips"
+    clips_dir.mkdir()
+    lines = ["\t".join(HEADER)]
+    for client_id, filename, score, samples in clips:
+        row = dict.fromkeys(HEADER, "")
+        row.update(
+            client_id=client_id,
+            path=filename,
+            sentence=f"says {filename}",
+            up_votes=str(max(score, 0)),
+            down_votes=str(max(-score, 0)),
+            accents="England English",
+        )
+        lines.append("\t".join(row[h] for h in HEADER))
+        if samples:
+            sf.write(str(clips_dir / filename), np.zeros(samples), 16000, "PCM_16")
+    tsv = tmp_path / "validated.tsv"
+    tsv.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return str(tsv), str(clips_dir)
+
+
+def test_first_valid_clip_per_speaker_sorted_by_score(tmp_path, monkeypatch):
+    monkeypatch.setattr(label_script, "ACCENT_LABEL", "England English")
+    tsv, clips_dir = write_corpus(
+        tmp_path,
+        [
+            ("s1", "s1_short.wav", 5, 100),  # too short, s1 falls through
+            ("s1", "s1_first.wav", 1, 4000),
+            ("s1", "s1_better.wav", 9, 4000),  # later in the TSV, not picked
+            ("s2", "s2_missing.wav", 7, 0),  # no file on disk
+            ("s2", "s2_first.wav", 0, 4000),
+            ("s3", "s3_first.wav", 3, 4000),
+        ],
+    )
+    out = label_script.filter_and_sort_tsv(tsv, clips_dir)
+    with open(out, encoding="utf-8") as f:
+        picked = [line.split("\t")[0] for line in f]
+    os.remove(out)
+    # score 0 first, then descending score
+    assert picked == ["s2_first.wav", "s3_first.wav", "s1_first.wav"]
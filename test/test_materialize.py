@@ -0,0 +1,64 @@
+import os
+
+import pytest
+
+from helper_scripts.materialize import MaterializeStats, materialize
+
+
+@pytest.fixture
+def clip(tmp_path):
+    src = tmp_path / "corpus" / "clip.mp3"
+    src.parent.mkdir()
+    src.write_bytes(b"ID3" + bytes(range(256)) * 40)
+    return src
+
+
+def test_hardlink_shares_the_inode(tmp_path, clip):
+    dst = tmp_path / "clip.mp3"
+    stats = MaterializeStats()
+    assert materialize(str(clip), str(dst), "hardlink", stats) == "hardlink"
+    assert os.stat(dst).st_ino == os.stat(clip).st_ino
+    assert stats.methods == {"hardlink": 1}
+    assert stats.bytes_written == 0
+
+
+def test_copy_writes_a_separate_file(tmp_path, clip):
+    dst = tmp_path / "clip.mp3"
+    stats = MaterializeStats()
+    assert materialize(str(clip), str(dst), "copy", stats) == "copy"
+    assert os.stat(dst).st_ino != os.stat(clip).st_ino
+    assert dst.read_bytes() == clip.read_bytes()
+    assert stats.bytes_written == clip.stat().st_size
+
+
+def test_auto_prefers_a_hardlink(tmp_path, clip):
+    dst = tmp_path / "clip.mp3"
+    assert materialize(str(clip), str(dst)) == "hardlink"
+    assert dst.read_bytes() == clip.read_bytes()
+
+
+def test_reflink_falls_back_to_a_copy(tmp_path, clip):
+    dst = tmp_path / "clip.mp3"
+    method = materialize(str(clip), str(dst), "reflink")
+    assert method in ("reflink", "copy")  # reflinks need btrfs, XFS, ...
+    assert dst.read_bytes() == clip.read_bytes()
+
+
+def test_replaces_an_existing_destination(tmp_path, clip):
+    dst = tmp_path / "clip.mp3"
+    dst.write_bytes(b"stale")
+    materialize(str(clip), str(dst), "hardlink")
+    assert dst.read_bytes() == clip.read_bytes()
+
+
+def test_virtual_writes_nothing(tmp_path, clip):
+    dst = tmp_path / "clip.mp3"
+    stats = MaterializeStats()
+    assert materialize(str(clip), str(dst), "virtual", stats) == "virtual"
+    assert not dst.exists()
+    assert stats.files == 1 and stats.bytes_written == 0
+
+
+def test_unknown_mode(tmp_path, clip):
+    with pytest.raises(ValueError):
+        materialize(str(clip), str(tmp_path / "clip.mp3"), "symlink")
@@ -0,0 +1,58 @@
+import numpy as np
+
+from segment_store import SegmentStore, SegmentWriter, count_segments, list_accents
+
+
+def segment(n, seed):
+    return np.random.default_rng(seed).integers(-32768, 32767, n, dtype=np.int16)
+
+
+def test_round_trip(tmp_path):
+    first, second = segment(24000, 0), segment(40000, 1)
+    with SegmentWriter(str(tmp_path), "british") as store:
+        store.append(first, "000_hello", ["hello"], source="clip_a")
+        store.append(second, "001_world", ["world"], source="clip_a", label="english")
+
+    assert list_accents(str(tmp_path)) == ["british"]
+    assert count_segments(str(tmp_path), "british") == 2
+
+    store = SegmentStore(str(tmp_path), "british")
+    assert len(store) == 2
+    (entry_a, y_a), (entry_b, y_b) = list(store)
+    assert (entry_a["name"], entry_a["words"], entry_a["label"]) == (
+        "000_hello",
+        ["hello"],
+        "british",
+    )
+    assert entry_b["label"] == "english"
+    assert y_a.dtype == np.float32
+    np.testing.assert_array_equal(y_a, first / np.float32(32768))
+    np.testing.assert_array_equal(store[1], second / np.float32(32768))
+
+
+def test_float_samples_are_scaled_like_soundfile(tmp_path):
+    y = np.array([-1.5, -1.0, 0.0, 0.5, 1.0], dtype=np.float32)
+    with SegmentWriter(str(tmp_path), "irish") as store:
+        store.append(y, "000_x", ["x"], source="clip")
+    stored = SegmentStore(str(tmp_path), "irish")[0]
+    np.testing.assert_array_equal(stored * 32768, [-32767, -32767, 0, 16383, 32767])
+
+
+def test_rerun_adds_nothing(tmp_path):
+    with SegmentWriter(str(tmp_path), "british") as store:
+        store.append(segment(100, 0), "000_a", ["a"], source="clip")
+
+    with SegmentWriter(str(tmp_path), "british") as store:
+        assert store.contains("clip", "000_a")
+        assert not store.contains("other", "000_a")
+        entry = store.append(segment(100, 5), "000_a", ["a"], source="clip")
+        assert entry["offset"] == 0
+        store.append(segment(50, 2), "000_a", ["a"], source="other")
+
+    store = SegmentStore(str(tmp_path), "british")
+    assert [(e["source"], e["offset"]) for e in store.entries] == [
+        ("clip", 0),
+        ("other", 100),
+    ]
+    np.testing.assert_array_equal(store[0] * 32768, segment(100, 0))
+    np.testing.assert_array_equal(store[1] * 32768, segment(50, 2))
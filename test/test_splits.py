@@ -0,0 +1,73 @@
+from splits import assign_split, content_key, load_client_ids, speaker_fraction
+
+
+def test_load_client_ids_from_common_voice_tsv(tmp_path):
+    tsv = tmp_path / "validated.tsv"
+    tsv.write_text(
+        "client_id\tpath\tsentence\n"
+        "speaker1\tclip_1.mp3\thello\n"
+        "speaker2\tclip_2.mp3\tworld\n",
+        encoding="utf-8",
+    )
+    assert load_client_ids(str(tsv)) == {
+        "clip_1.mp3": "speaker1",
+        "clip_2.mp3": "speaker2",
+    }
+
+
+def test_load_client_ids_from_pick_audio_tsv(tmp_path):
+    tsv = tmp_path / "british.tsv"
+    tsv.write_text(
+        "clip_1.mp3\thello\t2\tEngland English\tspeaker1\n"
+        "clip_2.mp3\tworld\t0\tEngland English\tspeaker2\n",
+        encoding="utf-8",
+    )
+    assert load_client_ids(str(tsv)) == {
+        "clip_1.mp3": "speaker1",
+        "clip_2.mp3": "speaker2",
+    }
+
+
+def test_load_client_ids_keys_absolute_paths_by_basename(tmp_path):
+    # pick_audio --materialize virtual writes absolute corpus paths
+    clips = tmp_path / "corpus" / "clips"
+    tsv = tmp_path / "british.tsv"
+    tsv.write_text(
+        f"{clips / 'clip_1.mp3'}\thello\t2\tEngland English\tspeaker1\n"
+        f"{clips / 'clip_2.mp3'}\tworld\t0\tEngland English\tspeaker2\n",
+        encoding="utf-8",
+    )
+    assert load_client_ids(str(tsv)) == {
+        "clip_1.mp3": "speaker1",
+        "clip_2.mp3": "speaker2",
+    }
+
+
+def test_assign_split_is_deterministic_and_follows_ratio():
+    speakers = [f"speaker{i}" for i in range(2000)]
+    splits = [assign_split(s, 0.2) for s in speakers]
+    assert splits == [assign_split(s, 0.2) for s in speakers]
+    assert 0.15 < splits.count("test") / len(speakers) < 0.25
+    # raising the ratio only moves speakers from train to test
+    for speaker, split in zip(speakers, splits):
+        if split == "test":
+            assert assign_split(speaker, 0.3) == "test"
+    assert all(0 <= speaker_fraction(s) < 1 for s in speakers)
+
+
+def test_content_key(tmp_path):
+    a, b = tmp_path / "a.mp3", tmp_path / "b.mp3"
+    a.write_bytes(b"same bytes")
+    b.write_bytes(b"same bytes")
+    assert content_key(str(a)) == content_key(str(b))
+    b.write_bytes(b"other bytes")
+    assert content_key(str(a)) != content_key(str(b))
+
+
+def test_content_key_covers_params(tmp_path):
+    clip = tmp_path / "a.mp3"
+    clip.write_bytes(b"same bytes")
+    params = {"sr": 16000, "steps": ["normalize"]}
+    assert content_key(str(clip), params) == content_key(str(clip), dict(params))
+    assert content_key(str(clip), params) != content_key(str(clip))
+    assert content_key(str(clip), params) != content_key(str(clip), {"sr": 22050})
@@ -0,0 +1,129 @@
+import functools
+import re
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from helper_scripts import tsv_scan
+from helper_scripts.tsv_scan import (
+    chunk_ranges,
+    client_hash,
+    iter_chunks,
+    read_columns,
+    scan_tsv,
+)
+
+CV10_HEADER = (
+    "client_id path sentence up_votes down_votes age gender accents locale segment"
+).split()
+CV21_HEADER = (
+    "client_id path sentence_id sentence sentence_domain up_votes down_votes age "
+    "gender accents variant locale segment"
+).split()
+
+CLIPS = [
+    # client_id, filename, transcript, up, down, accent
+    ("c1", "a.mp3", "hello there", 2, 0, "Filipino"),
+    ("c2", "b.mp3", "good morning", 3, 1, "England English"),
+    ("c1", "c.mp3", "see you", 0, 0, "Filipino"),
+    ("c3", "d.mp3", "thank you", 1, 4, "Polish,Slavic"),
+    ("c4", "e.mp3", "bye", 40000, 0, "Filipino"),
+]
+
+
+def write_tsv(path, header, clips=CLIPS, with_header=True):
+    lines = ["\t".join(header)] if with_header else []
+    for client_id, filename, transcript, up, down, accent in clips:
+        row = dict.fromkeys(header, "")
+        row.update(
+            client_id=client_id,
+            path=filename,
+            sentence=transcript,
+            up_votes=str(up),
+            down_votes=str(down),
+            accents=accent,
+        )
+        lines.append("\t".join(row[name] for name in header))
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return str(path)
+
+
+@pytest.mark.parametrize("header", [CV10_HEADER, CV21_HEADER], ids=["cv10", "cv21"])
+def test_columns_from_header(tmp_path, header):
+    tsv = write_tsv(tmp_path / "validated.tsv", header)
+    columns, start = read_columns(tsv)
+    assert columns["accent"] == header.index("accents")
+    assert columns["upvotes"] == header.index("up_votes")
+    assert columns["transcript"] == header.index("sentence")
+    assert start == len("\t".join(header)) + 1
+
+
+@pytest.mark.parametrize("header", [CV10_HEADER, CV21_HEADER], ids=["cv10", "cv21"])
+def test_scan_keeps_matching_rows_in_order(tmp_path, header):
+    tsv = write_tsv(tmp_path / "validated.tsv", header)
+    table = scan_tsv(
+        tsv,
+        fields=("client_id", "filename", "transcript", "client_hash"),
+        accent_patterns=[re.compile(r"^Filipino$")],
+    )
+    assert len(table) == 3
+    assert table.filename == ["a.mp3", "c.mp3", "e.mp3"]
+    assert table.transcript == ["hello there", "see you", "bye"]
+    assert table.client_hash.tolist() == [client_hash(c) for c in ["c1", "c1", "c4"]]
+    # votes are clamped to int16
+    assert table.score.tolist() == [2, 0, np.iinfo(np.int16).max]
+    assert {table.accent(i) for i in range(len(table))} == {"Filipino"}
+
+
+def test_scan_without_header_uses_cv21_layout(tmp_path):
+    tsv = write_tsv(tmp_path / "validated.tsv", CV21_HEADER, with_header=False)
+    table = scan_tsv(tsv)
+    assert table.filename == [clip[1] for clip in CLIPS]
+    assert table.score.tolist() == [2, 2, 0, -3, np.iinfo(np.int16).max]
+
+
+def test_accent_mask(tmp_path):
+    tsv = write_tsv(tmp_path / "validated.tsv", CV10_HEADER)
+    table = scan_tsv(tsv)
+    mask = table.accent_mask(re.compile(r"\bSlavic\b"))
+    assert mask.tolist() == [False, False, False, True, False]
+
+
+def test_unknown_field(tmp_path):
+    tsv = write_tsv(tmp_path / "validated.tsv", CV10_HEADER)
+    with pytest.raises(ValueError):
+        scan_tsv(tsv, fields=("sentence_id",))
+
+
+def test_chunk_ranges_end_on_lines(tmp_path):
+    tsv = write_tsv(tmp_path / "validated.tsv", CV21_HEADER, CLIPS * 20)
+    _, start = read_columns(tsv)
+    data = open(tsv, "rb").read()
+    ranges = chunk_ranges(tsv, start, chunk_bytes=100)
+    assert len(ranges) > 1
+    assert ranges[0][0] == start and ranges[-1][1] == len(data)
+    for (_, end), (begin, _) in zip(ranges, ranges[1:]):
+        assert end == begin
+        assert data[end - 1 : end] == b"\n"
+
+
+def test_parallel_chunks_match_single_scan(tmp_path, monkeypatch):
+    tsv = write_tsv(tmp_path / "validated.tsv", CV10_HEADER, CLIPS * 50)
+    patterns = [re.compile("Filipino")]
+    expected = scan_tsv(tsv, accent_patterns=patterns)
+
+    monkeypatch.setattr(tsv_scan, "MIN_PARALLEL_BYTES", 0)
+    monkeypatch.setattr(
+        tsv_scan, "chunk_ranges", functools.partial(chunk_ranges, chunk_bytes=200)
+    )
+    chunks = list(iter_chunks(tsv, accent_patterns=patterns, workers=2))
+    assert len(chunks) > 1
+    assert [f for chunk in chunks for f in chunk.filename] == expected.filename
+    assert [c for chunk in chunks for c in chunk.client_id] == expected.client_id
+    assert np.concatenate([chunk.score for chunk in chunks]).tolist() == (
+        expected.score.tolist()
+    )
+    assert scan_tsv(tsv, accent_patterns=patterns, workers=2).filename == (
+        expected.filename
+    )
@@ -5,8 +5,7 @@ from datasets import Dataset as HFDataset, Features, ClassLabel, Value
 from sklearn.model_selection import train_test_split
 import evaluate
 from transformers import (
-    ViTForImageClassification,
-    ViTImageProcessor,
+    AutoModelForImageClassification,
     TrainingArguments,  # type: ignore
     Trainer,  # type: ignore
 )
@@ -31,7 +30,36 @@ import shutil
 TSV_FILE = "data/cv-corpus-10.0-delta-2022-07-04/en/validated.tsv"
 CLIPS_FOLDER = "data/cv-corpus-10.0-delta-2022-07-04/en/clips"
 
+ACCENTS = [
+    "Australian English",
+    "Canadian English",
+    "England English",
+    "India and South Asia (India, Pakistan, Sri Lanka)",
+    "Irish English",
+    "Scottish English",
+    "United States English",
+    "Filipino",
+    "Slavic",  # Special case
+]
+
+ACCENT_LABEL_MAP = {
+    "Australian English": "australian",
+    "Canadian English": "canadian",
+    "England English": "england",
+    "India and South Asia (India, Pakistan, Sri Lanka)": "india",
+    "Irish English": "irish",
+    "Scottish English": "scottish",
+    "United States English": "american",
+    "Filipino": "filipino",
+    "Slavic": "slavic",
+}
+
 from audio_utils import convert_to_wav
+from export_model import OnnxAccentModel, load_processor
+from fast_audio import load as load_wav
+from instrumentation import enable, stage, print_summary
+from helper_scripts.tsv_scan import iter_chunks
+from helper_scripts.external_sort import ExternalSorter, score_key
 
 
 def preprocess_audio(audio_file):
@@ -39,53 +67,52 @@ def preprocess_audio(audio_file):
         convert_to_wav,
         normalize_audio,
         add_padding,
-        denoise_wav,
         trim_silence,
     )
-
-    normalize_audio(audio_file)
-    denoise_wav(audio_file)
-    trim_silence(audio_file)
+    from fast_audio import denoise_wav
+
+    with stage("normalize"):
+        normalize_audio(audio_file)
+    with stage("denoise"):
+        denoise_wav(audio_file)
+    with stage("trim"):
+        trim_silence(audio_file)
     return audio_file
 
 
-def filter_and_sort_tsv(accent, tsv_path=TSV_FILE, clips_path=CLIPS_FOLDER):
-    used_clients = set()
-    entries = []
+def filter_and_sort_tsv(
+    accent, tsv_path=TSV_FILE, clips_path=CLIPS_FOLDER, limit=None
+):
+    """
+    Writes the clips of `accent`, best score first, to a temp TSV. Candidates are
+    sorted out of memory before any audio is opened, with `limit` the merge stops
+    after that many clips passed the duration check.
+    """
+    written = 0
 
     print(accent)
-    with open(tsv_path, "r", encoding="utf-8") as f:
-        for line in f:
-            parts = line.strip().split("\t")
-            if parts[0] == "client_id":
-                continue
-
-            client_id, filename, transcript, entry_accent = (
-                parts[0],
-                parts[1],
-                parts[2],
-                parts[7],
-            )
-            upvotes = int(parts[3]) if parts[3].isdigit() else 0
-            downvotes = int(parts[4]) if parts[4].isdigit() else 0
-            score = upvotes - downvotes
-
-            if (
-                accent == "Slavic"
-            ):  # Special Case for slavic langagues, may delete later
-                regex = re.compile(
-                    r"\b(Slavic|Polish|Czech|Russian|Ukrainian|Bulgarian| \
+    if accent == "Slavic":  # Special Case for slavic langagues, may delete later
+        regex = re.compile(
+            r"\b(Slavic|Polish|Czech|Russian|Ukrainian|Bulgarian| \
                                 Croatian|Slovak|Slovenian|Serbian|Latvian|Lithuanian| \
                                 Hungarian|Romanian|Kazakh|Azerbaijani|Georgian|Moldovan)\b",
-                    re.IGNORECASE,
-                )
-            else:
-                regex = re.compile(rf"^{re.escape(accent)}$", re.IGNORECASE)
-
-            # if client_id in used_clients:
-            #     continue
-            if not regex.search(entry_accent):
-                continue
+            re.IGNORECASE,
+        )
+    else:
+        regex = re.compile(rf"^{re.escape(accent)}$", re.IGNORECASE)
+
+    # Columns come from the header, this corpus (cv-10) has a different layout
+    temp = tempfile.NamedTemporaryFile(
+        delete=False, mode="w", encoding="utf-8", suffix=".tsv"
+    )
+    with ExternalSorter() as sorter:
+        for chunk in iter_chunks(tsv_path, accent_patterns=[regex]):
+            for i, score in enumerate(chunk.score.tolist()):
+                sorter.add(score_key(score), chunk.filename[i], chunk.transcript[i])
+
+        for filename, transcript in sorter:
+            if limit is not None and written >= limit:
+                break
 
             audio_path = os.path.join(clips_path, filename)
             if not os.path.exists(audio_path):
@@ -93,16 +120,8 @@ def filter_and_sort_tsv(accent, tsv_path=TSV_FILE, clips_path=CLIPS_FOLDER):
             if sf.info(audio_path).duration < 5.0:
                 continue  # duration is in seconds, require at least 3 seconds
 
-            used_clients.add(client_id)
-            entries.append((score, filename, transcript))
-
-    entries.sort(key=lambda x: (x[0] != 0, -x[0]))
-
-    temp = tempfile.NamedTemporaryFile(
-        delete=False, mode="w", encoding="utf-8", suffix=".tsv"
-    )
-    for score, filename, transcript in entries:
-        temp.write(f"{filename}\t{transcript}\n")
+            temp.write(f"{filename}\t{transcript}\n")
+            written += 1
     temp.close()
     print(f"Filtered TSV saved to: {temp.name}")
     return temp.name
@@ -111,77 +130,117 @@ def filter_and_sort_tsv(accent, tsv_path=TSV_FILE, clips_path=CLIPS_FOLDER):
 def create_spectogram(audio_path):
     # Convert to wav in a temp file
     with tempfile.NamedTemporaryFile(delete=True, suffix=".wav") as wav_temp:
-        convert_to_wav(audio_path, wav_temp.name)
+        with stage("ffmpeg"):
+            convert_to_wav(audio_path, wav_temp.name)
         wav_temp.name = preprocess_audio(wav_temp.name)
-        y, sr = librosa.load(wav_temp.name, sr=16000)
+        with stage("load"):
+            y, sr = load_wav(wav_temp.name, sr=16000)
 
         if len(y) < 512:
             print("warning: short audio")
 
+        return waveform_to_image(y, sr)
+
+
+def waveform_to_image(y, sr):
+    with stage("melspectrogram"):
         mel = librosa.feature.melspectrogram(
             y=y, sr=sr, n_mels=128, n_fft=512, hop_length=128
         )
         mel_db = librosa.power_to_db(mel, ref=np.max)
+    with stage("render"):
+        return mel_to_image(mel_db, sr)
+
+
+def mel_to_image(mel_db, sr):
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".png") as img_temp:
+        fig, ax = plt.subplots()
+        librosa.display.specshow(mel_db, sr=sr, ax=ax)
+        ax.axis("off")
+        plt.savefig(img_temp.name, bbox_inches="tight", pad_inches=0)
+        plt.close(fig)
+
+        img = Image.open(img_temp.name).convert("RGB").resize((244, 244))
+        img = (np.array(img).astype(np.float32) / 255.0 * 255).astype(np.uint8)
+    os.remove(img_temp.name)
+    return Image.fromarray(img).resize((224, 224)).convert("RGB")
+
+
+def load_model(path):
+    """
+    Loads a checkpoint directory, a dynamic int8 model saved by export_model
+    (model_int8.pt) or an ONNX graph (model.onnx / model_int8.onnx).
+    """
+    if path.endswith(".onnx"):
+        return OnnxAccentModel(path)
+    if path.endswith(".pt"):
+        model = torch.load(path, weights_only=False)
+    else:
+        model = AutoModelForImageClassification.from_pretrained(path)
+    model.eval()
+    return model
 
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".png") as img_temp:
-            fig, ax = plt.subplots()
-            librosa.display.specshow(mel_db, sr=sr, ax=ax)
-            ax.axis("off")
-            plt.savefig(img_temp.name, bbox_inches="tight", pad_inches=0)
-            plt.close(fig)
 
-            img = Image.open(img_temp.name).convert("RGB").resize((244, 244))
-            img = (np.array(img).astype(np.float32) / 255.0 * 255).astype(np.uint8)
-            return Image.fromarray(img).resize((224, 224)).convert("RGB")
+def predict_logits(model, processor, images):
+    # Inference on a list of images in a single forward pass
+    with stage("predict", items=len(images)):
+        inputs = processor(images=images, return_tensors="pt")
+        with torch.no_grad():
+            return model(**inputs).logits
 
 
 def predict(model, processor, image):
-    # Inference
-    inputs = processor(images=image, return_tensors="pt")
-    with torch.no_grad():
-        logits = model(**inputs).logits
-
+    logits = predict_logits(model, processor, [image])
     probs = torch.nn.functional.softmax(logits, dim=-1)
     pred = int(torch.argmax(probs, dim=-1).item())
     return model.config.id2label[pred]
 
 
+def predict_batch(model, processor, images):
+    logits = predict_logits(model, processor, images)
+    preds = torch.argmax(logits, dim=-1).tolist()
+    return [model.config.id2label[int(p)] for p in preds]
+
+
 import shutil
 
 # Add this near the top
 MISCLASSIFIED_DIR = "misclassified_audios"
-os.makedirs(MISCLASSIFIED_DIR, exist_ok=True)
 
 if __name__ == "__main__":
-    # Load model
-    model = ViTForImageClassification.from_pretrained(
-        "./yapa_comparission/checkpoint-900"
+    import argparse
+
+    from tta import TTA_CONFIGS, predict_tta
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--model",
+        type=str,
+        default="./yapa_comparission/checkpoint-900",
+        help="Checkpoint directory, model_int8.pt or .onnx file from export_model",
+    )
+    parser.add_argument(
+        "--limit",
+        type=int,
+        default=None,
+        help="Test at most this many clips per accent (best scored first)",
     )
-    processor = ViTImageProcessor.from_pretrained("google/vit-base-patch16-224-in21k")
-
-    ACCENTS = [
-        "Australian English",
-        "Canadian English",
-        "England English",
-        "India and South Asia (India, Pakistan, Sri Lanka)",
-        "Irish English",
-        "Scottish English",
-        "United States English",
-        "Filipino",
-        "Slavic",  # Special case
-    ]
-
-    ACCENT_LABEL_MAP = {
-        "Australian English": "australian",
-        "Canadian English": "canadian",
-        "England English": "england",
-        "India and South Asia (India, Pakistan, Sri Lanka)": "india",
-        "Irish English": "irish",
-        "Scottish English": "scottish",
-        "United States English": "american",
-        "Filipino": "filipino",
-        "Slavic": "slavic",
-    }
+    parser.add_argument(
+        "--tta",
+        type=str,
+        choices=list(TTA_CONFIGS),
+        default=None,
+        help="Average the logits of a TTA configuration from tta.py, e.g. crops3",
+    )
+    args = parser.parse_args()
+    enable()
+
+    os.makedirs(MISCLASSIFIED_DIR, exist_ok=True)
+
+    # Load model
+    model = load_model(args.model)
+    processor = load_processor(args.model)
+
     total_hits = 0
     total_predictions = 0
 
@@ -190,7 +249,7 @@ if __name__ == "__main__":
     for accent in ACCENTS:
         hits = 0
         predictions = 0
-        temp_tsv = filter_and_sort_tsv(accent)
+        temp_tsv = filter_and_sort_tsv(accent, limit=args.limit)
         with open(temp_tsv, "r", encoding="utf-8") as f:
             for line in f:
                 parts = line.strip().split("\t")
@@ -199,7 +258,11 @@ if __name__ == "__main__":
                 filename = parts[0]
                 audio_path = os.path.join(CLIPS_FOLDER, filename)
                 image = create_spectogram(audio_path)
-                prediction = predict(model, processor, image).strip().lower()
+                if args.tta:
+                    prediction = predict_tta(model, processor, image, args.tta)
+                else:
+                    prediction = predict(model, processor, image)
+                prediction = prediction.strip().lower()
                 real_label = ACCENT_LABEL_MAP[accent].strip().lower()
 
                 if real_label == prediction:
@@ -232,3 +295,4 @@ if __name__ == "__main__":
     else:
         print(f"Total accuracy of the model: {total_hits/total_predictions}")
         print(f"Total predictions: {total_predictions}")
+    print_summary()
@@ -1,8 +1,10 @@
-import requests
 import os
 from pydub import AudioSegment
 import time
 
+from aligners import GentleAligner, get_aligner
+from instrumentation import enable, stage, print_summary
+from segment_store import SegmentWriter
 
 TEMP_WAV_DIR = "temp_wavs"
 GENTLE_URL = "http://localhost:8765/transcriptions?async=false"
@@ -10,11 +12,7 @@ MIN_WORD_DURATION = 0.2  # seconds
 
 
 def align(audio_path, transcript):
-    with open(audio_path, "rb") as audio_file:
-        files = {"audio": audio_file}
-        data = {"transcript": transcript}
-        response = requests.post(GENTLE_URL, files=files, data=data)
-        return response.json()
+    return GentleAligner(GENTLE_URL).align(audio_path, transcript)
 
 
 def denoise_results(path):
@@ -76,18 +74,44 @@ def merge_short_words(words):
     return merged
 
 
-def cut_audio_segments(audio_path, segments, output_dir):
+def denoise_samples(samples, sr=16000):
+    import noisereduce as nr
+    import numpy as np
+
+    audio = np.asarray(samples, dtype=np.float32) / 32768
+    return nr.reduce_noise(y=audio, sr=sr, stationary=True, prop_decrease=0.4)
+
+
+def cut_audio_segments(audio_path, segments, output_dir, store=None, denoise=False):
+    """
+    Writes the segments as WAVs into output_dir, or with `store` (a SegmentWriter)
+    appends them to the segment store, named after output_dir, denoised in memory
+    when `denoise` is set.
+    """
     audio = AudioSegment.from_wav(audio_path)
     total_duration = len(audio) / 1000.0
 
     if total_duration < 1.5:
         return False  # Signal to skip folder creation
 
-    os.makedirs(output_dir, exist_ok=True)
+    if store is None:
+        os.makedirs(output_dir, exist_ok=True)
 
     current_clip = AudioSegment.empty()
     current_words = []
     clip_index = 0
+    written = []
+
+    def emit(clip, words, index):
+        name = f"{index:03d}_{'_'.join(words)}"
+        if store is None:
+            clip.export(os.path.join(output_dir, name + ".wav"), format="wav")
+        elif not store.contains(os.path.basename(output_dir), name):
+            samples = clip.get_array_of_samples()
+            if denoise:
+                samples = denoise_samples(samples, clip.frame_rate)
+            store.append(samples, name, words, os.path.basename(output_dir))
+        written.append(name)
 
     for seg in segments[:-1]:  # Skip the last word
         start_ms = int(seg["start"] * 1000)
@@ -97,8 +121,7 @@ def cut_audio_segments(audio_path, segments, output_dir):
         current_words.append(seg["word"])
 
         if 1.5 <= current_clip.duration_seconds <= 3.0:
-            filename = f"{clip_index:03d}_{'_'.join(current_words)}.wav"
-            current_clip.export(os.path.join(output_dir, filename), format="wav")
+            emit(current_clip, current_words, clip_index)
             current_clip = AudioSegment.empty()
             current_words = []
             clip_index += 1
@@ -106,20 +129,19 @@ def cut_audio_segments(audio_path, segments, output_dir):
         elif current_clip.duration_seconds > 3.0:
             # Force split if it gets too long
             if current_clip.duration_seconds >= 1.5:
-                filename = f"{clip_index:03d}_{'_'.join(current_words)}.wav"
-                current_clip.export(os.path.join(output_dir, filename), format="wav")
+                emit(current_clip, current_words, clip_index)
                 clip_index += 1
             current_clip = AudioSegment.empty()
             current_words = []
 
     # Final clip check (if any left and long enough)
     if current_clip.duration_seconds >= 1.5:
-        filename = f"{clip_index:03d}_{'_'.join(current_words)}.wav"
-        current_clip.export(os.path.join(output_dir, filename), format="wav")
+        emit(current_clip, current_words, clip_index)
 
     # If no valid clips created, remove dir and skip
-    if not os.listdir(output_dir):
-        os.rmdir(output_dir)
+    if not written:
+        if store is None:
+            os.rmdir(output_dir)
         print(f"⚠️ Skipping {audio_path}, no valid segments")
         return False
 
@@ -133,14 +155,55 @@ from audio_utils import *
 
 # Your helper function
 def preprocess_audio(path, output_path):
-    convert_to_wav(path, output_path)
+    with stage("ffmpeg"):
+        convert_to_wav(path, output_path)
     # denoise_wav(output_path)
-    normalize_audio(output_path)
-    add_padding(output_path)
+    with stage("normalize"):
+        normalize_audio(output_path)
+    with stage("padding"):
+        add_padding(output_path)
     return output_path
 
 
-def splice_audio_files(INPUT_DIR=None, TRANSCRIPT_FILE=None, OUTPUT_DIR=None):
+def align_clips(aligner, batch):
+    """
+    Aligns a batch of (mp3_file, wav_path, transcript, output_subdir) in one call. If
+    the batch fails, the clips are aligned one by one and only the clips that fail on
+    their own get None.
+    """
+    try:
+        with stage("align", items=len(batch)):
+            return aligner.align_batch([(w, t) for _, w, t, _ in batch])
+    except Exception as e:
+        print(f"⚠️ Failed to align batch starting at {batch[0][0]}: {e}, retrying")
+
+    results = []
+    for mp3_file, wav_path, transcript, _ in batch:
+        try:
+            with stage("align"):
+                results.append(aligner.align_batch([(wav_path, transcript)])[0])
+        except Exception as e:
+            print(f"❌ Failed to align {mp3_file}: {e}\n")
+            results.append(None)
+    return results
+
+
+def splice_audio_files(
+    INPUT_DIR=None,
+    TRANSCRIPT_FILE=None,
+    OUTPUT_DIR=None,
+    SEGMENT_STORE=None,
+    ALIGNER="gentle",
+    ALIGN_BATCH=8,
+):
+    """
+    ALIGNER is an aligner from aligners.py or its name ("gentle", "energy", "ctc"),
+    clips are aligned ALIGN_BATCH at a time.
+
+    Without SEGMENT_STORE every clip gets a folder of segment WAVs in OUTPUT_DIR. With
+    SEGMENT_STORE (a directory) the segments are appended to its segment store for the
+    accent, named after OUTPUT_DIR, and no WAVs are written.
+    """
     if INPUT_DIR is None:
         raise ValueError("INPUT_DIR must be specified")
     if TRANSCRIPT_FILE is None:
@@ -153,54 +216,88 @@ def splice_audio_files(INPUT_DIR=None, TRANSCRIPT_FILE=None, OUTPUT_DIR=None):
     with open(TRANSCRIPT_FILE, "r", encoding="utf-8") as f:
         for line in f:
             if "\t" in line:
-                filename, transcript = line.strip().split("\t", 1)
+                # pick_audio TSVs carry score, accent and client_id after the transcript
+                filename, transcript = line.rstrip("\n").split("\t")[:2]
                 transcripts[filename] = transcript
 
     os.makedirs(TEMP_WAV_DIR, exist_ok=True)
+    store = None
+    if SEGMENT_STORE is not None:
+        accent = os.path.basename(os.path.normpath(OUTPUT_DIR))
+        store = SegmentWriter(SEGMENT_STORE, accent)
 
-    for mp3_file in sorted(transcripts):
+    try:
+        if isinstance(ALIGNER, str):
+            ALIGNER = get_aligner(ALIGNER)
+        files = sorted(transcripts)
 
-        transcript = transcripts[mp3_file]
-        mp3_path = os.path.join(INPUT_DIR, mp3_file)
+        for batch_start in range(0, len(files), ALIGN_BATCH):
+            batch = []
+            for mp3_file in files[batch_start : batch_start + ALIGN_BATCH]:
 
-        if not os.path.exists(mp3_path):
+                transcript = transcripts[mp3_file]
+                mp3_path = os.path.join(INPUT_DIR, mp3_file)
 
-            print(f"⚠️ File not found: {mp3_file}")
-            continue
+                if not os.path.exists(mp3_path):
 
-        base = os.path.splitext(mp3_file)[0]
-        wav_path = os.path.join(TEMP_WAV_DIR, base + ".wav")
-        output_subdir = os.path.join(OUTPUT_DIR, base)
+                    print(f"⚠️ File not found: {mp3_file}")
+                    continue
 
-        try:
-            preprocess_audio(mp3_path, wav_path)
+                # mp3_file may be an absolute path (pick_audio --materialize virtual)
+                base = os.path.splitext(os.path.basename(mp3_file))[0]
+                wav_path = os.path.join(TEMP_WAV_DIR, base + ".wav")
+                output_subdir = os.path.join(OUTPUT_DIR, base)
 
-            result = align(wav_path, transcript)
+                try:
+                    preprocess_audio(mp3_path, wav_path)
+                    batch.append((mp3_file, wav_path, transcript, output_subdir))
+                except Exception as e:
+                    print(f"❌ Failed to process {mp3_file}: {e}\n")
 
-            segments = merge_short_words(result["words"])
-            success = cut_audio_segments(wav_path, segments, output_subdir)
-            if not success:
-                print(f"⚠️ No valid segments for {mp3_file}, skipping.")
+            if not batch:
                 continue
-            denoise_results(output_subdir)
-            print(
-                f"✅ Processed {mp3_file} successfully. Segments saved to {output_subdir}"
-            )
-            # deno
-            counter += 1
+            results = align_clips(ALIGNER, batch)
 
-        except Exception as e:
-            print(f"❌ Failed to process {mp3_file}: {e}\n")
+            for (mp3_file, wav_path, _, output_subdir), result in zip(batch, results):
+                if result is None:
+                    continue
+                try:
+                    segments = merge_short_words(result["words"])
+                    with stage("cut_segments"):
+                        success = cut_audio_segments(
+                            wav_path, segments, output_subdir, store, denoise=True
+                        )
+                    if not success:
+                        print(f"⚠️ No valid segments for {mp3_file}, skipping.")
+                        continue
+                    if store is None:
+                        with stage("denoise") as s:
+                            s.items = len(os.listdir(output_subdir))
+                            denoise_results(output_subdir)
+                    destination = output_subdir if store is None else store.pcm_path
+                    print(
+                        f"✅ Processed {mp3_file} successfully. "
+                        f"Segments saved to {destination}"
+                    )
+                    # deno
+                    counter += 1
 
-        print(f"\n🕒 Done. Total time: {time.time() - start:.2f} seconds")
+                except Exception as e:
+                    print(f"❌ Failed to process {mp3_file}: {e}\n")
+    finally:
+        if store is not None:
+            store.close()
+    print(f"\n🕒 Done. Processed {counter} files in {time.time() - start:.2f} seconds")
 
     if os.path.exists(TEMP_WAV_DIR):
         subprocess.run(["rm", "-rf", TEMP_WAV_DIR])
         print(f"🗑️ Temporary directory {TEMP_WAV_DIR} deleted.")
     else:
         print(f"⚠️ Temporary directory {TEMP_WAV_DIR} does not exist.")
+    print_summary()
 
 
 if __name__ == "__main__":
+    enable()
     splice_audio_files()
     # delete tempwavs dir
@@ -0,0 +1,212 @@
+"""
+Training throughput benchmark for Machine.
+
+Runs N optimizer steps and splits every step into data loading (time spent waiting for
+the next batch), forward, backward and optimizer time, then reports samples/sec. Use it
+to tune batch size, dataloader workers, thread counts and precision on the training boxes
+before starting a full run.
+
+    python train_benchmark.py --synthetic --model deit-tiny --steps 30 --batch_size 32
+    python train_benchmark.py --csv spectrogram_dataset.csv --workers 4 --profile_dir prof
+
+--synthetic uses random tensors, so it measures the model alone; without it the real
+spectrogram dataset and Trainer dataloader from Machine are used. --profile_dir exports a
+torch.profiler trace that can be opened in TensorBoard.
+"""
+
+import contextlib
+import time
+
+import numpy as np
+import torch
+from torch.profiler import ProfilerActivity, profile, record_function, schedule
+from torch.profiler import tensorboard_trace_handler
+
+PHASES = ["data", "forward", "backward", "optimizer"]
+
+
+def synthetic_dataloader(batch_size, num_labels, image_size=224, num_batches=8):
+    """A small pool of random batches that is cycled, so data loading costs ~nothing."""
+    return [
+        {
+            "pixel_values": torch.randn(batch_size, 3, image_size, image_size),
+            "labels": torch.randint(0, num_labels, (batch_size,)),
+        }
+        for _ in range(num_batches)
+    ]
+
+
+def _forever(dataloader):
+    while True:
+        for batch in dataloader:
+            yield batch
+
+
+def benchmark_training(
+    model,
+    dataloader,
+    steps=30,
+    warmup=3,
+    learning_rate=2e-4,
+    optimizer=None,
+    autocast_dtype=None,
+    profile_dir=None,
+):
+    """
+    Returns a dict with samples/sec and the mean time per step of each phase.
+    The first `warmup` steps are run but not measured.
+    """
+    model.train()
+    if optimizer is None:
+        optimizer = torch.optim.AdamW(model.parameters(), lr=learning_rate)
+    batches = _forever(dataloader)
+
+    timings = {phase: [] for phase in PHASES}
+    samples = 0
+
+    profiler = contextlib.nullcontext()
+    if profile_dir is not None:
+        profiler = profile(
+            activities=[ProfilerActivity.CPU],
+            schedule=schedule(wait=1, warmup=1, active=min(5, steps), repeat=1),
+            on_trace_ready=tensorboard_trace_handler(profile_dir),
+            record_shapes=True,
+            profile_memory=True,
+        )
+
+    amp = contextlib.nullcontext()
+    if autocast_dtype is not None:
+        amp = torch.autocast("cpu", dtype=autocast_dtype)
+
+    with profiler as prof:
+        for step in range(warmup + steps):
+            measured = step >= warmup
+
+            t0 = time.perf_counter()
+            with record_function("data"):
+                batch = next(batches)
+            t1 = time.perf_counter()
+
+            with record_function("forward"), amp:
+                loss = model(
+                    pixel_values=batch["pixel_values"], labels=batch["labels"]
+                ).loss
+            t2 = time.perf_counter()
+
+            with record_function("backward"):
+                loss.backward()
+            t3 = time.perf_counter()
+
+            with record_function("optimizer"):
+                optimizer.step()
+                optimizer.zero_grad(set_to_none=True)
+            t4 = time.perf_counter()
+
+            if measured:
+                timings["data"].append(t1 - t0)
+                timings["forward"].append(t2 - t1)
+                timings["backward"].append(t3 - t2)
+                timings["optimizer"].append(t4 - t3)
+                samples += len(batch["labels"])
+            if prof is not None:
+                prof.step()
+
+    step_times = np.sum([timings[p] for p in PHASES], axis=0)
+    total = float(step_times.sum())
+    report = {
+        "steps": steps,
+        "samples_per_s": samples / total if total else 0.0,
+        "step_ms": float(step_times.mean() * 1000),
+        "step_p95_ms": float(np.percentile(step_times, 95) * 1000),
+        "data_stall_pct": float(np.sum(timings["data"]) / total * 100),
+    }
+    for phase in PHASES:
+        report[f"{phase}_ms"] = float(np.mean(timings[phase]) * 1000)
+    return report
+
+
+def print_report(report):
+    print(f"\n🏋️ Training benchmark ({report['steps']} steps)")
+    print(f"  Samples/sec:     {report['samples_per_s']:.2f}")
+    print(f"  Step time:       {report['step_ms']:.1f} ms (p95 {report['step_p95_ms']:.1f} ms)")
+    print(f"  Data-load stall: {report['data_stall_pct']:.1f}%")
+    for phase in PHASES:
+        share = report[f"{phase}_ms"] / report["step_ms"] * 100
+        print(f"  - {phase:<10} {report[f'{phase}_ms']:9.1f} ms  {share:5.1f}%")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", type=str, default="vit-base")
+    parser.add_argument("--steps", type=int, default=30)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--batch_size", type=int, default=64)
+    parser.add_argument(
+        "--synthetic",
+        action="store_true",
+        help="Use random tensors instead of the spectrogram dataset",
+    )
+    parser.add_argument("--num_labels", type=int, default=9)
+    parser.add_argument("--image_size", type=int, default=224)
+    parser.add_argument("--csv", type=str, default="spectrogram_dataset.csv")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        help="Dataloader worker processes (real data only)",
+    )
+    parser.add_argument(
+        "--bf16",
+        action="store_true",
+        help="bf16 autocast (real data: same as Machine(cpu_optimized=True))",
+    )
+    parser.add_argument("--threads", type=int, default=None, help="Intra-op threads")
+    parser.add_argument(
+        "--profile_dir",
+        type=str,
+        default=None,
+        help="Export a torch.profiler trace to this folder",
+    )
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    if args.synthetic:
+        from transformers import AutoModelForImageClassification
+
+        from machine import resolve_model_name
+
+        model = AutoModelForImageClassification.from_pretrained(
+            resolve_model_name(args.model),
+            num_labels=args.num_labels,
+            ignore_mismatched_sizes=True,
+        )
+        dataloader = synthetic_dataloader(
+            args.batch_size, args.num_labels, args.image_size
+        )
+        report = benchmark_training(
+            model,
+            dataloader,
+            steps=args.steps,
+            warmup=args.warmup,
+            autocast_dtype=torch.bfloat16 if args.bf16 else None,
+            profile_dir=args.profile_dir,
+        )
+    else:
+        from machine import Machine
+
+        machine = Machine(
+            csv_path=args.csv,
+            batch_size=args.batch_size,
+            model_name=args.model,
+            dataloader_num_workers=args.workers,
+            bf16=args.bf16,
+        )
+        report = machine.benchmark(
+            steps=args.steps, warmup=args.warmup, profile_dir=args.profile_dir
+        )
+
+    print_report(report)
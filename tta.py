@@ -0,0 +1,208 @@
+"""
+Test-time augmentation (TTA) for the accent classifier.
+
+Each clip is decoded once, its mel spectrogram is computed once and rendered to one
+spectrogram image (create_spectogram). Every TTA variant is then made in memory from that
+image: a time crop (a range of columns stretched back to full width), a time mask or a
+frequency mask (bands filled with the colour of the lowest dB level, i.e. silence). All
+variants of all clips in a batch go through the model in one forward pass, and the logits
+of a clip's variants are averaged.
+
+    python tta.py --model ./results/checkpoint-900 --limit 500
+
+The report compares accuracy and per-clip latency of every configuration in TTA_CONFIGS,
+on the test split of spectrogram_dataset.csv. test_model.py uses a configuration with
+--tta.
+"""
+
+import time
+
+import matplotlib
+import numpy as np
+import pandas as pd
+import torch
+from PIL import Image
+
+from test_model import predict_logits
+
+IMAGE_SIZE = (224, 224)
+# specshow draws mel_db (all values <= 0) with the "magma" colormap, scaled to the
+# clip's dB range, so the quietest level is the colormap's first colour
+SILENCE_RGB = np.round(
+    np.array(matplotlib.colormaps["magma"](0.0)[:3]) * 255
+).astype(np.uint8)
+
+
+def crop(start, width):
+    """Columns [start, start + width) as fractions of the image width."""
+
+    def transform(img):
+        w = img.shape[1]
+        lo = int(round(start * w))
+        hi = max(lo + 1, int(round((start + width) * w)))
+        return img[:, lo:hi]
+
+    return transform
+
+
+def time_mask(start, width):
+    def transform(img):
+        w = img.shape[1]
+        out = img.copy()
+        cols = slice(int(start * w), int((start + width) * w))
+        out[:, cols] = SILENCE_RGB
+        return out
+
+    return transform
+
+
+def freq_mask(start, width):
+    def transform(img):
+        h = img.shape[0]
+        out = img.copy()
+        rows = slice(int(start * h), int((start + width) * h))
+        out[rows] = SILENCE_RGB
+        return out
+
+    return transform
+
+
+def identity(img):
+    return img
+
+
+TTA_CONFIGS = {
+    "none": [identity],
+    "crops3": [identity, crop(0.0, 0.8), crop(0.2, 0.8)],
+    "crops5": [
+        identity,
+        crop(0.0, 0.7),
+        crop(0.15, 0.7),
+        crop(0.3, 0.7),
+        crop(0.1, 0.8),
+    ],
+    "masks3": [identity, time_mask(0.3, 0.15), freq_mask(0.6, 0.1)],
+    "crops3_masks2": [
+        identity,
+        crop(0.0, 0.8),
+        crop(0.2, 0.8),
+        time_mask(0.3, 0.15),
+        freq_mask(0.6, 0.1),
+    ],
+}
+
+
+def tta_variants(image, config):
+    """PIL images of every variant of one spectrogram image."""
+    img = np.asarray(image.convert("RGB"))
+    return [
+        Image.fromarray(np.ascontiguousarray(t(img))).resize(IMAGE_SIZE)
+        for t in TTA_CONFIGS[config]
+    ]
+
+
+def tta_logits(model, processor, images, config="crops3"):
+    """Averaged logits of every image's variants, one forward pass for the batch."""
+    n_variants = len(TTA_CONFIGS[config])
+    variants = [v for image in images for v in tta_variants(image, config)]
+    logits = predict_logits(model, processor, variants)
+    return logits.reshape(len(images), n_variants, -1).mean(dim=1)
+
+
+def predict_tta(model, processor, image, config="crops3"):
+    logits = tta_logits(model, processor, [image], config)
+    return model.config.id2label[int(torch.argmax(logits, dim=-1).item())]
+
+
+def tta_report(model, processor, csv_path, configs=None, batch_size=8, limit=None):
+    """
+    Accuracy and latency per clip of every TTA configuration on the test split. The
+    images are loaded once and shared by all configurations, so only the TTA work
+    itself (variants and forward pass) is timed.
+    """
+    configs = configs or list(TTA_CONFIGS)
+    df = pd.read_csv(csv_path)
+    df = df[df["split"] == "test"]
+    if limit is not None:
+        df = df.sample(n=min(limit, len(df)), random_state=0)
+    images = [Image.open(p).convert("RGB") for p in df["image_path"]]
+    labels = df["label"].str.lower().tolist()
+    label2id = {name.lower(): int(i) for name, i in model.config.label2id.items()}
+    targets = torch.tensor([label2id.get(label, -1) for label in labels])
+
+    rows = []
+    for config in configs:
+        preds = []
+        start = time.perf_counter()
+        for i in range(0, len(images), batch_size):
+            logits = tta_logits(model, processor, images[i : i + batch_size], config)
+            preds.append(logits.argmax(dim=-1))
+        elapsed = time.perf_counter() - start
+        preds = torch.cat(preds) if preds else torch.empty(0, dtype=torch.long)
+        rows.append(
+            {
+                "config": config,
+                "variants": len(TTA_CONFIGS[config]),
+                "accuracy": (
+                    (preds == targets).float().mean().item()
+                    if len(images)
+                    else float("nan")
+                ),
+                "ms_per_clip": elapsed * 1000 / max(len(images), 1),
+            }
+        )
+        print(
+            f"🔁 {config:<14} accuracy {rows[-1]['accuracy']:.4f}, "
+            f"{rows[-1]['ms_per_clip']:.1f} ms/clip"
+        )
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from test_model import load_model, load_processor
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--model",
+        type=str,
+        default="./yapa_comparission/checkpoint-900",
+        help="Checkpoint directory, model_int8.pt or .onnx file from export_model",
+    )
+    parser.add_argument(
+        "--csv",
+        type=str,
+        default="spectrogram_dataset.csv",
+        help="Dataset CSV, the test split is used",
+    )
+    parser.add_argument(
+        "--configs",
+        nargs="+",
+        choices=list(TTA_CONFIGS),
+        default=None,
+        help="TTA configurations to compare (all by default)",
+    )
+    parser.add_argument("--batch_size", type=int, default=8, help="Clips per pass")
+    parser.add_argument(
+        "--limit",
+        type=int,
+        default=None,
+        help="Evaluate on a random subset of this many test images",
+    )
+    parser.add_argument(
+        "--out",
+        type=str,
+        default="tta_report.csv",
+        help="Where to save the report",
+    )
+    args = parser.parse_args()
+
+    model = load_model(args.model)
+    processor = load_processor(args.model)
+    report = tta_report(
+        model, processor, args.csv, args.configs, args.batch_size, args.limit
+    )
+    print(report.to_string(index=False))
+    report.to_csv(args.out, index=False)
+    print(f"✅ Report saved to {args.out}")